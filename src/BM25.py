@@ -1,22 +1,55 @@
 import os
-try:
-    from pyserini.search.lucene import LuceneSearcher
-except Exception:
-    os.environ["JAVA_HOME"] = "C:/Program Files/Java/jdk-11/"
-    from pyserini.search.lucene import LuceneSearcher
 
 """
     This module implements the BM25 algorithm for ranking documents.
 """
 
+def index_path(language, engine = "lucene"):
+    """
+        Return the path of the index of the language for the given engine.
+    """
+    if engine == "numpy":
+        return f"../indexes/{language}_numpy.npz"
+    return f"../indexes/{language}_index"
+
+
 class BM25:
 
-    def __init__(self, language):
+    def __init__(self, language, fields = None, engine = "lucene"):
+        """
+            Initialize the searcher for the given language.
+
+            fields is an optional dictionary with the weight of each indexed field, e.g. 
+            {"ingredients": 2.0, "contents": 1.0}, used by default when searching.
+
+            engine is either "lucene" for pyserini's LuceneSearcher or "numpy" for the in-memory
+            NumPy engine (see numpy_bm25.py), which does not need a JVM.
+        """
 
         self.language = language
-        
+        self.fields = fields
+        self.engine = engine
+
+        if engine == "numpy":
+            if fields:
+                raise ValueError("The numpy engine only indexes the contents, so fields can not be used.")
+            from numpy_bm25 import NumpyBM25
+            self.searcher = NumpyBM25(language)
+            self.index_path = self.searcher.path
+            return
+        elif engine != "lucene":
+            raise ValueError(f"Unknown engine {engine}. Choose between 'lucene' and 'numpy'.")
+
+        # pyserini is only imported when needed, as it starts a JVM
+        try:
+            from pyserini.search.lucene import LuceneSearcher
+        except Exception:
+            os.environ["JAVA_HOME"] = "C:/Program Files/Java/jdk-11/"
+            from pyserini.search.lucene import LuceneSearcher
+
         # initialize the BM25 searcher
-        self.searcher = LuceneSearcher(f'../indexes/{language}_index')
+        self.index_path = index_path(language)
+        self.searcher = LuceneSearcher(self.index_path)
 
         # specify the iso language code
         if language == "english": ISO_lan_code = "en"
@@ -27,14 +60,41 @@ class BM25:
         self.searcher.set_language(ISO_lan_code)
 
 
-    def search(self, query, k=10):
+    def search(self, query, k=10, fields = None):
         """
             Search the query in the index and return the top k results.
+
+            If fields is given (or set for the searcher), the query is scored against the weighted 
+            fields instead of the contents only, e.g. fields={"ingredients": 1.0} only searches the 
+            ingredient lists of the schema.org recipes.
         """
 
-        hits = self.searcher.search(query, k=k)
+        fields = fields if fields is not None else self.fields
+        if fields:
+            hits = self.searcher.search(query, k=k, fields=fields)
+        else:
+            hits = self.searcher.search(query, k=k)
         return hits
 
+    def batch_search(self, queries, qids, k=10, threads=4, fields = None):
+        """
+            Search several queries at once with a pool of threads and return the top k results of each query.
+
+            Returns a dictionary with the hits keyed by the query ids in qids.
+        """
+        fields = fields if fields is not None else self.fields
+        if fields:
+            return self.searcher.batch_search(queries, qids, k=k, threads=threads, fields=fields)
+        return self.searcher.batch_search(queries, qids, k=k, threads=threads)
+
+    def close(self):
+        """
+            Release the searcher. The numpy engine keeps its arrays in memory until the searcher is deleted.
+        """
+        if self.engine == "lucene":
+            self.searcher.close()
+        self.searcher = None
+
 
 
 
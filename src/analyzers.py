@@ -0,0 +1,320 @@
+"""
+Pure Python versions of the Lucene analyzers pyserini uses for our languages.
+
+    english: lowercasing, possessive removal, English stop words and the Porter stemmer
+    danish:  lowercasing, Danish stop words and the Snowball Danish stemmer
+    czech:   lowercasing, Czech stop words and the light Czech stemmer of Lucene
+    chinese: bigrams of adjacent Han characters (CJKAnalyzer)
+
+They are used by the NumPy BM25 engine, so queries are analyzed the same way as the
+documents in the Lucene indexes without starting a JVM.
+"""
+
+import re
+import unicodedata
+
+ENGLISH_STOP_WORDS = set("""a an and are as at be but by for if in into is it no not of on or such that the their then
+there these they this to was will with""".split())
+
+DANISH_STOP_WORDS = set("""og i jeg det at en den til er som på de med han af for ikke der var mig sig men et har om vi
+min havde ham hun nu over da fra du ud sin dem os op man hans hvor eller hvad skal selv her alle vil blev kunne ind når
+være dog noget ville jo deres efter ned skulle denne end dette mit også under have dig anden hende mine alt meget sit sine
+vor mod disse hvis din nogle hos blive mange ad bliver hendes været thi jer sådan""".split())
+
+CZECH_STOP_WORDS = set("""a s k o i u v z dnes cz tímto budeš budem byli jseš můj svým ta tomto tohle tuto tyto jej zda
+proč máte tato kam tohoto kdo kteří mi nám tom tomuto mít nic proto kterou byla toho protože asi ho naši napište re což
+tím takže svých její svými jste aj tu tedy teto bylo kde ke pravé ji nad nejsou či pod téma mezi přes ty pak vám ani
+když však neg jsem tento článku články aby jsme před pta jejich byl ještě až bez také pouze první vaše která nás nový
+tipy pokud může strana jeho své jiné zprávy nové není vás jen podle zde už být více bude již než který by které co nebo
+ten tak má při od po jsou jak další ale si se ve to jako za zpět ze do pro je na atd atp jakmile přičemž já on ona ono
+oni ony my vy jí mě mne jemu tomu těm těmu němu němuž jehož jíž jelikož jež jakož načež""".split())
+
+HAN = "㐀-䶿一-鿿豈-﫿"
+WORD_PATTERN = re.compile(rf"[^\W_{HAN}]+(?:['’.][^\W_{HAN}]+)*")
+HAN_PATTERN = re.compile(rf"[{HAN}]+")
+
+
+def tokenize(text):
+    """
+    Splits the text into lowercased words, leaving out Han characters.
+    """
+    return WORD_PATTERN.findall(unicodedata.normalize("NFKC", text).lower())
+
+
+# ------------------------------------------------------------------ english
+
+class PorterStemmer:
+    """
+    The original Porter stemming algorithm, as implemented by Lucene's PorterStemFilter.
+    """
+
+    def cons(self, word, i):
+        if word[i] in "aeiou":
+            return False
+        if word[i] == "y":
+            return i == 0 or not self.cons(word, i - 1)
+        return True
+
+    def m(self, stem):
+        """
+        Counts the vowel-consonant sequences in the stem.
+        """
+        n = 0
+        i = 0
+        length = len(stem)
+        while i < length and self.cons(stem, i):
+            i += 1
+        while i < length:
+            while i < length and not self.cons(stem, i):
+                i += 1
+            if i >= length:
+                break
+            n += 1
+            while i < length and self.cons(stem, i):
+                i += 1
+        return n
+
+    def vowel_in_stem(self, stem):
+        return any(not self.cons(stem, i) for i in range(len(stem)))
+
+    def double_c(self, word):
+        return len(word) >= 2 and word[-1] == word[-2] and self.cons(word, len(word) - 1)
+
+    def cvc(self, word):
+        if len(word) < 3:
+            return False
+        if not self.cons(word, len(word) - 3) or self.cons(word, len(word) - 2) or not self.cons(word, len(word) - 1):
+            return False
+        return word[-1] not in "wxy"
+
+    def replace(self, word, suffix, replacement, condition):
+        """
+        Replaces the suffix if the condition holds for the stem. Returns None if the suffix does not match.
+        """
+        if not word.endswith(suffix):
+            return None
+        stem = word[:len(word) - len(suffix)]
+        return stem + replacement if condition(stem) else word
+
+    def step1ab(self, word):
+        if word.endswith("s"):
+            if word.endswith("sses"):
+                word = word[:-2]
+            elif word.endswith("ies"):
+                word = word[:-2]
+            elif not word.endswith("ss"):
+                word = word[:-1]
+        if word.endswith("eed"):
+            if self.m(word[:-3]) > 0:
+                word = word[:-1]
+        elif (word.endswith("ed") and self.vowel_in_stem(word[:-2])) or (word.endswith("ing") and self.vowel_in_stem(word[:-3])):
+            word = word[:-2] if word.endswith("ed") else word[:-3]
+            if word.endswith(("at", "bl", "iz")):
+                word += "e"
+            elif self.double_c(word) and word[-1] not in "lsz":
+                word = word[:-1]
+            elif self.m(word) == 1 and self.cvc(word):
+                word += "e"
+        return word
+
+    def step1c(self, word):
+        if word.endswith("y") and self.vowel_in_stem(word[:-1]):
+            return word[:-1] + "i"
+        return word
+
+    def apply_rules(self, word, rules, condition):
+        for suffix, replacement in rules:
+            result = self.replace(word, suffix, replacement, condition)
+            if result is not None:
+                return result
+        return word
+
+    step2_rules = [("ational", "ate"), ("tional", "tion"), ("enci", "ence"), ("anci", "ance"), ("izer", "ize"), ("bli", "ble"),
+                   ("alli", "al"), ("entli", "ent"), ("eli", "e"), ("ousli", "ous"), ("ization", "ize"), ("ation", "ate"),
+                   ("ator", "ate"), ("alism", "al"), ("iveness", "ive"), ("fulness", "ful"), ("ousness", "ous"), ("aliti", "al"),
+                   ("iviti", "ive"), ("biliti", "ble"), ("logi", "log")]
+    step3_rules = [("icate", "ic"), ("ative", ""), ("alize", "al"), ("iciti", "ic"), ("ical", "ic"), ("ful", ""), ("ness", "")]
+    step4_suffixes = ["al", "ance", "ence", "er", "ic", "able", "ible", "ant", "ement", "ment", "ent", "ion", "ou", "ism",
+                      "ate", "iti", "ous", "ive", "ize"]
+
+    def step2(self, word):
+        # the longest matching suffix is used, so the rules are tried from longest to shortest
+        rules = sorted(self.step2_rules, key=lambda rule: -len(rule[0]))
+        return self.apply_rules(word, rules, lambda stem: self.m(stem) > 0)
+
+    def step3(self, word):
+        rules = sorted(self.step3_rules, key=lambda rule: -len(rule[0]))
+        return self.apply_rules(word, rules, lambda stem: self.m(stem) > 0)
+
+    def step4(self, word):
+        for suffix in sorted(self.step4_suffixes, key=lambda suffix: -len(suffix)):
+            if word.endswith(suffix):
+                stem = word[:len(word) - len(suffix)]
+                if suffix == "ion" and not stem.endswith(("s", "t")):
+                    return word
+                return stem if self.m(stem) > 1 else word
+        return word
+
+    def step5(self, word):
+        if word.endswith("e"):
+            stem = word[:-1]
+            if self.m(stem) > 1 or (self.m(stem) == 1 and not self.cvc(stem)):
+                word = stem
+        if word.endswith("ll") and self.m(word) > 1:
+            word = word[:-1]
+        return word
+
+    def stem(self, word):
+        if len(word) <= 2:
+            return word
+        word = self.step1ab(word)
+        word = self.step1c(word)
+        word = self.step2(word)
+        word = self.step3(word)
+        word = self.step4(word)
+        word = self.step5(word)
+        return word
+
+
+# ------------------------------------------------------------------ danish
+
+DANISH_VOWELS = "aeiouyæåø"
+DANISH_S_ENDINGS = "abcdfghjklmnoprtvyzå"
+DANISH_MAIN_SUFFIXES = sorted("""hed ethed ered e erede ende erende ene erne ere en heden eren er heder erer heds es endes erendes
+enes ernes eres ens hedens erens ers ets erets et eret""".split(), key=len, reverse=True)
+
+
+def danish_stem(word):
+    """
+    The Snowball Danish stemmer, as used by Lucene's DanishAnalyzer.
+    """
+    # find the start of the region R1 - after the first non-vowel following a vowel, but at least 3 letters in
+    p1 = len(word)
+    for i in range(1, len(word)):
+        if word[i] not in DANISH_VOWELS and word[i - 1] in DANISH_VOWELS:
+            p1 = max(i + 1, 3)
+            break
+
+    # main suffix
+    for suffix in DANISH_MAIN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= p1:
+            word = word[:-len(suffix)]
+            break
+    else:
+        if word.endswith("s") and len(word) - 1 >= p1 and len(word) >= 2 and word[-2] in DANISH_S_ENDINGS:
+            word = word[:-1]
+
+    def consonant_pair(word):
+        if len(word) - 2 >= p1 and word.endswith(("gd", "dt", "gt", "kt")):
+            return word[:-1]
+        return word
+
+    word = consonant_pair(word)
+
+    # other suffixes
+    if word.endswith("igst"):
+        word = word[:-2]
+    for suffix in ["elig", "lig", "els", "ig", "løst"]:
+        if word.endswith(suffix) and len(word) - len(suffix) >= p1:
+            if suffix == "løst":
+                word = word[:-1]
+            else:
+                word = consonant_pair(word[:-len(suffix)])
+            break
+
+    # undouble
+    if len(word) - 1 >= p1 and len(word) >= 2 and word[-1] not in DANISH_VOWELS and word[-1] == word[-2]:
+        word = word[:-1]
+
+    return word
+
+
+# ------------------------------------------------------------------ czech
+
+def czech_stem(word):
+    """
+    The light Czech stemmer of Lucene's CzechAnalyzer.
+    """
+    length = len(word)
+
+    # remove case endings
+    if length > 7 and word.endswith("atech"):
+        word = word[:-5]
+    elif length > 6 and word.endswith(("ětem", "etem", "atům")):
+        word = word[:-4]
+    elif length > 5 and word.endswith(("ech", "ich", "ích", "ého", "ěmi", "emi", "ému", "ěte", "ete", "ěti", "eti", "ího",
+                                       "iho", "ími", "ímu", "imu", "ách", "ata", "aty", "ých", "ama", "ami", "ové", "ovi", "ými")):
+        word = word[:-3]
+    elif length > 4 and word.endswith(("em", "es", "ém", "ím", "ům", "at", "ám", "os", "us", "ým", "mi", "ou")):
+        word = word[:-2]
+    elif length > 3 and word[-1] in "aeiouůyáéíýě":
+        word = word[:-1]
+
+    # remove possessives
+    if len(word) > 5 and word.endswith(("ov", "in", "ův")):
+        word = word[:-2]
+
+    # normalize
+    if len(word) == 0:
+        return word
+    if word.endswith("čt"):
+        return word[:-2] + "ck"
+    if word.endswith("št"):
+        return word[:-2] + "sk"
+    if word[-1] in "cč":
+        return word[:-1] + "k"
+    if word[-1] in "zž":
+        return word[:-1] + "h"
+    if len(word) > 1 and word[-2] == "e":
+        return word[:-2] + word[-1]
+    if len(word) > 2 and word[-2] == "ů":
+        return word[:-2] + "o" + word[-1]
+    return word
+
+
+# ------------------------------------------------------------------ analyzers
+
+porter = PorterStemmer()
+
+def analyze_english(text):
+    terms = []
+    for word in tokenize(text):
+        if word.endswith(("'s", "’s")):
+            word = word[:-2]
+        if word not in ENGLISH_STOP_WORDS:
+            terms.append(porter.stem(word))
+    return terms
+
+def analyze_danish(text):
+    return [danish_stem(word) for word in tokenize(text) if word not in DANISH_STOP_WORDS]
+
+def analyze_czech(text):
+    return [czech_stem(word) for word in tokenize(text) if word not in CZECH_STOP_WORDS]
+
+def analyze_chinese(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+
+    # other words are kept as they are
+    terms = [word for word in tokenize(text) if word not in ENGLISH_STOP_WORDS]
+
+    # bigrams of adjacent Han characters, single characters are kept as unigrams
+    for run in HAN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms += [run[i:i + 2] for i in range(len(run) - 1)]
+
+    return terms
+
+ANALYZERS = {
+    "english": analyze_english,
+    "danish": analyze_danish,
+    "czech": analyze_czech,
+    "chinese": analyze_chinese,
+}
+
+def analyze(text, language):
+    """
+    Analyzes the text the way the Lucene index of the given language does.
+    """
+    return ANALYZERS[language](text)
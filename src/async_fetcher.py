@@ -0,0 +1,150 @@
+"""
+This module implements a concurrent, rate-limited fetcher used by the async mode of the RecipeFetcher.
+
+Requests are throttled per host with a token bucket, the total number of requests in flight
+is bounded and failed requests are retried with exponential backoff. All requests go through
+one requests.Session, so connections to the same host are pooled and kept alive.
+
+A fetcher can be shared by several runs of asyncio.run. The asyncio locks and semaphores are bound to the
+event loop they are first used in, so they are created per event loop, while the tokens of the hosts are
+kept between runs.
+"""
+
+import asyncio
+import random
+import time
+import weakref
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def loop_local(primitives, create):
+    """
+    Returns the primitive of the running event loop from primitives, a WeakKeyDictionary keyed by event loop.
+    It is created with create() the first time it is needed in the loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in primitives:
+        primitives[loop] = create()
+    return primitives[loop]
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity = 1):
+        """
+            Allow on average rate requests per second with bursts of up to capacity requests.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.locks = weakref.WeakKeyDictionary() # one lock per event loop
+
+    async def acquire(self):
+        """
+            Wait until a token is available and take it.
+        """
+        async with loop_local(self.locks, asyncio.Lock):
+            while True:
+                # refill the bucket
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncFetcher:
+
+    # status codes worth retrying
+    retry_status = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_concurrency = 8, rate_per_host = 0.5, burst = 1, timeout = 20, retries = 3, backoff = 2.0, headers = None):
+        """
+            Initialize the fetcher.
+
+            Parameters
+            ---------
+            max_concurrency:
+                The maximum number of requests in flight
+            rate_per_host:
+                The average number of requests per second sent to a single host
+            burst:
+                The number of requests a host may receive at once before being throttled
+            timeout:
+                The timeout of a single request in seconds
+            retries:
+                The number of times a failed request is retried
+            backoff:
+                The base of the exponential backoff between retries in seconds
+        """
+        self.max_concurrency = max_concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # pooled keep-alive connections shared by all requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers is not None:
+            self.session.headers.update(headers)
+
+        self.buckets = {}
+        self.semaphores = weakref.WeakKeyDictionary() # one semaphore per event loop
+
+        # varible for keeping track of requests
+        self.num_requests = 0
+
+    def bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return self.buckets[host]
+
+    async def get(self, url, headers = None):
+        """
+            Fetch the given url, retrying with exponential backoff on errors.
+        """
+        # the semaphore has to be created inside the running event loop
+        semaphore = loop_local(self.semaphores, lambda: asyncio.Semaphore(self.max_concurrency))
+
+        for attempt in range(self.retries + 1):
+            await self.bucket(url).acquire()
+
+            try:
+                async with semaphore:
+                    response = await asyncio.to_thread(self.session.get, url, headers=headers, timeout=self.timeout)
+                    self.num_requests += 1
+
+                if response.status_code not in self.retry_status or attempt == self.retries:
+                    return response
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+
+            # wait before retrying
+            await asyncio.sleep(self.backoff ** attempt + random.uniform(0, 1))
+
+    async def get_all(self, urls, headers = None):
+        """
+            Fetch all urls concurrently. Failed requests are returned as exceptions.
+            
+            headers is either one dictionary of headers used for all urls or a list with the headers of each url.
+        """
+        if not isinstance(headers, list):
+            headers = [headers] * len(urls)
+        return await asyncio.gather(*[self.get(url, headers=url_headers) for url, url_headers in zip(urls, headers)], return_exceptions=True)
+
+    def close(self):
+        self.session.close()
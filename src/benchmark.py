@@ -0,0 +1,281 @@
+"""
+End-to-end latency and throughput benchmark of the retrieval pipeline.
+
+The test queries are replayed through CrossLanguageRetriever.search for every translation approach, once for
+every single language and once for all languages together. Every scenario runs in a fresh process, so that:
+
+    cold: the time to load the retriever (JVM, indexes, translation model) and the latency of the first query
+    warm: the latency of every query after a warm-up pass, at each level of concurrency
+
+are measured like in a real start-up, and the peak RSS is the one of the scenario alone. The latency is split
+by stage (translate, search, merge), with the stage times summed over the languages of the query. The result
+cache and the translation cache are disabled, unless --cache is given, so warm queries are really translated
+and searched.
+
+The report is written as JSON and can be compared with a stored baseline, e.g.
+
+    python benchmark.py --approaches dictionary hf --concurrency 1 4 --output ../benchmarks/latest.json
+    python benchmark.py --baseline ../benchmarks/baseline.json
+
+Scenarios which are slower, have a lower throughput or use more memory than the baseline by more than the
+tolerance are reported as regressions and the command exits with status 1.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+LANGUAGES = ["english", "czech", "chinese", "danish"]
+APPROACHES = ["dictionary", "hf", "translatepy"]
+PERCENTILES = [50, 95, 99]
+STAGES = ["translate", "search", "merge"]
+
+# the metrics compared with the baseline, and whether higher values are better
+BASELINE_METRICS = {
+    "p50": False,
+    "p95": False,
+    "p99": False,
+    "qps": True,
+    "peak_rss_mb": False,
+    "init_seconds": False,
+}
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process in MB.
+    """
+    try:
+        import resource
+    except ImportError:
+        # resource is not available on Windows
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / 2 ** 20
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def summarize(values):
+    """
+    Returns the percentiles, mean and max of the values in milliseconds.
+    """
+    if len(values) == 0:
+        return {}
+    values = np.asarray(values) * 1000
+    summary = {f"p{percentile}": float(value) for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    summary["mean"] = float(values.mean())
+    summary["max"] = float(values.max())
+    return summary
+
+
+def replay(retriever, queries, k, concurrency):
+    """
+    Searches all queries with the given number of concurrent clients.
+    Returns the latency and the stage times of every query and the total time.
+    """
+    def timed_search(query):
+        t0 = time.perf_counter()
+        _, _, info = retriever.search(query, k=k, return_info=True)
+        return time.perf_counter() - t0, info["stages"]
+
+    t0 = time.perf_counter()
+    if concurrency == 1:
+        measurements = [timed_search(query) for query in queries]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            measurements = list(executor.map(timed_search, queries))
+    total = time.perf_counter() - t0
+
+    latencies = [latency for latency, _ in measurements]
+    stages = {
+        "translate": [sum(stages["translate"].values()) for _, stages in measurements],
+        "search": [sum(stages["search"].values()) for _, stages in measurements],
+        "merge": [stages["merge"] for _, stages in measurements],
+    }
+    return latencies, stages, total
+
+def run_scenario(approach, languages, queries, k = 10, concurrency = [1], repeat = 1, engine = "lucene", cache = False,
+                 parallel = False):
+    """
+    Runs one scenario in the current process and returns its measurements. It is meant to run in a fresh process.
+    """
+    # import here, so the parent process does not load anything
+    from cross_language_retriever import CrossLanguageRetriever
+
+    # cold start
+    t0 = time.perf_counter()
+    retriever = CrossLanguageRetriever(languages, translation_approach=approach, engine=engine, result_cache=cache,
+                                       translation_cache=cache, parallel=parallel, verbose=False)
+    init_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    retriever.search(queries[0], k=k)
+    first_query_seconds = time.perf_counter() - t0
+
+    # warm up with all queries
+    replay(retriever, queries, k, 1)
+
+    warm = {}
+    for level in concurrency:
+        latencies = []
+        stages = {stage: [] for stage in STAGES}
+        total = 0
+        for _ in range(repeat):
+            run_latencies, run_stages, run_total = replay(retriever, queries, k, level)
+            latencies += run_latencies
+            for stage in STAGES:
+                stages[stage] += run_stages[stage]
+            total += run_total
+
+        warm[str(level)] = {
+            "queries": len(latencies),
+            "seconds": total,
+            "qps": len(latencies) / total if total > 0 else 0.0,
+            "latency_ms": summarize(latencies),
+            "stages_ms": {stage: summarize(values) for stage, values in stages.items()},
+        }
+
+    retriever.close()
+
+    return {
+        "approach": approach,
+        "languages": languages,
+        "cold": {"init_seconds": init_seconds, "first_query_seconds": first_query_seconds},
+        "warm": warm,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def scenario_key(scenario):
+    return f"{scenario['approach']}/{'+'.join(scenario['languages'])}"
+
+def benchmark(queries, approaches = APPROACHES, languages = LANGUAGES, per_language = True, k = 10, concurrency = [1],
+              repeat = 1, engine = "lucene", cache = False, parallel = False, verbose = True):
+    """
+    Runs the scenarios of every approach, each in its own process, and returns the report.
+    """
+    language_sets = [languages] + ([[language] for language in languages] if per_language and len(languages) > 1 else [])
+
+    scenarios = []
+    for approach in approaches:
+        for scenario_languages in language_sets:
+            if verbose:
+                print(f"Benchmarking {approach} on {', '.join(scenario_languages)}...")
+
+            # one fresh process per scenario, so every scenario starts cold
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                scenario = executor.submit(run_scenario, approach, scenario_languages, queries, k, concurrency, repeat,
+                                           engine, cache, parallel).result()
+            scenarios.append(scenario)
+
+            if verbose:
+                print_scenario(scenario)
+
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {"num_queries": len(queries), "k": k, "concurrency": concurrency, "repeat": repeat, "engine": engine,
+                   "cache": cache, "translation_cache": cache, "parallel": parallel},
+        "scenarios": scenarios,
+    }
+
+def print_scenario(scenario):
+    print(f"  cold start: {scenario['cold']['init_seconds']:.2f} s, first query {1000 * scenario['cold']['first_query_seconds']:.1f} ms, "
+          f"peak RSS {scenario['peak_rss_mb']:.0f} MB")
+    for level, warm in scenario["warm"].items():
+        latency = warm["latency_ms"]
+        stages = ", ".join(f"{stage} {warm['stages_ms'][stage].get('p50', 0):.1f}" for stage in STAGES)
+        print(f"  concurrency {level}: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+              f"{warm['qps']:.1f} QPS (p50 by stage: {stages} ms)")
+
+
+def flatten(report):
+    """
+    Returns the metrics compared with the baseline, keyed by scenario and concurrency.
+    """
+    metrics = {}
+    for scenario in report["scenarios"]:
+        for level, warm in scenario["warm"].items():
+            metrics[f"{scenario_key(scenario)}@{level}"] = {
+                "p50": warm["latency_ms"]["p50"],
+                "p95": warm["latency_ms"]["p95"],
+                "p99": warm["latency_ms"]["p99"],
+                "qps": warm["qps"],
+                "peak_rss_mb": scenario["peak_rss_mb"],
+                "init_seconds": scenario["cold"]["init_seconds"],
+            }
+    return metrics
+
+def compare(report, baseline, tolerance = 0.2):
+    """
+    Compares the report with the baseline. Returns the list of regressions, a metric is a regression
+    if it is worse than the baseline by more than the tolerance (a fraction of the baseline value).
+    """
+    current = flatten(report)
+    previous = flatten(baseline)
+
+    regressions = []
+    for key in sorted(set(current) & set(previous)):
+        for metric, higher_is_better in BASELINE_METRICS.items():
+            value, baseline_value = current[key][metric], previous[key][metric]
+            if baseline_value <= 0:
+                continue
+            change = (value - baseline_value) / baseline_value
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append({"scenario": key, "metric": metric, "baseline": baseline_value, "value": value,
+                                    "change": change})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the latency and throughput of the cross language retriever")
+    parser.add_argument("--approaches", nargs="+", default=APPROACHES, choices=APPROACHES)
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, choices=LANGUAGES)
+    parser.add_argument("--no-per-language", action="store_true", help="Only benchmark all languages together.")
+    parser.add_argument("--queries", type=str, default="../test_queries.txt")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4], help="The numbers of concurrent clients.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of times the queries are replayed.")
+    parser.add_argument("--engine", type=str, default="lucene", choices=["lucene", "numpy"])
+    parser.add_argument("--parallel", action="store_true", help="Search the languages of a query in parallel.")
+    parser.add_argument("--cache", action="store_true", help="Enable the result cache and the translation cache.")
+    parser.add_argument("--output", type=str, default="../benchmarks/latest.json")
+    parser.add_argument("--baseline", type=str, default=None, help="A stored report to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    queries = [line.strip() for line in open(args.queries, "r").readlines() if line.strip() != ""]
+
+    report = benchmark(queries, approaches=args.approaches, languages=args.languages, per_language=not args.no_per_language,
+                       k=args.k, concurrency=args.concurrency, repeat=args.repeat, engine=args.engine, cache=args.cache,
+                       parallel=args.parallel)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=4)
+    print(f"Wrote the report to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, tolerance=args.tolerance)
+
+        if len(regressions) == 0:
+            print(f"No regressions compared to {args.baseline}")
+        else:
+            print(f"{len(regressions)} regressions compared to {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression['scenario']} {regression['metric']}: {regression['baseline']:.2f} -> "
+                      f"{regression['value']:.2f} ({100 * regression['change']:+.0f}%)")
+            sys.exit(1)
@@ -0,0 +1,206 @@
+"""
+Non-interactive, resumable crawl of recipes for a list of queries in several languages.
+
+Every planned and completed fetch is appended to a journal (one JSON object per line), so
+a crawl that dies halfway restarts where it stopped. Each recipe page is journaled as soon as
+it is fetched and is on disk. A query which was planned but not done is resumed: its saved search
+result page and the journaled pages are used from disk, and only the other pages are downloaded.
+Missing translations do not block the crawl, they are collected into a report instead. Each
+language is crawled by its own worker. In async mode, all languages share one AsyncFetcher,
+so the rate limit of a host holds for the whole crawl.
+
+Example (from the root of the repository):
+    python src/bulk_crawl.py --queries test_queries.txt --languages danish czech chinese
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_fetcher import AsyncFetcher
+from recipe_fetcher import RecipeFetcher, MissingTranslation
+
+
+class CrawlJournal:
+
+    def __init__(self, path = "crawl_journal.jsonl"):
+        """
+            Open the append-only journal at the given path and read the entries written by earlier runs.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.entries = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    # skip a line which was cut off by a crash
+                    try:
+                        self.entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+
+    def write(self, event, **fields):
+        entry = {"event": event, "time": time.time(), **fields}
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.entries.append(entry)
+
+    def completed(self):
+        """
+            Return the (query, language) pairs which have been crawled completely.
+        """
+        return {(entry["query"], entry["language"]) for entry in self.entries if entry["event"] == "done"}
+
+    def interrupted(self):
+        """
+            Return the keys of the pages fetched so far of every (query, language) pair which was planned but not done.
+        """
+        completed = self.completed()
+        pages = {}
+        for entry in self.entries:
+            key = (entry.get("query"), entry.get("language"))
+            if key in completed:
+                continue
+            if entry["event"] == "planned":
+                pages.setdefault(key, set())
+            elif entry["event"] == "page" and entry["downloaded"] and entry.get("error") is None:
+                pages.setdefault(key, set()).add(entry["key"])
+        return pages
+
+
+def create_fetcher(language, journal, fetcher_options = None, async_fetcher = None):
+    """
+        Create the fetcher of the language, which journals every recipe page as soon as it is fetched.
+        A MissingTranslation error is journaled and raised again.
+    """
+    def on_page(ingredients, key, entry):
+        journal.write("page", query=" ".join(ingredients), language=language, key=key, link=entry["link"],
+                      downloaded=entry["downloaded"], error=entry.get("error"))
+
+    try:
+        return RecipeFetcher(language=language, interactive=False, async_fetcher=async_fetcher, on_page=on_page, **(fetcher_options or {}))
+    except MissingTranslation as e:
+        journal.write("missing_translation", language=language, word=e.word)
+        raise
+
+def queries_to_crawl(fetcher, language, queries, journal, missing):
+    """
+        Yield the queries of the language which are not crawled yet and have all their translations, with the
+        keys of the pages fetched by an interrupted crawl of the query (None if the query was not started).
+    """
+    completed = journal.completed()
+    interrupted = journal.interrupted()
+    for query in queries:
+        if (query, language) in completed:
+            continue
+
+        # check the translations before fetching anything
+        missing_words = fetcher.missing_translations(query.split())
+        if len(missing_words) > 0:
+            for word in missing_words:
+                journal.write("missing_translation", query=query, language=language, word=word)
+            missing.update(missing_words)
+            continue
+
+        journal.write("planned", query=query, language=language)
+        yield query, interrupted.get((query, language))
+
+def crawl_language(language, queries, journal, fetcher_options = None):
+    """
+        Crawl the given queries in one language and return the missing translations.
+    """
+    missing = set()
+
+    try:
+        fetcher = create_fetcher(language, journal, fetcher_options)
+    except MissingTranslation as e:
+        return {e.word or "<language not in translations.json>"}
+
+    for query, fetched_pages in queries_to_crawl(fetcher, language, queries, journal, missing):
+        try:
+            metadata = fetcher.fetch_recipe_links(*query.split(), fetched_pages=fetched_pages)
+        except Exception as e:
+            journal.write("failed", query=query, language=language, error=repr(e))
+            continue
+        journal.write("done", query=query, language=language, num_recipes=len(metadata))
+
+    return missing
+
+async def crawl_language_async(language, queries, journal, async_fetcher, fetcher_options = None):
+    """
+        Crawl the given queries in one language with the shared async fetcher and return the missing translations.
+    """
+    missing = set()
+
+    try:
+        fetcher = create_fetcher(language, journal, fetcher_options, async_fetcher)
+    except MissingTranslation as e:
+        return {e.word or "<language not in translations.json>"}
+
+    for query, fetched_pages in queries_to_crawl(fetcher, language, queries, journal, missing):
+        try:
+            metadata = await fetcher.fetch_recipe_links_async(*query.split(), fetched_pages=fetched_pages)
+        except Exception as e:
+            journal.write("failed", query=query, language=language, error=repr(e))
+            continue
+        journal.write("done", query=query, language=language, num_recipes=len(metadata))
+
+    return missing
+
+
+def bulk_crawl(queries, languages, journal_path = "crawl_journal.jsonl", report_path = "crawl_missing_translations.json", use_async = False,
+               fetcher_options = None, async_options = None):
+    """
+        Crawl all queries in all languages with one worker per language.
+        Returns the missing translations by language, which are also written to report_path.
+
+        In async mode the languages are crawled in one event loop with one AsyncFetcher, created with async_options.
+    """
+    journal = CrawlJournal(journal_path)
+
+    # crawl the languages in parallel
+    if use_async:
+        async def crawl_all():
+            async_fetcher = AsyncFetcher(**(async_options or {}))
+            try:
+                return await asyncio.gather(*[crawl_language_async(language, queries, journal, async_fetcher, fetcher_options)
+                                              for language in languages])
+            finally:
+                async_fetcher.close()
+
+        missing = {language: sorted(words) for language, words in zip(languages, asyncio.run(crawl_all()))}
+    else:
+        with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+            futures = {language: executor.submit(crawl_language, language, queries, journal, fetcher_options) for language in languages}
+            missing = {language: sorted(future.result()) for language, future in futures.items()}
+
+    # write the report of missing translations
+    missing = {language: words for language, words in missing.items() if len(words) > 0}
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(missing, file, indent=4, sort_keys=True, ensure_ascii=False)
+
+    if len(missing) > 0:
+        print(f"Missing translations written to {report_path}. Add them to translations.json and rerun to crawl the skipped queries.")
+
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable bulk crawl of recipes")
+    parser.add_argument("--queries", type=str, default="test_queries.txt", help="File with one query (ingredients separated by spaces) per line.")
+    parser.add_argument("--languages", type=str, nargs="+", default=["english", "czech", "chinese", "danish"])
+    parser.add_argument("--journal", type=str, default="crawl_journal.jsonl")
+    parser.add_argument("--report", type=str, default="crawl_missing_translations.json")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Download the recipe pages of a query concurrently.")
+    parser.add_argument("--refresh-after", type=float, default=None, help="Revalidate recipe pages older than this many seconds.")
+    args = parser.parse_args()
+
+    queries = [line.strip() for line in open(args.queries, 'r').readlines() if line.strip() != ""]
+    bulk_crawl(queries, args.languages, journal_path=args.journal, report_path=args.report, use_async=args.use_async, 
+               fetcher_options={"refresh_after": args.refresh_after})
@@ -0,0 +1,213 @@
+"""
+A compact, memory-mapped translation dictionary used by the dictionary approach of the Translator.
+
+translations.json and the compiled dictionary of vocabulary_compiler.py are merged into one binary file,
+../translations.bin, with a section per language. A section holds the sorted terms and their translations
+as two UTF-8 blobs with offset arrays, so a term is found with a binary search directly in the mapped
+file. Loading the file only reads a small JSON header, whatever the size of the dictionary.
+
+    b"CLRDICT1" | header length (uint32) | JSON header | per language:
+        term offsets (uint32[n + 1]) | translation offsets (uint32[n + 1]) | terms | translations
+
+Queries are translated with a greedy longest match over their tokens, so multi-word ingredients such as
+"soy sauce" are translated as one phrase. Hyphens are treated as spaces, so "soy-sauce" matches as well.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"CLRDICT1"
+FORMAT_VERSION = 1
+
+
+def normalize_term(term):
+    return " ".join(term.lower().replace("-", " ").split())
+
+def source_signature(paths):
+    """
+    Returns the modification times of the source files, used to find out if the binary file is outdated.
+    """
+    return {path: os.path.getmtime(path) if os.path.exists(path) else None for path in paths if path is not None}
+
+def load_entries(manual_path = "../translations.json", compiled_path = "../translations_compiled.json", min_confidence = 0.5):
+    """
+    Returns the translations of every language, with the entries of translations.json taking precedence.
+    """
+    entries = {}
+
+    if compiled_path is not None and os.path.exists(compiled_path):
+        with open(compiled_path, 'r', encoding='utf-8') as file:
+            compiled = json.load(file)
+        for language, language_entries in compiled["languages"].items():
+            # a language without entries still gets a section, so it is supported
+            language_dictionary = entries.setdefault(language, {})
+            for term, entry in language_entries.items():
+                if entry["confidence"] >= min_confidence:
+                    language_dictionary[normalize_term(term)] = entry["translation"]
+
+    with open(manual_path, 'r', encoding='utf-8') as file:
+        manual = json.load(file)
+    for language, language_entries in manual.items():
+        language_dictionary = entries.setdefault(language, {})
+        for term, translation in language_entries.items():
+            language_dictionary[normalize_term(term)] = translation
+
+    return entries
+
+
+def compile_dictionary(output_path = "../translations.bin", manual_path = "../translations.json",
+                       compiled_path = "../translations_compiled.json", min_confidence = 0.5):
+    """
+    Writes the binary dictionary of translations.json and the compiled dictionary to output_path.
+    """
+    entries = load_entries(manual_path, compiled_path, min_confidence)
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "min_confidence": min_confidence,
+        "sources": source_signature([manual_path, compiled_path]),
+        "languages": {},
+    }
+
+    # build the sections
+    sections = []
+    offset = 0
+    for language in sorted(entries):
+        items = sorted((term.encode("utf-8"), translation.encode("utf-8")) for term, translation in entries[language].items())
+        terms = [term for term, _ in items]
+        translations = [translation for _, translation in items]
+
+        term_offsets = np.zeros(len(items) + 1, dtype="<u4")
+        term_offsets[1:] = np.cumsum([len(term) for term in terms])
+        translation_offsets = np.zeros(len(items) + 1, dtype="<u4")
+        translation_offsets[1:] = np.cumsum([len(translation) for translation in translations])
+
+        section = term_offsets.tobytes() + translation_offsets.tobytes() + b"".join(terms) + b"".join(translations)
+        section += b"\0" * (-len(section) % 8)
+        header["languages"][language] = {
+            "offset": offset,
+            "count": len(items),
+            "max_phrase_length": max([len(term.split()) for term in terms], default=1),
+        }
+        sections.append(section)
+        offset += len(section)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % 8)
+
+    # write to a temporary file first, so readers never see a half written dictionary
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for section in sections:
+            file.write(section)
+    os.replace(temp_path, output_path)
+
+def read_header(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compiled dictionary.")
+        header_length = struct.unpack("<I", file.read(4))[0]
+        return json.loads(file.read(header_length)), len(MAGIC) + 4 + header_length
+
+def is_outdated(path = "../translations.bin", manual_path = "../translations.json",
+                compiled_path = "../translations_compiled.json", min_confidence = 0.5):
+    """
+    Returns True if the binary dictionary is missing or was compiled from other sources or with another min_confidence.
+    """
+    if not os.path.exists(path):
+        return True
+    try:
+        header, _ = read_header(path)
+    except ValueError:
+        return True
+    return header.get("format_version") != FORMAT_VERSION or header["min_confidence"] != min_confidence \
+        or header["sources"] != source_signature([manual_path, compiled_path])
+
+
+class CompiledDictionary:
+
+    def __init__(self, path = "../translations.bin"):
+        """
+            Map the binary dictionary at path into memory.
+        """
+        self.path = path
+        header, data_start = read_header(path)
+
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # locate the arrays of every language without reading them
+        self.sections = {}
+        for language, section in header["languages"].items():
+            start = data_start + section["offset"]
+            count = section["count"]
+            term_offsets = np.frombuffer(self.data, dtype="<u4", count=count + 1, offset=start)
+            translation_offsets = np.frombuffer(self.data, dtype="<u4", count=count + 1, offset=start + 4 * (count + 1))
+            terms_start = start + 8 * (count + 1)
+            translations_start = terms_start + int(term_offsets[-1])
+            self.sections[language] = (count, term_offsets, translation_offsets, terms_start, translations_start,
+                                       section["max_phrase_length"])
+
+        self.languages = list(self.sections.keys())
+
+    def lookup(self, term, language):
+        """
+            Return the translation of the (normalized) term or None if it is not in the dictionary.
+        """
+        count, term_offsets, translation_offsets, terms_start, translations_start, _ = self.sections[language]
+        key = term.encode("utf-8")
+
+        # binary search over the sorted terms
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.data[terms_start + int(term_offsets[middle]):terms_start + int(term_offsets[middle + 1])]
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                start = translations_start + int(translation_offsets[middle])
+                end = translations_start + int(translation_offsets[middle + 1])
+                return self.data[start:end].decode("utf-8")
+        return None
+
+    def translate(self, query, language):
+        """
+            Translate the query with a greedy longest match of the phrases in the dictionary.
+            Words without a translation are kept as they are.
+        """
+        max_phrase_length = self.sections[language][5]
+        words = query.replace("-", " ").split()
+        tokens = [word.lower() for word in words]
+
+        translated = []
+        i = 0
+        while i < len(tokens):
+            # try the longest phrase starting at the token first
+            for j in range(min(len(tokens), i + max_phrase_length), i, -1):
+                translation = self.lookup(" ".join(tokens[i:j]), language)
+                if translation is not None:
+                    translated.append(translation)
+                    i = j
+                    break
+            else:
+                translated.append(words[i])
+                i += 1
+
+        return " ".join(translated)
+
+    def close(self):
+        # the arrays refer to the mapped memory, so they are released first
+        self.sections = {}
+        self.data.close()
+
+
+if __name__ == "__main__":
+    compile_dictionary()
+    print("Compiled ../translations.bin")
@@ -2,60 +2,451 @@
 This file contains the CrossLanguageRetriever class.
 """
 import argparse
-from BM25 import BM25
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, TimeoutError
+from BM25 import BM25, index_path
+from merging import merge, merge_early
+from result_cache import ResultCache, normalize_query
+import instrumentation
+from resource_manager import ResourceManager
 import numpy as np
-from translator import Translator
+from translator import Translator, DEFAULT_HF_MODEL
+
+# the share of the deadline which is kept for the dictionary fallback of languages which miss it
+FALLBACK_SHARE = 0.2
 
 class CrossLanguageRetriever:
 
-    def __init__(self, languages, translation_approach = "dictionary", verbose=True):
+    def __init__(self, languages, translation_approach = "dictionary", parallel = False, max_workers = None, fields = None, engine = "lucene",
+                 normalization = "raw", early_termination = False, result_cache = True, cache_size = 1024, cache_ttl = 3600,
+                 fallback_translation = False, memory_budget = None, lazy = False, translation_cache = True,
+                 hf_model = DEFAULT_HF_MODEL, verbose=True):
         """
             Initialize the retriever with the given languages.
+
+            If parallel is True, the query is translated and searched in all languages at the same time
+            using a thread pool with max_workers threads (defaults to one thread per language).
+
+            fields is an optional dictionary with the weight of each indexed field (see BM25.search).
+
+            engine is the BM25 implementation, "lucene" (pyserini) or "numpy" (see numpy_bm25.py).
+
+            normalization is the normalization of the scores of each language before merging ("raw", "minmax",
+            "zscore" or "rrf", see merging.py). If early_termination is True, each language is first asked for
+            k / number of languages hits and more hits are only fetched when needed (only with "raw" or "rrf").
+
+            If result_cache is True, up to cache_size results are cached for cache_ttl seconds, keyed by the
+            lowercased query terms in their order. When an index is rebuilt, the cache is emptied and the searcher of the index is reopened
+            (see result_cache.py).
+
+            hf_model is the model of the "hf" approach, a key of translator.HF_MODELS.
+
+            If translation_cache is False, the "hf" and "translatepy" translations are not read from or written to the
+            persistent TranslationCache (see translation_cache.py).
+
+            If fallback_translation is True, the dictionary translator is used for a language when the translation
+            fails or does not finish before the deadline of the search.
+
+            The translation model and the searcher of each language are managed by a ResourceManager (see
+            resource_manager.py). If lazy is True, they are loaded on first use instead of here. If memory_budget
+            (in MB) is given, the least recently used ones are released when they need more memory than the budget.
         """
         
         self.languages = languages
         self.verbose = verbose
+        self.parallel = parallel
+        self.normalization = normalization
+        self.early_termination = early_termination
+        self.translation_approach = translation_approach
+        self.fields = fields
+        self.engine = engine
+        self.fallback_translation = fallback_translation
+        self.fallback_translator = None
+
+        if early_termination and normalization not in ["raw", "rrf"]:
+            raise ValueError(f"Early termination can not be used with the normalization '{normalization}'.")
+
+        # register the translation model and the retrievers, which are loaded when needed
+        self.resources = ResourceManager(memory_budget=memory_budget, verbose=verbose)
+        self.resources.register("translator", lambda: Translator(self.languages, approach=translation_approach, hf_model=hf_model,
+                                                                 cache=translation_cache, verbose=verbose),
+                                lambda translator: translator.close())
+        for language in self.languages:
+            self.resources.register(f"searcher:{language}", lambda language=language: BM25(language, fields=fields, engine=engine),
+                                    lambda retriever: retriever.close())
+        if not lazy:
+            self.resources.load_all()
+
+        # initialize the thread pool used for the per-language fan-out
+        if self.parallel:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers or len(self.languages))
+        else:
+            self.executor = None
+
+        # initialize the result cache
+        if result_cache:
+            self.result_cache = ResultCache([index_path(language, engine) for language in self.languages],
+                                            max_size=cache_size, ttl=cache_ttl, on_invalidate=self.reopen_searchers)
+        else:
+            self.result_cache = None
 
-        # initialize the translation model
-        self.translation_model = Translator(self.languages, approach=translation_approach, verbose=verbose)
+    def get_translator(self):
+        """
+            Return a context manager with the translation model, which is loaded if needed and kept while it is used.
+        """
+        return self.resources.use("translator")
 
-        # initialize the retrievers
-        self.retrievers = {language: BM25(language) for language in self.languages}
+    def get_retriever(self, language):
+        """
+            Return a context manager with the retriever of the language, which is loaded if needed and kept while it is used.
+        """
+        return self.resources.use(f"searcher:{language}")
 
+    def reopen_searchers(self, changed_paths):
+        """
+            Release the searchers of the rebuilt indexes, so they are opened again on their next use.
+        """
+        for language in self.languages:
+            if index_path(language, self.engine) in changed_paths:
+                if self.verbose:
+                    print(f"The index of {language} has been rebuilt, reopening its searcher")
+                self.resources.invalidate(f"searcher:{language}")
 
+    def cache_key(self, query, k):
+        """
+            The key of the query in the result cache, which contains all options that change the results.
+        """
+        fields = tuple(sorted(self.fields.items())) if self.fields else None
+        return (normalize_query(query), k, self.translation_approach, tuple(self.languages), self.engine, fields,
+                self.normalization, self.early_termination)
 
-    def search(self, query, k=10):
+    def translate_fallback(self, query, language):
+        """
+            Translate the query with the dictionary translator, which is loaded the first time it is needed.
+        """
+        if self.fallback_translator is None:
+            self.fallback_translator = Translator(self.languages, approach="dictionary", verbose=self.verbose)
+        return self.fallback_translator.translate(query, language)
+
+    def translate(self, query, language, timeout=None):
+        """
+            Translate the query into the given language, falling back to the dictionary if the translation fails.
+            If timeout is given, a translation which takes longer than timeout seconds fails with a TimeoutError.
+        """
+        if not self.fallback_translation or self.translation_approach == "dictionary":
+            with self.get_translator() as translator:
+                return translator.translate(query, language, timeout=timeout)
+
+        try:
+            with self.get_translator() as translator:
+                return translator.translate(query, language, timeout=timeout)
+        except Exception as e:
+            if self.verbose:
+                print(f"Translating into {language} failed ({e}), using the dictionary instead")
+            return self.translate_fallback(query, language)
+
+    def search_language(self, query, language, k=10, stages=None, end=None):
+        """
+            Translate the query and search it in the index of the given language.
+            Returns the hits and the time it took in seconds.
+
+            If stages is a dictionary, the time of the translation and of the search are stored in stages[language].
+            If end (a time.time() value) is given, the translation gets the time left until end as its timeout.
+        """
+        t0 = time.time()
+
+        # translate the query
+        with instrumentation.span("translate", language=language, approach=self.translation_approach):
+            translated_query = self.translate(query, language, timeout=None if end is None else max(end - t0, 0))
+        t1 = time.time()
+
+        if self.verbose:
+            print(f"Translated query into {language}:", translated_query)
+
+        # search in the given language
+        with instrumentation.span("search", language=language, engine=self.engine) as search_span:
+            with self.get_retriever(language) as retriever:
+                hits = retriever.search(translated_query, k=k)
+            search_span.set(hits=len(hits))
+
+        if stages is not None:
+            stages[language] = (t1 - t0, time.time() - t1)
+
+        return hits, time.time() - t0
+
+    def search(self, query, k=10, return_info=False, deadline=None):
         """
             Search the query in the index and return the top k results.
+
+            The merged results are MergedHits (see merging.py) with the normalized score and the language of each hit.
+            If return_info is True, a dictionary with the time each language took and the number of hits
+            fetched from each language is returned as well. info["stages"] has the time of the translation
+            and of the search of each language and the time of the merge.
+
+            deadline is the number of seconds the search may take. Languages which are not translated and searched
+            before the deadline are left out of the results (or searched with the dictionary translation if
+            fallback_translation is True) and listed in info["timed_out"]. Such partial results are not cached.
+
+            The stages of the search are reported to the sinks of instrumentation.py, if any are configured.
+        """
+        # the translation model and the searchers used by the query stay loaded until it is done
+        with self.resources.working_set(), instrumentation.span("query", approach=self.translation_approach) as query_span:
+            results_merged, results_by_language, info = self.search_info(query, k, deadline)
+            query_span.set(k=k, cached=info["cached"], hits=len(results_merged), timed_out=info["timed_out"])
+
+        if return_info:
+            return results_merged, results_by_language, info
+        return results_merged, results_by_language
+
+    def search_info(self, query, k=10, deadline=None):
+        """
+            Search the query like search and return the merged results, the results by language and the info.
         """
 
+        # look for the query in the result cache
+        if self.result_cache is not None:
+            key = self.cache_key(query, k)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                instrumentation.count("result_cache_hits")
+                # the cached results are shared, so every query gets its own lists
+                results_merged, results_by_language, fetched_hits = cached
+                results_merged = list(results_merged)
+                results_by_language = [list(hits) for hits in results_by_language]
+                return results_merged, results_by_language, {"timings": {language: 0.0 for language in self.languages},
+                                                             "stages": self.empty_stages(), "fetched": dict(fetched_hits),
+                                                             "cached": True, "timed_out": []}
+            instrumentation.count("result_cache_misses")
+
+        # with early termination each language is first asked for its share of the k hits
+        fetch_k = max(1, math.ceil(k / len(self.languages))) if self.early_termination else k
+        end = None if deadline is None else time.time() + deadline
+
         # search in all languages
-        results_by_language = []
-        for language in self.languages:
+        hits_by_language = {}
+        timings = {}
+        timed_out = []
+        stages = {}
+        if deadline is not None:
+            hits_by_language, timings, timed_out = self.search_deadline(query, fetch_k, deadline, stages)
+        elif self.parallel:
+            futures = {self.executor.submit(instrumentation.wrap(self.search_language), query, language, fetch_k, stages): language
+                       for language in self.languages}
+
+            # collect the results as they finish
+            for future in as_completed(futures):
+                language = futures[future]
+                hits_by_language[language], timings[language] = future.result()
+        else:
+            for language in self.languages:
+                hits_by_language[language], timings[language] = self.search_language(query, language, k=fetch_k, stages=stages)
+
+        # keep the results in the order of the languages
+        results_by_language = [hits_by_language[language] for language in self.languages]
+
+        # merge the results of all languages
+        t_merge = time.time()
+        with instrumentation.span("merge", normalization=self.normalization, early_termination=self.early_termination):
+            if self.early_termination:
+                latest = dict(hits_by_language)
+
+                def fetch(language, n):
+                    # after the deadline no more hits are fetched, the language is merged with the hits it has
+                    timeout = None if end is None else end - time.time()
+                    if timeout is not None and timeout <= 0:
+                        return latest[language]
+                    try:
+                        translated_query = self.translate_fallback(query, language) if language in timed_out else self.translate(query, language, timeout=timeout)
+                    except TimeoutError:
+                        return latest[language]
+                    with self.get_retriever(language) as retriever:
+                        latest[language] = retriever.search(translated_query, k=n)
+                    return latest[language]
+
+                # languages without results because of the deadline can not be fetched again
+                languages = [language for language in self.languages if language in hits_by_language and
+                             (language not in timed_out or self.fallback_translation)]
+                results_merged, fetched = merge_early([hits_by_language[language] for language in languages], languages, fetch, fetch_k,
+                                                      k=k, normalization=self.normalization)
+                results_by_language = [fetched.get(language, []) for language in self.languages]
+            else:
+                results_merged = self.merge(results_by_language, k)
+        merge_time = time.time() - t_merge
+
+        if self.verbose:
+            for language in self.languages:
+                print(f"Searching {language} took {timings[language]:.3f} seconds")
+
+        fetched_hits = {language: len(hits) for language, hits in zip(self.languages, results_by_language)}
 
-            # translate the query
-            translated_query = self.translation_model.translate(query, language)
+        # count the languages which timed out or found nothing
+        if instrumentation.enabled():
+            for language in timed_out:
+                instrumentation.count("timeouts", language=language)
+            for language, hits in fetched_hits.items():
+                instrumentation.observe("hits", hits, language=language)
+                if hits == 0 and language not in timed_out:
+                    instrumentation.count("empty_results", language=language)
+            instrumentation.observe("merged_hits", len(results_merged))
+
+        # cache the results, unless some languages timed out
+        if self.result_cache is not None and len(timed_out) == 0:
+            self.result_cache.put(key, (tuple(results_merged), tuple(tuple(hits) for hits in results_by_language), fetched_hits))
+
+        # languages which timed out have no stage times
+        info_stages = self.empty_stages()
+        for language, (translate_time, search_time) in list(stages.items()):
+            info_stages["translate"][language] = translate_time
+            info_stages["search"][language] = search_time
+        info_stages["merge"] = merge_time
+
+        return results_merged, results_by_language, {"timings": timings, "stages": info_stages, "fetched": fetched_hits,
+                                                     "cached": False, "timed_out": timed_out}
+
+    def empty_stages(self):
+        return {"translate": {language: 0.0 for language in self.languages},
+                "search": {language: 0.0 for language in self.languages}, "merge": 0.0}
+
+    def search_deadline(self, query, k, deadline, stages=None):
+        """
+            Translate and search the query in all languages at the same time, waiting at most deadline seconds.
+
+            Every query gets its own threads, so languages which miss the deadline do not hold up the threads of
+            later queries. Their translations get the deadline as timeout, so they stop soon after it.
+            With fallback_translation, FALLBACK_SHARE of the deadline is kept for searching the languages which
+            did not finish with the dictionary translation.
+            Returns the hits and timings of each language and the list of languages which timed out.
+        """
+        t0 = time.time()
+        end = t0 + deadline
+        primary_end = end - FALLBACK_SHARE * deadline if self.fallback_translation else end
+
+        executor = ThreadPoolExecutor(max_workers=len(self.languages))
+        try:
+            search_language = instrumentation.wrap(self.search_language)
+            futures = {executor.submit(search_language, query, language, k, stages, primary_end): language for language in self.languages}
+            done, not_done = wait(futures, timeout=max(primary_end - time.time(), 0))
+
+            hits_by_language = {}
+            timings = {}
+            for future in done:
+                try:
+                    hits_by_language[futures[future]], timings[futures[future]] = future.result()
+                except TimeoutError:
+                    # the translation ran out of time
+                    pass
+
+            # give up on the languages which are still running
+            timed_out = [language for language in self.languages if language not in timings]
+            for future in not_done:
+                future.cancel()
 
             if self.verbose:
-                print(f"Translated query into {language}:", translated_query)
-            # search in the given language
-            hits = self.retrievers[language].search(translated_query, k=k)
-            
-            # save the results
-            results_by_language.append(hits)
-
-        # flatten the results by language
-        results = []
-        for i in range(len(results_by_language)):
-            results += results_by_language[i]
-
-        # sort the results by the score
-        results_merged = sorted(results, key=lambda x: x.score, reverse=True)
-        
-        # only return the top k results
-        results_merged = results_merged[:k]
+                for language in timed_out:
+                    print(f"Searching {language} did not finish within {primary_end - t0:.3f} seconds")
+
+            # search the languages which timed out with the dictionary in the time which is left
+            fallbacks = {}
+            if self.fallback_translation:
+                def search_fallback(language):
+                    translated_query = self.translate_fallback(query, language)
+                    with self.get_retriever(language) as retriever:
+                        return retriever.search(translated_query, k=k)
+
+                fallbacks = {executor.submit(instrumentation.wrap(search_fallback), language): language for language in timed_out}
+                wait(fallbacks, timeout=max(end - time.time(), 0))
+
+            for future, language in fallbacks.items():
+                if future.done() and future.exception() is None:
+                    hits_by_language[language] = future.result()
+            for language in timed_out:
+                hits_by_language.setdefault(language, [])
+                timings[language] = time.time() - t0
+        finally:
+            # the threads which are still running end on their own
+            executor.shutdown(wait=False)
+
+        return hits_by_language, timings, timed_out
+
+    def merge(self, results_by_language, k=10):
+        """
+            Merge the results of the languages into the top k results overall.
+        """
+        return merge(results_by_language, self.languages, k=k, normalization=self.normalization)
+
+    def batch_search(self, queries, k=10, threads=4, qids=None):
+        """
+            Search several queries at once and return the top k results of each query.
+
+            All queries are translated in bulk and the translated queries of each language are
+            searched in a single multi-threaded batch call, which always fetches k hits per language.
+
+            Parameters
+            ---------
+            queries:
+                A list of queries in English
+            k:
+                The number of results per query (and per language)
+            threads:
+                The number of threads used by each batch search
+            qids:
+                The ids of the queries, defaults to the queries themselves
+
+            Returns two dictionaries keyed by the query ids, one with the merged results and one with
+            the results by language (in the order of the languages), like search.
+        """
+        qids = list(queries) if qids is None else list(qids)
+        if len(qids) != len(queries):
+            raise ValueError("There must be one query id per query.")
+
+        t0 = time.time()
+
+        # translate all queries into all languages
+        with instrumentation.span("translate_batch", approach=self.translation_approach) as translate_span:
+            with self.get_translator() as translator:
+                translations = translator.translate_batch(list(dict.fromkeys(queries)), self.languages)
+            translate_span.set(queries=len(queries))
+
+        if self.verbose:
+            print(f"Translated {len(queries)} queries in {time.time() - t0:.3f} seconds")
+
+        def search_batch(language):
+            translated_queries = [translations[(query, language)] for query in queries]
+            with instrumentation.span("batch_search", language=language, engine=self.engine) as search_span:
+                search_span.set(queries=len(queries))
+                with self.get_retriever(language) as retriever:
+                    return retriever.batch_search(translated_queries, qids, k=k, threads=threads)
+
+        # search each language in one batch
+        if self.parallel:
+            hits_by_language = dict(zip(self.languages, self.executor.map(instrumentation.wrap(search_batch), self.languages)))
+        else:
+            hits_by_language = {language: search_batch(language) for language in self.languages}
+
+        # group the results by query
+        results_merged = {}
+        results_by_language = {}
+        for qid in qids:
+            results_by_language[qid] = [hits_by_language[language].get(qid, []) for language in self.languages]
+            results_merged[qid] = self.merge(results_by_language[qid], k)
+
+        if self.verbose:
+            print(f"Searched {len(queries)} queries in {time.time() - t0:.3f} seconds")
 
         return results_merged, results_by_language
 
+    def close(self):
+        """
+            Shut down the thread pools used for the per-language fan-out and release the translation models and retrievers.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.resources.close()
+        if self.fallback_translator is not None:
+            self.fallback_translator.close()
+            self.fallback_translator = None
+
 
 
@@ -1,8 +1,9 @@
 from cross_language_retriever import CrossLanguageRetriever
-from ranking_fetcher import fetch_rankings
-import json
+from qrels import Qrels, write_run
+from runs import load_runs, run_results
+from merging import merge
+import metrics
 import pandas as pd
-import re
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -15,61 +16,76 @@ get_lang_idx = lambda x: LANGUAGES.index(x)
 
 class CrossLanguageEvaluator():
 
-    def __init__(self, translation_approach = "dictionary", verbose = False) -> None:
+    def __init__(self, translation_approach = "dictionary", verbose = False, run = None) -> None:
+        """
+            Initialize the evaluator of the given translation approach.
+
+            run is an optional saved run of the approach (see runs.py). Its results are used instead of searching,
+            so the retriever is only created when results which are not in the run are needed.
+        """
         self.create_labels()
-        self.retriever = CrossLanguageRetriever(LANGUAGES, verbose=verbose, translation_approach = translation_approach)
+        self.translation_approach = translation_approach
+        self.verbose = verbose
+        self.retriever = None
     
         self.relevance_scores = {}
+        
+        if run is not None:
+            self.load_run(run)
+    
+    def get_retriever(self):
+        # the retriever is created on first use
+        if self.retriever is None:
+            self.retriever = CrossLanguageRetriever(LANGUAGES, verbose=self.verbose, translation_approach = self.translation_approach)
+        return self.retriever
     
     def create_labels(self):
-        # load rankings
-        rankings = fetch_rankings(LANGUAGES)
-
-
-        # create data frame
-        labels_df = pd.DataFrame()
-
-        for lang in LANGUAGES:
-            lang_rankings = rankings[lang]
-            for query_name in lang_rankings.keys():
-                df_ = pd.DataFrame(lang_rankings[query_name]).T.reset_index(names = "docid")
-                df_["docid"] = df_["docid"].apply(lambda x: re.sub('[^\w\-_\. ]', '', x))
-                df_["docid"] = df_["docid"].apply(lambda x: x.encode("utf-8").decode("utf-8"))
-                df_["query_name"] = query_name
-                df_["query"] = query_name.replace("+", " ")
-                df_["language"] = lang
-                labels_df = pd.concat([labels_df, df_], axis = 0)
-                
-        # reset index and add to self
-        self.labels_df = labels_df.reset_index(drop = True)
+        # compile the judgments of the rankings into a (query, docid) -> grade index
+        self.qrels = Qrels.from_rankings(LANGUAGES)
+        
+        # data frame with all judgments
+        self.labels_df = self.qrels.labels_df()
         
     def get_relevance(self, query, docid):
         """
         Returns the relevance score for a given query and docid
         """
-        if docid not in self.labels_df["docid"].values:
-            # print(self.labels_df["docid"].values)
-            # raise ValueError(f"Docid '{docid}' not found in labels")
-            print(f"WARNING: Docid '{docid}' not found in labels")
-            return 0
-        
-        # get the ranking entry for the query
-        ranking = self.labels_df[self.labels_df["query"] == query]
+        return self.qrels.grade(query, docid)
+    
+    def load_run(self, run):
+        """
+        Stores the relevance scores of the results of a saved run, for the k of the run and all smaller k
+        """
+        if run["approach"] != self.translation_approach:
+            raise ValueError(f"The run of {run['approach']} can not be used to evaluate {self.translation_approach}.")
         
-        # return 0 relevance if found recipe was not for the given query
-        if docid not in ranking["docid"].values:
-            return 0
+        _, results_by_lan = run_results(run)
         
-        # get the relevance score
-        relevance_score = ranking[ranking["docid"] == docid]["ranking_manual"]
+        for query, results in results_by_lan.items():
+            grades = {result.docid: self.get_relevance(query, result.docid) for language_results in results for result in language_results}
+            
+            for k in range(1, run["k"] + 1):
+                # merge the top k hits of each language again, like a search with k would
+                results_k = [language_results[:k] for language_results in results]
+                self.relevance_scores[query + "_" + str(k) + "_None"] = np.array([grades[result.docid] for result in merge(results_k, LANGUAGES, k = k)])
+                for language in LANGUAGES:
+                    self.relevance_scores[query + "_" + str(k) + "_" + language] = np.array([grades[result.docid] for result in results_k[get_lang_idx(language)]])
+    
+    def prefetch(self, queries, k=10, threads=4):
+        """
+        Searches all queries at once with the batch search of the retriever and stores their relevance scores
+        """
+        queries = [query for query in dict.fromkeys(queries) if query + "_" + str(k) + "_None" not in self.relevance_scores]
+        if len(queries) == 0:
+            return
         
-        if len(relevance_score) > 1:
-            # raise ValueError(f"More than one relevance score found for query '{query}' and docid '{docid}'")
-            print(f"WARNING: More than one relevance score found for query '{query}' and docid '{docid}'")
-
-        relevance_score = relevance_score.iloc[0]
+        results_merged, results_by_lan = self.get_retriever().batch_search(queries, k = k, threads = threads)
         
-        return relevance_score
+        for query in queries:
+            self.relevance_scores[query + "_" + str(k) + "_None"] = np.array([self.get_relevance(query, result.docid) for result in results_merged[query]])
+            for language in LANGUAGES:
+                results = results_by_lan[query][get_lang_idx(language)]
+                self.relevance_scores[query + "_" + str(k) + "_" + language] = np.array([self.get_relevance(query, result.docid) for result in results])
     
     def get_relevance_scores(self, query, k=10, language = None):
         key = query + "_" + str(k) + "_" + str(language)
@@ -78,7 +94,7 @@ class CrossLanguageEvaluator():
             return self.relevance_scores[key]
         
         # get search results
-        results_merged, results_by_lan = self.retriever.search(query, k = k)
+        results_merged, results_by_lan = self.get_retriever().search(query, k = k)
         results = results_merged if language is None else results_by_lan[get_lang_idx(language)]
         
         # get the relevance scores
@@ -107,13 +123,7 @@ class CrossLanguageEvaluator():
         relevance_scores = self.get_relevance_scores(query, k = p, language = language)
         
         # calculate DCG
-        dcg = np.zeros(len(relevance_scores))
-        dcg[0] = relevance_scores[0]
-        dcg[1:] = relevance_scores[1:] / np.log2(np.arange(2, len(relevance_scores) + 1))
-        dcg = np.cumsum(dcg)
-        
-        
-        return dcg
+        return metrics.dcg(metrics.relevance_matrix([relevance_scores], depth = p))[0]
     
     def DCG(self, query, p = 10, language = None):
         return self.DCGs(query, p = p, language = language)[p-1]
@@ -135,15 +145,8 @@ class CrossLanguageEvaluator():
         # get relevance scores
         relevance_scores = self.get_relevance_scores(query, k = p, language = language)
         
-        # get dcg
-        dcgs = self.DCGs(query, p = p, language = language)
-        
-        # get ideal dcg
-        ideal_dcgs = relevance_scores[np.argsort(relevance_scores)[::-1]].copy().astype(float)
-        ideal_dcgs[1:] = ideal_dcgs[1:] / np.log2(np.arange(2, len(ideal_dcgs) + 1))
-        ideal_dcgs = np.cumsum(ideal_dcgs)
-        
-        return (dcgs / ideal_dcgs)
+        # calculate NDCG with the ideal DCG of the retrieved documents
+        return metrics.ndcg(metrics.relevance_matrix([relevance_scores], depth = p))[0]
     
     def NDCG(self, query, p = 10, language = None):
         return self.NDCGs(query, p = p, language = language)[p-1]
@@ -164,20 +167,54 @@ class CrossLanguageEvaluator():
         """
         # get relevance scores
         relevance_scores = self.get_relevance_scores(query, k = p, language = language)
-                
-        # create document ranks
-        ranks = np.arange(1, len(relevance_scores) + 1)
         
-        # compute a mask showing the relevant documents
-        relevance_mask = relevance_scores > 0 # ensure binary relevance labels by treating all non-zero labels as relevant
+        # calculate AP, treating all non-zero labels as relevant
+        return metrics.average_precision(metrics.relevance_matrix([relevance_scores], depth = p))[0, -1]
+    
+    def write_trec(self, test_queries, run_path, qrels_path = None, p = 10, language = None, tag = None):
+        """
+        Writes the results of the test queries as a TREC run and, if qrels_path is given, the judgments as TREC qrels
+        
+        Parameters
+        ---------
+        test_queries:
+            A list of test queries
+        run_path:
+            The path of the run file
+        qrels_path:
+            The path of the qrels file
+        p:
+            The number of results per query
+        language:
+            The language of the results, None for the merged results
+        """
+        results_merged, results_by_lan = self.get_retriever().batch_search(test_queries, k = p)
         
-        # extract the ranks of the relevant documents using the mask
-        relevant_ranks = ranks[relevance_mask]
+        results = {}
+        for query in test_queries:
+            results[query] = results_merged[query] if language is None else results_by_lan[query][get_lang_idx(language)]
+            
+        write_run(run_path, results, tag = tag or self.translation_approach)
         
-        # compute the precision for each relevant document
-        precisions = np.arange(1, len(relevant_ranks)+1) / relevant_ranks
+        if qrels_path is not None:
+            self.qrels.write_qrels(qrels_path)
+    
+    def relevance_matrix(self, test_queries, p = 10, language = None):
+        """
+        Returns the relevance scores of the test queries as a (queries x p) matrix
+        """
+        self.prefetch(test_queries, k = p)
+        return metrics.relevance_matrix([self.get_relevance_scores(query, k = p, language = language) for query in test_queries], depth = p)
+    
+    def evaluate_all(self, test_queries, p = 10, language = None):
+        """
+        Computes DCG, NDCG, AP, precision and recall of the test queries at every cutoff 1..p
         
-        return precisions.mean()
+        Returns a dictionary with a (queries x p) matrix for each metric, see metrics.evaluate_matrix.
+        Recall is computed with the number of relevant documents of each query in the judgments.
+        """
+        num_relevant = [self.qrels.num_relevant(query, language = language) for query in test_queries]
+        return metrics.evaluate_matrix(self.relevance_matrix(test_queries, p = p, language = language), num_relevant = num_relevant)
     
     def evaluate(self, test_queries,p = 10):
         """
@@ -190,35 +227,49 @@ class CrossLanguageEvaluator():
         p:
             The number of results to consider
         """
-        # create data frame
-        results_df = pd.DataFrame()
+        # compute all metrics at once
+        scores = self.evaluate_all(test_queries, p = p)
         
-        # evaluate each query
-        for query in test_queries:
-            # get the relevance scores
-            relevance_scores = self.get_relevance_scores(query, k = p)
-            
-            # get the dcg
-            dcg = self.DCG(query, p = p)
-            
-            # get the ndcg
-            ndcg = self.NDCG(query, p = p)
-            
-            # get the ap
-            ap = self.AP(query, p = p)
-            
-            # create data frame
-            df_ = pd.DataFrame({"query": query, "relevance_scores": [relevance_scores], "dcg": dcg, "ndcg": ndcg, "ap": ap})
-            
-            # add to results df
-            results_df = pd.concat([results_df, df_], axis = 0)
-            
-        # reset index
-        results_df = results_df.reset_index(drop = True)
+        # create data frame
+        results_df = pd.DataFrame({
+            "query": test_queries,
+            "relevance_scores": [self.get_relevance_scores(query, k = p) for query in test_queries],
+            "dcg": scores["dcg"][:, p-1],
+            "ndcg": scores["ndcg"][:, p-1],
+            "ap": scores["ap"][:, p-1],
+            "precision": scores["precision"][:, p-1],
+            "recall": scores["recall"][:, p-1],
+        })
         
         return results_df
     
 
+def compare_approaches(results, metric = "ndcg", baseline = "dictionary", n_resamples = 10000, seed = 0):
+    """
+    Compares the results of several translation approaches on the same queries
+    
+    Parameters
+    ---------
+    results:
+        A dictionary with the results data frame of each approach, as returned by CrossLanguageEvaluator.evaluate
+    metric:
+        The metric to compare
+    baseline:
+        The approach the others are tested against with a paired randomization test
+        
+    Returns a data frame with the mean, the 95% bootstrap confidence interval and the p-value of each approach.
+    """
+    rows = []
+    for approach, result in results.items():
+        mean, low, high = metrics.bootstrap_ci(result[metric].values, n_resamples = n_resamples, seed = seed)
+        row = {"approach": approach, "mean": mean, "ci_low": low, "ci_high": high, "difference": np.nan, "p_value": np.nan}
+        if baseline in results and approach != baseline:
+            row["difference"], row["p_value"] = metrics.paired_randomization_test(result[metric].values, results[baseline][metric].values,
+                                                                                  n_resamples = n_resamples, seed = seed)
+        rows.append(row)
+    
+    return pd.DataFrame(rows)
+
 def plot_evaluation(results, save_path = None):   
     fig, ax = plt.subplots(figsize = (10, 5))
     
@@ -288,11 +339,14 @@ if __name__ == "__main__":
     test_queries = [line.strip() for line in open("../test_queries.txt", "r").readlines()]
     plot_type = "per_metric" # ["per_metric", "per_approach"]
     
+    # search the test queries with every approach in parallel, or load the saved runs
+    runs = load_runs(translation_approaches, test_queries, k = p)
+    
     
     if plot_type == "per_approach":
         for translation_approach in translation_approaches:
             # initialize the evaluator
-            evaluator = CrossLanguageEvaluator(translation_approach = translation_approach, verbose=True)
+            evaluator = CrossLanguageEvaluator(translation_approach = translation_approach, verbose=True, run = runs[translation_approach])
             
             # test on test queries
             test_queries = [line.strip() for line in open("../test_queries.txt", "r").readlines()]
@@ -313,7 +367,7 @@ if __name__ == "__main__":
         
         for translation_approach in translation_approaches:
             # initialize the evaluator
-            evaluator = CrossLanguageEvaluator(translation_approach = translation_approach, verbose=True)
+            evaluator = CrossLanguageEvaluator(translation_approach = translation_approach, verbose=True, run = runs[translation_approach])
             
             # test on test queries
             results[translation_approach] = evaluator.evaluate(test_queries, p = p)
@@ -325,6 +379,12 @@ if __name__ == "__main__":
             print(f"Mean NDCG@{p} ({key}):", result["ndcg"].mean())
             print(f"MAP@{p} ({key}):", result["ap"].mean())
             
+        # compare the approaches with the dictionary
+        for metric in ["ndcg", "ap"]:
+            print()
+            print(f"{metric.upper()}@{p} compared to the dictionary:")
+            print(compare_approaches(results, metric = metric))
+            
         # plot results
         import os
         os.makedirs("../plots", exist_ok = True)
@@ -0,0 +1,135 @@
+"""
+This module implements a small HTTP cache for the pages downloaded by the RecipeFetcher.
+
+The response headers of a page are stored next to its body as {name}.headers.json. When a page
+is refreshed, its ETag and Last-Modified headers are sent back as If-None-Match and If-Modified-Since,
+so an unchanged page costs a 304 response without a body instead of a full download.
+
+Only successful (2xx) responses replace a page. An error response, e.g. a 404 or 503 while revalidating,
+leaves the stored page and its validators as they are and raises a FetchError.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class FetchError(Exception):
+    """
+        Raised when a page is answered with an error status. The stored page, if any, is kept.
+    """
+    def __init__(self, url, status_code):
+        self.url = url
+        self.status_code = status_code
+        super().__init__(f"{url} returned status {status_code}")
+
+
+class HttpCache:
+
+    def __init__(self, refresh_after = None):
+        """
+            Initialize the cache.
+
+            Pages younger than refresh_after seconds are used without contacting the server. Older pages
+            are revalidated. If refresh_after is None, pages on disk are never refreshed.
+        """
+        self.refresh_after = refresh_after
+        self.lock = threading.Lock()
+
+        # counters
+        self.hits = 0 # pages used from disk, including pages revalidated with a 304
+        self.revalidated = 0 # 304 responses
+        self.misses = 0 # full downloads
+        self.errors = 0 # error responses, which did not replace the stored page
+
+    def headers_path(self, body_path):
+        return os.path.splitext(body_path)[0] + ".headers.json"
+
+    def load_headers(self, body_path):
+        if not os.path.exists(self.headers_path(body_path)):
+            return {}
+        with open(self.headers_path(body_path), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def is_fresh(self, body_path):
+        """
+            Return True if the page on disk can be used without contacting the server.
+        """
+        if not os.path.exists(body_path):
+            return False
+
+        if self.refresh_after is None:
+            fresh = True
+        else:
+            fetched = self.load_headers(body_path).get("fetched", os.path.getmtime(body_path))
+            fresh = time.time() - fetched < self.refresh_after
+
+        if fresh:
+            with self.lock:
+                self.hits += 1
+        return fresh
+
+    def request_headers(self, body_path):
+        """
+            Return the headers for a conditional request of the page.
+        """
+        headers = {"Accept-Encoding": "gzip, deflate"}
+
+        # only revalidate if the body is still on disk
+        if not os.path.exists(body_path):
+            return headers
+
+        stored = self.load_headers(body_path)
+        if stored.get("etag"):
+            headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            headers["If-Modified-Since"] = stored["last_modified"]
+
+        return headers
+
+    def update(self, body_path, response, save):
+        """
+            Store the response of a (conditional) request of the page.
+
+            save is the function used to write the body to body_path. Returns True if the body was rewritten.
+            Raises a FetchError if the response is neither a 304 nor a 2xx response.
+        """
+        if response.status_code != 304 and not 200 <= response.status_code < 300:
+            with self.lock:
+                self.errors += 1
+            raise FetchError(response.url, response.status_code)
+
+        stored = self.load_headers(body_path)
+        stored["url"] = response.url
+        stored["fetched"] = time.time()
+
+        if response.status_code == 304:
+            with self.lock:
+                self.hits += 1
+                self.revalidated += 1
+            rewritten = False
+        else:
+            with self.lock:
+                self.misses += 1
+            save(response.text, body_path)
+            stored["status"] = response.status_code
+            stored["etag"] = response.headers.get("ETag")
+            stored["last_modified"] = response.headers.get("Last-Modified")
+            stored["content_encoding"] = response.headers.get("Content-Encoding")
+            rewritten = True
+
+        with open(self.headers_path(body_path), 'w', encoding='utf-8') as file:
+            json.dump(stored, file, indent=4, sort_keys=True)
+
+        return rewritten
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / total if total > 0 else 0.0,
+        }
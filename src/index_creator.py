@@ -5,21 +5,89 @@ and indexes.
 
 from bs4 import BeautifulSoup
 import os
+import re
 import json
+import glob
+import time
+import hashlib
+import importlib.util
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from recipe_schema import extract_recipe
+
+# use the fast lxml parser if it is installed
+PARSER = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+
+# tags which never contain visible text
+INVISIBLE_TAGS = ["script", "style", "noscript", "template", "iframe", "svg", "canvas"]
+
+# tags which usually hold menus, footers, forms etc.
+BOILERPLATE_TAGS = ["nav", "footer", "aside", "form", "button", "select"]
+
+# ids and classes of menus, cookie banners, share buttons, comments, ads etc.
+BOILERPLATE_PATTERN = re.compile(r"(^|[-_ ])(cookies?|consent|gdpr|banner|newsletter|share|sharing|social|comments?|advert|ads|promo|popup|modal|menu|navbar|breadcrumbs?|sidebar|footer|related)([-_ ]|$)", re.IGNORECASE)
+
+# ids and classes of the blocks holding the recipe, which are never removed
+CONTENT_PATTERN = re.compile(r"recipe|ingredient|instruction|entry-content|post-content|article-body", re.IGNORECASE)
+CONTENT_TAGS = ["html", "body", "main", "article"]
+
+def is_content(tag):
+    names = [tag.get("id") or ""] + (tag.get("class") or [])
+    return any(CONTENT_PATTERN.search(name) for name in names if isinstance(name, str))
 
 def html_to_text(html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
     return soup.get_text()
 
-def save_json(recipe_text, recipe_name, lang):
+def clean_html_to_text(html_content):
+    """
+    Extracts the text of the given html without scripts, styles and boilerplate blocks.
+    """
+    soup = BeautifulSoup(html_content, PARSER)
+
+    # remove the tags which never contain visible text
+    for tag in soup.find_all(INVISIBLE_TAGS):
+        tag.decompose()
+
+    # remove the boilerplate tags and the blocks whose id or class marks them as boilerplate,
+    # unless they wrap the recipe (saved pages are often malformed, so a <button> may hold the whole page)
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.attrs is None or tag.name in CONTENT_TAGS:
+            continue
+        names = [tag.get("id") or ""] + (tag.get("class") or [])
+        if tag.name in BOILERPLATE_TAGS or any(BOILERPLATE_PATTERN.search(name) for name in names if isinstance(name, str)):
+            if is_content(tag) or tag.find(is_content) is not None:
+                continue
+            tag.decompose()
+
+    # collapse the whitespace between text blocks
+    return " ".join(soup.get_text(separator=" ").split())
+
+# available text extractors
+EXTRACTORS = {
+    "full": html_to_text,
+    "clean": clean_html_to_text,
+}
+
+# the schema.org recipe fields written to the .json files and indexed as separate fields
+INDEXED_FIELDS = ["name", "ingredients", "instructions"]
+
+def save_json(recipe_text, recipe_name, lang, recipe = None):
     """
     Saves the given recipe text as a .json file.
+
+    If the structured recipe is given, its fields are saved as separate keys, with 
+    the ingredients and instructions joined into one string each.
     """
 
     # create a dictionary with "docid" and "content" keys
     doc_data = {"id": recipe_name[:-5], "contents": recipe_text}
 
+    # add the structured recipe fields
+    if recipe is not None:
+        for field, value in recipe.items():
+            doc_data[field] = " ".join(value) if isinstance(value, list) else value
+
     # create the directory if it doesn't exist
     if not os.path.exists(f"../indexes/json_files/{lang}"): 
         os.makedirs(f"../indexes/json_files/{lang}")
@@ -28,40 +96,113 @@ def save_json(recipe_text, recipe_name, lang):
     with open(f"../indexes/json_files/{lang}/{recipe_name[:-5]}.json", 'w') as file:
         json.dump(doc_data, file)
 
-def build_index_json(lang = "english"):
+def convert_document(html_path, lang, extractor = "clean", contents = "page"):
     """
-    Builds the json index for the given recipes and given language.
+    Converts a single html file into a .json file.
+    Returns its docid, the size of the html and of the extracted text in bytes and
+    whether a schema.org recipe was found.
+
+    If contents is "ingredients", the contents of pages with a schema.org recipe are only 
+    the name and the ingredients of the recipe instead of the text of the whole page.
     """
 
-    # recipes folder
-    recipesDir = f"../google_results/"
+    # open the html file
+    with open(html_path, 'r', encoding='utf-8') as file:
+        recipe_html = file.read()
 
-    # iterate over recipes
-    for recipe in os.listdir(recipesDir):
+    # extract the structured recipe
+    recipe = extract_recipe(recipe_html)
 
-        print("converting documents from: ", recipe)
+    # convert to text
+    if contents == "ingredients" and recipe is not None:
+        recipe_text = " ".join([recipe["name"]] + recipe["ingredients"])
+    else:
+        recipe_text = EXTRACTORS[extractor](recipe_html)
 
-        langDir = recipesDir + recipe + "/" + lang + "/"
+    # process the text
+    recipe_text = text_process(recipe_text)
 
-        # iterate over html files for a specific recipe and language
-        for filename in os.listdir(langDir):
+    # save the json file
+    filename = os.path.basename(html_path)
+    save_json(recipe_text, filename, lang, recipe)
+
+    return filename[:-5], len(recipe_html.encode('utf-8')), len(recipe_text.encode('utf-8')), recipe is not None
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
 
-            # skip the redundant files
-            if filename == "main.html": continue 
-            if not filename.endswith(".html"): continue
+def build_index_json(lang = "english", workers = None, extractor = "clean", contents = "page", verbose = False):
+    """
+    Builds the json index for the given recipes and given language.
+
+    The html files are converted in parallel by a pool of worker processes. A manifest with
+    the hash of every converted html file is kept next to the json files, so unchanged files
+    are skipped and the json files of deleted html files are removed.
+
+    extractor is the name of the text extractor in EXTRACTORS: "full" keeps all text of the page
+    and "clean" drops scripts, styles and boilerplate blocks. The manifest records the size of
+    every html file and of its extracted text.
+
+    The schema.org recipe of every page is saved as separate fields. If contents is "ingredients",
+    the contents of pages with a recipe are only its name and ingredients (see convert_document).
+    """
 
-            # open the html file
-            with open(langDir + filename, 'r') as file:
-                recipe_html = file.read()
+    t0 = time.time()
 
-            # convert to text
-            recipe_text = html_to_text(recipe_html)
+    # find the html files of all recipes for the given language, skipping the redundant files
+    html_paths = sorted(path.replace("\\", "/") for path in glob.glob(f"../google_results/*/{lang}/*.html"))
+    html_paths = [path for path in html_paths if os.path.basename(path) != "main.html"]
 
-            # process the text
-            recipe_text = text_process(recipe_text)
+    # load the manifest of the previous run
+    manifest_path = f"../indexes/json_files/{lang}_manifest.json"
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
 
-            # save the json file
-            save_json(recipe_text, filename, lang)
+    # find the files which changed since the previous run or whose json file was deleted
+    hashes = {path: file_hash(path) for path in html_paths}
+    changed = [path for path in html_paths if path not in manifest or manifest[path]["hash"] != hashes[path] or manifest[path].get("extractor") != extractor or manifest[path].get("contents") != contents
+               or not os.path.exists(f"../indexes/json_files/{lang}/{manifest[path]['docid']}.json")]
+    deleted = [path for path in manifest if path not in hashes]
+
+    # convert the changed files in parallel
+    new_manifest = {path: manifest[path] for path in html_paths if path not in changed}
+    if len(changed) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            converted = executor.map(convert_document, changed, [lang] * len(changed), [extractor] * len(changed), [contents] * len(changed), chunksize=8)
+            for path, (docid, bytes_in, bytes_out, has_recipe) in zip(changed, converted):
+                new_manifest[path] = {"hash": hashes[path], "docid": docid, "extractor": extractor, "contents": contents, 
+                                      "bytes_in": bytes_in, "bytes_out": bytes_out, "recipe": has_recipe}
+                if verbose:
+                    print(f"{docid}: {bytes_in} bytes -> {bytes_out} bytes")
+
+    # remove the documents whose html file was deleted, unless another html file has the same docid
+    docids = {entry["docid"] for entry in new_manifest.values()}
+    for path in deleted:
+        docid = manifest[path]["docid"]
+        json_path = f"../indexes/json_files/{lang}/{docid}.json"
+        if docid not in docids and os.path.exists(json_path):
+            os.remove(json_path)
+
+    # save the manifest
+    os.makedirs("../indexes/json_files", exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(new_manifest, file, indent=4, sort_keys=True)
+
+    seconds = time.time() - t0
+    docs_per_second = len(changed) / seconds if seconds > 0 else 0.0
+    print(f"{lang}: converted {len(changed)} documents, skipped {len(html_paths) - len(changed)} unchanged and removed {len(deleted)} deleted "
+          f"in {seconds:.2f} seconds ({docs_per_second:.1f} docs/sec)")
+
+    # report the size of the html and the extracted text
+    bytes_in = sum(new_manifest[path]["bytes_in"] for path in changed)
+    bytes_out = sum(new_manifest[path]["bytes_out"] for path in changed)
+    if bytes_in > 0:
+        print(f"{lang}: extracted {bytes_out / 1e6:.2f} MB of text from {bytes_in / 1e6:.2f} MB of html ({bytes_out / bytes_in:.1%})")
+    num_recipes = sum(entry.get("recipe", False) for entry in new_manifest.values())
+    print(f"{lang}: {num_recipes} of {len(new_manifest)} documents have a schema.org recipe")
 
 def text_process(text):
     """
@@ -73,7 +214,11 @@ def text_process(text):
 
     return text
 
-def build_index(lang="english"):
+def build_index(lang="english", fields = INDEXED_FIELDS):
+    """
+    Builds the Lucene index from the json files. Besides the contents, the given
+    schema.org recipe fields are indexed so they can be searched on their own.
+    """
 
     # specify the index name
     index_name = lang + "_index"
@@ -84,6 +229,9 @@ def build_index(lang="english"):
     elif lang == "chinese": ISO_lan_code = "zh"
     elif lang == "danish": ISO_lan_code = "da"
 
+    # index the recipe fields besides the contents
+    fields_option = f"--fields {' '.join(fields)}" if len(fields) > 0 else ""
+
     # the following command builds the index from the json files
     subprocess.run(f"python -m pyserini.index.lucene \
                 --collection JsonCollection \
@@ -92,6 +240,7 @@ def build_index(lang="english"):
                 --index ../indexes/{index_name} \
                 --generator DefaultLuceneDocumentGenerator \
                 --threads 1 \
+                {fields_option} \
                 --storeDocvectors", shell=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,328 @@
+"""
+Tracing and metrics of the retrieval pipeline.
+
+The retriever reports timing spans for each stage (the whole query, the translation and the search of each
+language, the merge), counters (e.g. translation cache hits, timeouts, languages without results) and
+histograms (e.g. the number of hits of each language). Everything is sent to the configured sinks:
+
+    NullSink        drops everything
+    PrometheusSink  aggregates counters and histograms (span durations become the histogram
+                    clir_span_seconds) and renders them in the Prometheus text exposition format
+    JsonLinesSink   writes every span, counter and observation as one JSON object per line
+
+Instrumentation is disabled until configure() is called with at least one sink. While disabled, span()
+returns a shared no-op context manager and count() and observe() return right away, so the cost is a
+function call and a check of a global.
+
+    prometheus = PrometheusSink()
+    configure([prometheus, JsonLinesSink("../traces.jsonl")])
+
+    with span("search", language="danish"):
+        ...
+    count("timeouts", language="danish")
+    observe("hits", 10, language="danish")
+
+    print(prometheus.text())
+
+Spans started inside another span in the same thread (or in a function wrapped with wrap() and run in
+another thread) get the trace id of the outer span and its id as parent.
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+PREFIX = "clir"
+
+# the default buckets of the histograms, in seconds for durations
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+SINKS = []
+ENABLED = False
+
+# the span which is running in the current context
+current_span = contextvars.ContextVar("current_span", default=None)
+span_ids = itertools.count(1)
+
+
+class NullSpan:
+    """
+    The span returned while instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        self.id = next(span_ids)
+        parent = current_span.get()
+        self.parent_id = parent.id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.id
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.t0
+        current_span.reset(self.token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        for sink in SINKS:
+            sink.span(self)
+        return False
+
+    def set(self, **attributes):
+        """
+        Adds attributes to the span, e.g. the number of hits, which are written to the trace but are not labels.
+        """
+        self.attributes.update(attributes)
+
+    def to_json(self):
+        return {"type": "span", "name": self.name, "trace_id": self.trace_id, "span_id": self.id, "parent_id": self.parent_id,
+                "start": self.start, "duration": self.duration, "labels": self.labels, "attributes": self.attributes}
+
+
+def configure(sinks):
+    """
+    Sends the instrumentation to the given sinks. An empty list disables it.
+    """
+    global SINKS, ENABLED
+    for sink in SINKS:
+        if sink not in sinks:
+            sink.close()
+    SINKS = list(sinks)
+    ENABLED = len(SINKS) > 0
+
+def disable():
+    configure([])
+
+def enabled():
+    return ENABLED
+
+def get_sink(sink_type):
+    """
+    Returns the first configured sink of the given type, or None.
+    """
+    for sink in SINKS:
+        if isinstance(sink, sink_type):
+            return sink
+    return None
+
+
+def span(name, **labels):
+    """
+    Returns a context manager which times the stage with the given name and labels.
+    """
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, labels)
+
+def count(name, value = 1, **labels):
+    """
+    Increases the counter with the given name and labels.
+    """
+    if not ENABLED:
+        return
+    for sink in SINKS:
+        sink.count(name, value, labels)
+
+def observe(name, value, **labels):
+    """
+    Adds a value to the histogram with the given name and labels.
+    """
+    if not ENABLED:
+        return
+    for sink in SINKS:
+        sink.observe(name, value, labels)
+
+def wrap(function):
+    """
+    Returns the function, running in the current context if instrumentation is enabled, so spans created
+    by the function in another thread (e.g. of a thread pool) belong to the current span.
+    """
+    if not ENABLED:
+        return function
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+class NullSink:
+    """
+    A sink which drops everything. Every sink implements these methods.
+    """
+
+    def span(self, span):
+        pass
+
+    def count(self, name, value, labels):
+        pass
+
+    def observe(self, name, value, labels):
+        pass
+
+    def close(self):
+        pass
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(labels, extra = None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if len(items) == 0:
+        return ""
+    escaped = [(key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for key, value in items]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class PrometheusSink(NullSink):
+
+    def __init__(self, buckets = None):
+        """
+            Aggregate the counters and histograms in memory.
+
+            buckets is an optional dictionary with the upper bounds of the buckets of each histogram.
+            Durations use LATENCY_BUCKETS and other histograms COUNT_BUCKETS by default.
+        """
+        self.buckets = {name: sorted(bounds) + [float("inf")] for name, bounds in (buckets or {}).items()}
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float) # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> [bucket counts, sum, count]
+
+    def count(self, name, value, labels):
+        with self.lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def observe(self, name, value, labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            if key not in self.histograms:
+                bounds = self.histogram_buckets(name)
+                self.histograms[key] = [[0] * len(bounds), 0.0, 0]
+            histogram = self.histograms[key]
+            for i, bound in enumerate(self.histogram_buckets(name)):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def span(self, span):
+        self.observe("span_seconds", span.duration, dict(span.labels, stage=span.name))
+
+    def histogram_buckets(self, name):
+        if name not in self.buckets:
+            self.buckets[name] = (LATENCY_BUCKETS if name.endswith("seconds") else COUNT_BUCKETS) + [float("inf")]
+        return self.buckets[name]
+
+    def text(self):
+        """
+            Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, [list(buckets), total, n]) for key, (buckets, total, n) in self.histograms.items())
+
+        for i, ((name, labels), value) in enumerate(counters):
+            metric = f"{PREFIX}_{name}_total"
+            if i == 0 or counters[i - 1][0][0] != name:
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value:g}")
+
+        for i, ((name, labels), (buckets, total, n)) in enumerate(histograms):
+            metric = f"{PREFIX}_{name}"
+            if i == 0 or histograms[i - 1][0][0] != name:
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, bucket_count in zip(self.histogram_buckets(name), buckets):
+                lines.append(f"{metric}_bucket{format_labels(labels, {'le': format_bound(bound)})} {bucket_count}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {total:g}")
+            lines.append(f"{metric}_count{format_labels(labels)} {n}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+            Writes the metrics to a file, e.g. for the textfile collector of the node exporter.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(self.text())
+        os.replace(temp_path, path)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class JsonLinesSink(NullSink):
+
+    def __init__(self, path = "../traces.jsonl", spans_only = False):
+        """
+            Append a JSON object per span, counter and observation to the file at path.
+            If spans_only is True, counters and observations are left out.
+        """
+        self.path = path
+        self.spans_only = spans_only
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line)
+
+    def span(self, span):
+        self.write(span.to_json())
+
+    def count(self, name, value, labels):
+        if not self.spans_only:
+            self.write({"type": "counter", "name": name, "time": time.time(), "value": value, "labels": labels,
+                        "trace_id": trace_id()})
+
+    def observe(self, name, value, labels):
+        if not self.spans_only:
+            self.write({"type": "histogram", "name": name, "time": time.time(), "value": value, "labels": labels,
+                        "trace_id": trace_id()})
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def trace_id():
+    """
+    Returns the trace id of the current span, or None outside of spans.
+    """
+    current = current_span.get()
+    return current.trace_id if current is not None else None
@@ -1,5 +1,7 @@
 import argparse
 from cross_language_retriever import CrossLanguageRetriever
+from server import serve, query_server, results_to_json, DEFAULT_HOST, DEFAULT_PORT
+import instrumentation
 
 
 def Cross_language_recipes():
@@ -8,27 +10,94 @@ def Cross_language_recipes():
         Fully functional system of recipes retrieval in 4 languages
 
         Example: python3 main.py "eggplant onion soy-sauce"
+
+        If a server is running (python3 main.py --serve), the query is sent to it, otherwise the
+        retriever is loaded to answer the query in this process.
     """
     
     # Initialize the command-line argument parser
     parser = argparse.ArgumentParser(description="Cross Language Information Retrieval System")
-    parser.add_argument("query", type=str, help="Enter the search query in English\
+    parser.add_argument("query", type=str, nargs="?", help="Enter the search query in English\
                                                  surrounded by double quotes.")
     parser.add_argument("--verbose", "-v", action="store_true", help="Print the results in detail.")
     parser.add_argument("-translation_method", type=str, default="translatepy")
+    parser.add_argument("--parallel", "-p", action="store_true", help="Translate and search all languages concurrently.")
+    parser.add_argument("--engine", type=str, default="lucene", choices=["lucene", "numpy"], help="The BM25 engine used for searching.")
+    parser.add_argument("--normalization", type=str, default="raw", choices=["raw", "minmax", "zscore", "rrf"],
+                        help="The normalization of the scores of each language before merging.")
+    parser.add_argument("--early-termination", action="store_true", help="Fetch fewer hits per language and more only when needed.")
+    parser.add_argument("--deadline", type=float, default=None, help="The number of seconds a query may take before slow languages are left out.")
+    parser.add_argument("--fallback", action="store_true", help="Use the dictionary for languages whose translation fails or is too slow.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not cache the results of queries.")
+    parser.add_argument("--serve", action="store_true", help="Load the retriever once and serve queries over HTTP.")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="The host of the server.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="The port of the server.")
+    parser.add_argument("--local", action="store_true", help="Always search in this process, even if a server is running.")
+    parser.add_argument("--memory-budget", type=float, default=None, help="The memory (in MB) the translation model and searchers may use.")
+    parser.add_argument("--lazy", action="store_true", help="Load the translation model and the searchers on first use.")
+    parser.add_argument("--metrics", action="store_true", help="Collect metrics of the stages, served at /metrics with --serve.")
+    parser.add_argument("--trace", type=str, default=None, help="Append the spans and metrics of the stages to this JSON lines file.")
     args = parser.parse_args()
 
-    # Initialize the retriever
-    retriever = CrossLanguageRetriever(["english", "czech", "chinese", "danish"], 
-                                       translation_approach = args.translation_method, verbose=True)
+    if not args.serve and args.query is None:
+        parser.error("a query is required unless --serve is given")
+
+    # Use the running server if there is one
+    response = None
+    if not args.serve and not args.local:
+        options = {"approach": args.translation_method, "engine": args.engine, "normalization": args.normalization,
+                   "early_termination": args.early_termination, "cache": not args.no_cache, "fallback": args.fallback}
+        response = query_server(args.query, host=args.host, port=args.port, deadline=args.deadline, options=options)
+
+    if response is None:
+        # Enable the instrumentation
+        sinks = []
+        if args.metrics:
+            sinks.append(instrumentation.PrometheusSink())
+        if args.trace is not None:
+            sinks.append(instrumentation.JsonLinesSink(args.trace))
+        instrumentation.configure(sinks)
+
+        # Initialize the retriever
+        retriever = CrossLanguageRetriever(["english", "czech", "chinese", "danish"], 
+                                           translation_approach = args.translation_method, parallel = args.parallel,
+                                           engine = args.engine, normalization = args.normalization,
+                                           early_termination = args.early_termination, result_cache = not args.no_cache,
+                                           fallback_translation = args.fallback, memory_budget = args.memory_budget,
+                                           lazy = args.lazy,
+                                           verbose=not args.serve)
 
-    # Perform search with the provided query
-    results_merged, results_by_lan = retriever.search(args.query)
+        if args.serve:
+            serve(retriever, host=args.host, port=args.port, deadline=args.deadline, verbose=args.verbose)
+            instrumentation.disable()
+            return
+
+        # Perform search with the provided query
+        results_merged, results_by_lan, info = retriever.search(args.query, return_info=True, deadline=args.deadline)
+        retriever.close()
+        response = results_to_json(retriever.languages, results_merged, results_by_lan, info)
+    else:
+        print(f"Answered by the server at {args.host}:{args.port} in {response['seconds']:.3f}s")
+
+    if len(response["timed_out"]) > 0:
+        print("\nTimed out:", ", ".join(response["timed_out"]))
+
+    # Print the time spent per language
+    print("\n\nTime per language:")
+    for language, seconds in response["timings"].items():
+        print(f'{language:8} {seconds:.3f}s')
 
     # Print the merged results
     print("\n\nMerged results:")
-    for i in range(len(results_merged)):
-        print(f'{i+1:2} {results_merged[i].docid:4} {results_merged[i].score:.5f}')
+    for i, hit in enumerate(response["results"]):
+        print(f'{i+1:2} {hit["docid"]:4} {hit["score"]:.5f} {hit["language"]}')
+
+    # Print the metrics of the stages
+    prometheus = instrumentation.get_sink(instrumentation.PrometheusSink)
+    if prometheus is not None:
+        print("\n\nMetrics:")
+        print(prometheus.text())
+    instrumentation.disable()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""
+Module for merging the results of the languages into one ranking.
+
+The raw BM25 scores of the indexes are not comparable, so the scores of each language can be normalized
+before merging:
+
+    raw:    the BM25 scores as they are
+    minmax: the scores of a language scaled to [0, 1]
+    zscore: the scores of a language standardized to zero mean and unit variance
+    rrf:    reciprocal rank fusion, 1 / (RRF_K + rank)
+
+The hits of every language are sorted by score, so the top k hits overall are found with a heap-based
+k-way merge. For the normalizations where the score of a hit does not depend on the hits below it
+(raw and rrf), the merge can also start from fewer hits per language and only fetch more hits of a
+language when its hits run out before k hits are merged (see merge_early).
+"""
+
+import heapq
+import itertools
+import math
+from collections import namedtuple
+
+RRF_K = 60
+
+NORMALIZATIONS = ["raw", "minmax", "zscore", "rrf"]
+
+# normalizations which allow fetching fewer hits per language
+EARLY_TERMINATION_NORMALIZATIONS = ["raw", "rrf"]
+
+# a merged hit, with the normalized score, the language and the original BM25 score and rank in that language
+MergedHit = namedtuple("MergedHit", ["docid", "score", "language", "raw_score", "rank"])
+
+
+def normalize(hits, normalization = "raw"):
+    """
+    Returns the normalized scores of the given hits, which are sorted by score.
+    """
+    scores = [float(hit.score) for hit in hits]
+    if normalization == "raw" or len(scores) == 0:
+        return scores
+    elif normalization == "minmax":
+        low, high = min(scores), max(scores)
+        if high == low:
+            return [1.0] * len(scores)
+        return [(score - low) / (high - low) for score in scores]
+    elif normalization == "zscore":
+        mean = sum(scores) / len(scores)
+        std = math.sqrt(sum((score - mean) ** 2 for score in scores) / len(scores))
+        if std == 0:
+            return [0.0] * len(scores)
+        return [(score - mean) / std for score in scores]
+    elif normalization == "rrf":
+        return [1 / (RRF_K + rank) for rank in range(1, len(scores) + 1)]
+    else:
+        raise ValueError(f"Unknown normalization '{normalization}'. Choose between {NORMALIZATIONS}.")
+
+def merged_hits(hits, language, normalization = "raw"):
+    """
+    Returns the hits of a language as MergedHits with normalized scores.
+    """
+    return [MergedHit(hit.docid, score, language, float(hit.score), rank)
+            for rank, (hit, score) in enumerate(zip(hits, normalize(hits, normalization)), start=1)]
+
+
+def merge(results_by_language, languages, k = 10, normalization = "raw"):
+    """
+    Merge the results of the languages into the top k hits overall.
+
+    Parameters
+    ---------
+    results_by_language:
+        A list with the hits of each language, sorted by score
+    languages:
+        The languages of the results
+    k:
+        The number of merged hits
+    normalization:
+        The normalization of the scores of each language, see NORMALIZATIONS
+
+    Ties are broken by the order of the languages, then by the rank within the language.
+    """
+    merged = heapq.merge(*[merged_hits(hits, language, normalization) for hits, language in zip(results_by_language, languages)],
+                         key=lambda hit: -hit.score)
+    return list(itertools.islice(merged, k))
+
+
+def merge_early(results_by_language, languages, fetch, fetched_k, k = 10, normalization = "raw"):
+    """
+    Merge the top k hits overall, starting from fewer than k hits per language.
+
+    Parameters
+    ---------
+    results_by_language:
+        A list with the hits of each language that have been fetched already, sorted by score
+    languages:
+        The languages of the results
+    fetch:
+        A function fetch(language, n) which returns the top n hits of the language
+    fetched_k:
+        The number of hits which were requested per language in results_by_language
+    k:
+        The number of merged hits
+    normalization:
+        "raw" or "rrf", as the other normalizations depend on all hits of a language
+
+    When the merge reaches the last fetched hit of a language which may have more hits, twice as many
+    hits (at most k) are fetched for that language. Returns the merged hits and a dictionary with the
+    hits of each language that were fetched.
+    """
+    if normalization not in EARLY_TERMINATION_NORMALIZATIONS:
+        raise ValueError(f"Early termination is only possible with the normalizations {EARLY_TERMINATION_NORMALIZATIONS}, not '{normalization}'.")
+
+    fetched = dict(zip(languages, results_by_language))
+    hits = {language: merged_hits(fetched[language], language, normalization) for language in languages}
+    requested = {language: fetched_k for language in languages}
+    positions = {language: 0 for language in languages}
+    heap = []
+
+    def push(i, language):
+        # fetch more hits if all fetched hits of the language are merged, but the language may have more
+        while positions[language] == len(hits[language]) and len(hits[language]) >= requested[language] and requested[language] < k:
+            requested[language] = min(2 * requested[language], k)
+            fetched[language] = fetch(language, requested[language])
+            hits[language] = merged_hits(fetched[language], language, normalization)
+
+        if positions[language] < len(hits[language]):
+            hit = hits[language][positions[language]]
+            heapq.heappush(heap, (-hit.score, i, positions[language], language))
+
+    for i, language in enumerate(languages):
+        push(i, language)
+
+    merged = []
+    while len(heap) > 0 and len(merged) < k:
+        _, i, position, language = heapq.heappop(heap)
+        merged.append(hits[language][position])
+        positions[language] += 1
+        push(i, language)
+
+    return merged, fetched
@@ -0,0 +1,131 @@
+"""
+Vectorized retrieval metrics.
+
+All metrics take a relevance matrix with one row per query and one column per rank (padded with zeros
+for queries with fewer results) and return a matrix with the metric of every query at every cutoff
+1..depth, so metric[:, p - 1] is the metric at p.
+
+The conventions of the CrossLanguageEvaluator are kept: the ideal DCG is computed from the retrieved
+documents, documents with a grade above 0 are relevant for AP, precision and recall, and queries without
+any relevant document get NaN for NDCG and AP. Recall needs the number of relevant documents of every
+query in the judgments (see Qrels.num_relevant); queries without any get NaN.
+
+The module also has bootstrap confidence intervals of the mean and a paired randomization test, both
+vectorized over the resamples (in chunks, to bound the memory use).
+"""
+
+import numpy as np
+
+METRICS = ["dcg", "ndcg", "ap", "precision", "recall"]
+
+# the number of values resampled at once, to bound the memory used by the resampling
+CHUNK_SIZE = 2 ** 21
+
+
+def relevance_matrix(relevance_lists, depth = None):
+    """
+    Stacks the relevance scores of the queries into a matrix, padding short lists with zeros.
+    Missing grades (None) count as 0.
+    """
+    depth = depth or max([len(scores) for scores in relevance_lists], default=0)
+    matrix = np.zeros((len(relevance_lists), depth))
+    for i, scores in enumerate(relevance_lists):
+        scores = [0 if score is None else score for score in scores][:depth]
+        matrix[i, :len(scores)] = scores
+    return matrix
+
+def discounts(depth):
+    """
+    The discount of each rank, 1 for the first rank and 1 / log2(rank) for the others.
+    """
+    ranks = np.arange(1, depth + 1)
+    discount = np.ones(depth)
+    discount[1:] = 1 / np.log2(ranks[1:])
+    return discount
+
+def dcg(relevance):
+    return np.cumsum(relevance * discounts(relevance.shape[1]), axis=1)
+
+def ndcg(relevance):
+    ideal = -np.sort(-relevance, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return dcg(relevance) / dcg(ideal)
+
+def average_precision(relevance):
+    relevant = relevance > 0
+    num_relevant = np.cumsum(relevant, axis=1)
+    precision_at_relevant = np.where(relevant, num_relevant / np.arange(1, relevance.shape[1] + 1), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(num_relevant > 0, np.cumsum(precision_at_relevant, axis=1) / num_relevant, np.nan)
+
+def precision(relevance):
+    return np.cumsum(relevance > 0, axis=1) / np.arange(1, relevance.shape[1] + 1)
+
+def recall(relevance, num_relevant = None):
+    """
+    num_relevant is the number of relevant documents of each query in the judgments. It defaults to the
+    relevant documents retrieved, which makes the recall 1 at the last rank of every query with a relevant hit.
+    """
+    retrieved = np.cumsum(relevance > 0, axis=1)
+    num_relevant = retrieved[:, -1] if num_relevant is None else np.asarray(num_relevant)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return retrieved / num_relevant[:, None]
+
+def evaluate_matrix(relevance, num_relevant = None):
+    """
+    Computes all metrics at all cutoffs. Returns a dictionary with a (queries x depth) matrix per metric.
+    """
+    return {
+        "dcg": dcg(relevance),
+        "ndcg": ndcg(relevance),
+        "ap": average_precision(relevance),
+        "precision": precision(relevance),
+        "recall": recall(relevance, num_relevant),
+    }
+
+
+def chunk_sizes(n_resamples, n_values):
+    """
+    Splits the resamples into chunks of at most CHUNK_SIZE values.
+    """
+    per_chunk = max(1, CHUNK_SIZE // n_values)
+    return [min(per_chunk, n_resamples - start) for start in range(0, n_resamples, per_chunk)]
+
+def bootstrap_ci(values, n_resamples = 10000, alpha = 0.05, seed = None):
+    """
+    Returns the mean of the values and the bootstrap confidence interval (low, high) of the mean.
+    NaN values are left out.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+
+    rng = np.random.default_rng(seed)
+    means = np.concatenate([values[rng.integers(0, len(values), size=(size, len(values)))].mean(axis=1)
+                            for size in chunk_sizes(n_resamples, len(values))])
+    low, high = np.quantile(means, [alpha / 2, 1 - alpha / 2])
+    return values.mean(), low, high
+
+def paired_randomization_test(a, b, n_resamples = 10000, seed = None):
+    """
+    Two-sided paired randomization test of the difference between the means of a and b, which hold the metric
+    of the same queries for two systems. Queries with a NaN for either system are left out.
+
+    Returns the observed difference of the means and the p-value.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    keep = ~(np.isnan(a) | np.isnan(b))
+    differences = a[keep] - b[keep]
+    if len(differences) == 0:
+        return np.nan, np.nan
+
+    # flip the sign of the difference of every query at random
+    rng = np.random.default_rng(seed)
+    resampled = np.concatenate([np.abs((rng.choice([-1.0, 1.0], size=(size, len(differences))) * differences).mean(axis=1))
+                                for size in chunk_sizes(n_resamples, len(differences))])
+
+    observed = differences.mean()
+    p_value = (np.sum(resampled >= abs(observed) - 1e-12) + 1) / (n_resamples + 1)
+    return observed, p_value
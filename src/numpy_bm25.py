@@ -0,0 +1,208 @@
+"""
+An in-memory BM25 engine written with NumPy, used as a JVM-free alternative to pyserini's LuceneSearcher.
+
+The index is a compressed sparse row (CSR) matrix of term frequencies with one row of postings per
+term, together with the precomputed IDF of every term and the length normalization of every document.
+Scores follow Lucene's BM25Similarity (including its lossy encoding of document lengths), so the
+results match the Lucene indexes.
+
+Indexes are exported from the docvectors of the existing Lucene indexes (see export_index) or built
+directly from the .json files (see build_index_from_json) and saved as ../indexes/{language}_numpy.npz.
+
+Example:
+    python numpy_bm25.py export danish
+"""
+
+import os
+import json
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, namedtuple
+import numpy as np
+from analyzers import analyze
+
+# a search result, with the same attributes as the ones of pyserini's hits which we use
+Hit = namedtuple("Hit", ["docid", "score"])
+
+
+# ------------------------------------------------------------------ Lucene's lossy document lengths
+
+def long_to_int4(i):
+    num_bits = i.bit_length()
+    if num_bits < 4:
+        return i
+    shift = num_bits - 4
+    return ((i >> shift) & 0x07) | ((shift + 1) << 3)
+
+def int4_to_long(i):
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+NUM_FREE_VALUES = 255 - long_to_int4(2**31 - 1)
+
+def encode_length(length):
+    """
+    Rounds the document length the way Lucene stores it in the norms (SmallFloat.intToByte4 and back).
+    """
+    if length < NUM_FREE_VALUES:
+        return length
+    return NUM_FREE_VALUES + int4_to_long(long_to_int4(length - NUM_FREE_VALUES))
+
+
+# ------------------------------------------------------------------ building indexes
+
+def save_index(path, docids, doc_vectors, k1 = 0.9, b = 0.4):
+    """
+    Saves the index of the given documents.
+
+    doc_vectors is a list with a dictionary of term frequencies for every document in docids.
+    k1 and b are the BM25 parameters, which default to the ones of pyserini.
+
+    Like Lucene, the IDF and the average document length use the number of documents with a non-empty
+    contents field (docCount), not the number of documents in the index.
+    """
+
+    # exact and encoded document lengths
+    lengths = np.array([sum(vector.values()) for vector in doc_vectors], dtype=np.int64)
+    encoded_lengths = np.array([encode_length(int(length)) for length in lengths], dtype=np.float32)
+    doc_count = np.count_nonzero(lengths)
+    avgdl = lengths.sum() / max(doc_count, 1)
+
+    # collect the postings of every term
+    terms = sorted({term for vector in doc_vectors for term in vector})
+    term_ids = {term: i for i, term in enumerate(terms)}
+    postings = [[] for _ in terms]
+    for doc, vector in enumerate(doc_vectors):
+        for term, tf in vector.items():
+            postings[term_ids[term]].append((doc, tf))
+
+    # build the CSR arrays
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(posting) for posting in postings])
+    indices = np.array([doc for posting in postings for doc, _ in posting], dtype=np.int32)
+    data = np.array([tf for posting in postings for _, tf in posting], dtype=np.float32)
+
+    # precompute the IDF of the terms and the length normalization of the documents
+    df = np.diff(indptr).astype(np.float64)
+    idf = np.log(1 + (doc_count - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norms = (k1 * ((1 - b) + b * encoded_lengths / avgdl)).astype(np.float32)
+
+    np.savez(path, terms=np.array(terms, dtype=str), docids=np.array(docids, dtype=str), indptr=indptr, indices=indices,
+             data=data, idf=idf, norms=norms, params=np.array([k1, b, avgdl]))
+
+def export_index(language, path = None):
+    """
+    Exports the Lucene index of the given language (built with --storeDocvectors) to a NumPy index.
+    This is the only step which needs pyserini and a JVM.
+    """
+    from pyserini.index.lucene import IndexReader
+
+    path = path or f"../indexes/{language}_numpy.npz"
+    reader = IndexReader(f"../indexes/{language}_index")
+
+    docids = []
+    doc_vectors = []
+    for i in range(reader.stats()["documents"]):
+        docid = reader.convert_internal_docid_to_collection_docid(i)
+        docids.append(docid)
+        doc_vectors.append(reader.get_document_vector(docid) or {})
+
+    save_index(path, docids, doc_vectors)
+    print(f"Exported {len(docids)} {language} documents to {path}")
+
+def build_index_from_json(language, path = None):
+    """
+    Builds a NumPy index from the .json files of the given language with the Python analyzers,
+    without using pyserini at all.
+    """
+    path = path or f"../indexes/{language}_numpy.npz"
+
+    docids = []
+    doc_vectors = []
+    for json_path in sorted(glob.glob(f"../indexes/json_files/{language}/*.json")):
+        with open(json_path, 'r') as file:
+            doc = json.load(file)
+        docids.append(doc["id"])
+        doc_vectors.append(Counter(analyze(doc["contents"], language)))
+
+    save_index(path, docids, doc_vectors)
+    print(f"Built a NumPy index of {len(docids)} {language} documents in {path}")
+
+
+# ------------------------------------------------------------------ searching
+
+class NumpyBM25:
+
+    def __init__(self, language, path = None):
+        """
+            Load the NumPy index of the given language.
+        """
+        self.language = language
+        path = path or f"../indexes/{language}_numpy.npz"
+        self.path = path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No NumPy index found at {path}. Create it with export_index or build_index_from_json.")
+
+        index = np.load(path)
+        self.term_ids = {term: i for i, term in enumerate(index["terms"].tolist())}
+        self.docids = index["docids"]
+        self.indptr = index["indptr"]
+        self.indices = index["indices"]
+        self.data = index["data"]
+        self.idf = index["idf"]
+        self.norms = index["norms"]
+
+    def search(self, query, k=10):
+        """
+            Search the query in the index and return the top k results.
+        """
+        if k <= 0:
+            return []
+
+        scores = np.zeros(len(self.docids), dtype=np.float32)
+
+        # add the score of every query term, repeated terms count once per occurrence as in Lucene
+        for term, count in Counter(analyze(query, self.language)).items():
+            if term not in self.term_ids:
+                continue
+            t = self.term_ids[term]
+            docs = self.indices[self.indptr[t]:self.indptr[t + 1]]
+            tfs = self.data[self.indptr[t]:self.indptr[t + 1]]
+            scores[docs] += count * self.idf[t] * tfs / (tfs + self.norms[docs])
+
+        # select the top k documents, ties are broken by the order of the documents as in Lucene
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            # documents tied with the k-th score are taken in the order of the documents
+            kth_score = -np.partition(-scores[matches], k - 1)[k - 1]
+            above = matches[scores[matches] > kth_score]
+            tied = matches[scores[matches] == kth_score][:k - len(above)]
+            matches = np.concatenate([above, tied])
+        matches = matches[np.lexsort((matches, -scores[matches]))]
+
+        return [Hit(str(self.docids[doc]), float(scores[doc])) for doc in matches]
+
+    def batch_search(self, queries, qids, k=10, threads=1):
+        """
+            Search several queries using the given number of threads.
+            Returns a dictionary with the hits keyed by the query ids, like pyserini's batch_search.
+        """
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+            hits = executor.map(lambda query: self.search(query, k=k), queries)
+            return dict(zip(qids, hits))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create NumPy BM25 indexes")
+    parser.add_argument("command", choices=["export", "build"], help="Export the Lucene index or build the index from the .json files.")
+    parser.add_argument("languages", nargs="+")
+    args = parser.parse_args()
+
+    for language in args.languages:
+        if args.command == "export":
+            export_index(language)
+        else:
+            build_index_from_json(language)
@@ -0,0 +1,148 @@
+"""
+Module for the relevance judgments (qrels) of the manual rankings and for runs in TREC format.
+
+The judgments of rankings/{language}.json are compiled once into a dictionary keyed by (query, docid),
+so the grade of a retrieved document is a single lookup. The judgments can be written as TREC qrels
+and search results as TREC runs, which trec_eval style tools can score:
+
+    qrels: {qid} 0 {docid} {grade}
+    run:   {qid} Q0 {docid} {rank} {score} {tag}
+
+The query ids are the query names of the rankings (e.g. "egg+chicken+potato"). Document ids contain
+spaces, so they are URL-quoted in both files.
+"""
+
+import re
+import urllib.parse
+from collections import defaultdict
+
+import pandas as pd
+from ranking_fetcher import fetch_rankings
+
+
+def clean_docid(docid):
+    """
+    Cleans a title of the rankings the same way the file names of the indexed documents are cleaned.
+    """
+    return re.sub(r'[^\w\-_\. ]', '', docid).encode("utf-8").decode("utf-8")
+
+def query_id(query):
+    return query.replace(" ", "+")
+
+def quote_docid(docid):
+    return urllib.parse.quote(docid, safe="")
+
+def unquote_docid(docid):
+    return urllib.parse.unquote(docid)
+
+
+class Qrels:
+
+    def __init__(self, rankings):
+        """
+            Compile the judgments of the rankings, a dictionary with the rankings of each language
+            as returned by ranking_fetcher.fetch_rankings.
+        """
+        self.grades = {} # (query, docid) -> grade
+        self.languages = {} # (query, docid) -> language of the judgment
+        self.docids = set()
+        self.duplicates = set()
+        self.rows = []
+
+        for language, language_rankings in rankings.items():
+            for query_name, ranking in language_rankings.items():
+                query = query_name.replace("+", " ")
+                for title, entry in ranking.items():
+                    docid = clean_docid(title)
+                    self.rows.append({"docid": docid, **entry, "query_name": query_name, "query": query, "language": language})
+                    self.docids.add(docid)
+
+                    # the first judgment of a document is used, like in the original labels data frame
+                    key = (query, docid)
+                    if key in self.grades:
+                        self.duplicates.add(key)
+                    else:
+                        self.grades[key] = entry.get("ranking_manual")
+                        self.languages[key] = language
+
+    @classmethod
+    def from_rankings(cls, languages):
+        return cls(fetch_rankings(languages))
+
+    def labels_df(self):
+        """
+            Returns the judgments as a data frame with one row per judged document.
+        """
+        return pd.DataFrame(self.rows)
+
+    def grade(self, query, docid, warn = True):
+        """
+            Returns the relevance grade of the document for the query, 0 if it is not judged for the query.
+        """
+        if docid not in self.docids:
+            if warn:
+                print(f"WARNING: Docid '{docid}' not found in labels")
+            return 0
+
+        key = (query, docid)
+        if key not in self.grades:
+            return 0
+
+        if warn and key in self.duplicates:
+            print(f"WARNING: More than one relevance score found for query '{query}' and docid '{docid}'")
+
+        return self.grades[key]
+
+    def num_relevant(self, query, language = None):
+        """
+            Returns the number of documents with a grade above 0 for the query, only counting the documents of
+            the given language if language is not None.
+        """
+        return sum(1 for key, grade in self.grades.items() if key[0] == query and grade is not None and grade > 0
+                   and (language is None or self.languages[key] == language))
+
+    def queries(self):
+        return sorted({query for query, _ in self.grades})
+
+    def write_qrels(self, path):
+        """
+            Writes the judgments in TREC qrels format. Documents without a grade are left out.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            for (query, docid), grade in sorted(self.grades.items()):
+                if grade is not None:
+                    file.write(f"{query_id(query)} 0 {quote_docid(docid)} {int(grade)}\n")
+
+def read_qrels(path):
+    """
+    Reads a TREC qrels file into a dictionary keyed by (query, docid).
+    """
+    grades = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            qid, _, docid, grade = line.split()
+            grades[(qid.replace("+", " "), unquote_docid(docid))] = int(grade)
+    return grades
+
+
+def write_run(path, results, tag = "clir"):
+    """
+    Writes search results in TREC run format.
+
+    results is a dictionary with the list of hits (with docid and score attributes) of each query.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        for query, hits in results.items():
+            for rank, hit in enumerate(hits, start=1):
+                file.write(f"{query_id(query)} Q0 {quote_docid(hit.docid)} {rank} {float(hit.score):.6f} {tag}\n")
+
+def read_run(path):
+    """
+    Reads a TREC run file into a dictionary with the (docid, score) pairs of each query, in the order of the ranks.
+    """
+    run = defaultdict(list)
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            qid, _, docid, rank, score, _ = line.split()
+            run[qid.replace("+", " ")].append((int(rank), unquote_docid(docid), float(score)))
+    return {query: [(docid, score) for _, docid, score in sorted(hits)] for query, hits in run.items()}
@@ -1,9 +1,23 @@
 import os
+import asyncio
 import requests
 from bs4 import BeautifulSoup
 import time
 import json
 import re
+from http_cache import HttpCache
+
+class MissingTranslation(ValueError):
+    """
+        Raised by a non-interactive RecipeFetcher when a translation is missing.
+    """
+    def __init__(self, language, word = None):
+        self.language = language
+        self.word = word
+        if word is None:
+            super().__init__(f"Language {language} not supported")
+        else:
+            super().__init__(f"{language.capitalize()} translation for '{word}' not found")
 
 class RecipeFetcher:
     recipe_translations = {
@@ -11,9 +25,38 @@ class RecipeFetcher:
         "danish": "opskrift",
     }
     
-    def __init__(self, language = "english", search_engine = "google"):
+    def __init__(self, language = "english", search_engine = "google", search_url = None, async_options = None, interactive = True, refresh_after = None,
+                 async_fetcher = None, on_page = None):
+        """
+            Initialize the fetcher for the given language.
+            
+            search_url can be used to replace the search engine url, e.g. with a local stand-in server, 
+            and must contain a {query} placeholder. async_options are passed to the AsyncFetcher used by
+            fetch_recipe_links_async. async_fetcher is an optional AsyncFetcher shared with other fetchers,
+            so they share its connections and rate limits. It is not closed by the RecipeFetcher.
+            
+            on_page is an optional function called with the ingredients, the key and the metadata of every
+            recipe page as soon as it has been downloaded, found on disk or failed.
+            
+            If interactive is False, missing translations raise a MissingTranslation error instead of
+            prompting for them, and translations.json is never rewritten.
+            
+            Recipe pages on disk older than refresh_after seconds are revalidated with a conditional request.
+            If refresh_after is None, pages on disk are never fetched again.
+            
+            fetch_recipe_links and fetch_recipe_links_async take an optional set fetched_pages with the keys of the
+            pages fetched by an interrupted crawl of the query. The query is then resumed: the search result page
+            and these pages are used from disk without any request.
+        """
         self.language = language.lower()
+        self.interactive = interactive
         self.search_engine = search_engine
+        self.search_url = search_url
+        self.async_options = async_options or {}
+        self.async_fetcher = async_fetcher
+        self.shared_async_fetcher = async_fetcher is not None
+        self.on_page = on_page
+        self.http_cache = HttpCache(refresh_after)
                 
         # varible for keeping track of requests
         self.num_requests = 0
@@ -21,6 +64,8 @@ class RecipeFetcher:
         # load translations
         self.translations = json.load(open("translations.json", encoding='utf-8'))
         if self.language not in self.translations:
+            if not self.interactive:
+                raise MissingTranslation(self.language)
             add_lang = input(f"Language {self.language} not found. Do you want to add it? (y/n) ")
             if add_lang.lower() in ["y", "yes"]:
                 self.translations[self.language] = {}
@@ -28,7 +73,7 @@ class RecipeFetcher:
                 print(f"Language {self.language} added. Please add ingredient translations to translations.json")
             else:
                 raise ValueError(f"Language {self.language} not supported")
-        else:
+        elif self.interactive:
             # dump to apply encoding to file if translations have been added manually
             json.dump(self.translations, open("translations.json", 'w', encoding='utf-8'), indent=4, sort_keys=True)
             
@@ -37,22 +82,27 @@ class RecipeFetcher:
         os.makedirs(f"{self.recipe_dir}", exist_ok=True)
         self.recipe_key = self.translate("recipe")
             
-    def save(self, content, fname):
+    def clean_fname(self, fname):
         fname = os.path.split(fname)
-        fname = os.path.join(fname[0], re.sub('[^\w\-_\. ]', '', fname[1]))
-        with open(fname, 'w', encoding='utf-8') as fout:
+        return os.path.join(fname[0], re.sub('[^\w\-_\. ]', '', fname[1]))
+            
+    def save(self, content, fname):
+        with open(self.clean_fname(fname), 'w', encoding='utf-8') as fout:
             fout.write(content)
         
     def get_query(self, ingredients):
-        return f"https://www.{self.search_engine}.com/search?q={self.recipe_key}+{'+'.join(ingredients)}"
+        query = f"{self.recipe_key}+{'+'.join(ingredients)}"
+        if self.search_url is not None:
+            return self.search_url.format(query=query)
+        return f"https://www.{self.search_engine}.com/search?q={query}"
     
-    def request(self, url):
+    def request(self, url, headers = None):
         if self.num_requests % 5 == 0:
             time.sleep(10)
         else:
             time.sleep(5)
             
-        response = requests.get(url)
+        response = requests.get(url, headers=headers)
         self.num_requests += 1
         
         return response
@@ -60,6 +110,8 @@ class RecipeFetcher:
     def translate(self, word):
         word = word.lower()
         if (not word in self.translations[self.language]) or (self.translations[self.language][word] == ""):
+            if not self.interactive:
+                raise MissingTranslation(self.language, word)
             add_word = input(f"{self.language.capitalize()} translation for {word} not found. Do you want to add it? (y/n) ")
             if add_word.lower() in ["y", "yes"]:
                 self.translations[self.language][word] = input(f"Please enter {self.language} translation for '{word}': ").lower()
@@ -69,26 +121,41 @@ class RecipeFetcher:
         
         return self.translations[self.language][word]
         
-    def fetch_recipe_links(self, *ingredients):
-        print(f"Fetching recipes for {', '.join(ingredients)} in {self.language}...")
-        
-        # translate ingredients
-        original_ingredients = ingredients
-        ingredients = [self.translate(ingredient) for ingredient in ingredients]
+    def missing_translations(self, words):
+        """
+            Return the words which have no translation in the language of the fetcher.
+        """
+        return [word.lower() for word in words if self.translations[self.language].get(word.lower(), "") == ""]
         
+    def result_dir(self, ingredients):
         # create dir for recipe results
-        recipe_result_dir = f"{self.recipe_dir}/{'+'.join(original_ingredients)}/{self.language}"
+        recipe_result_dir = f"{self.recipe_dir}/{'+'.join(ingredients)}/{self.language}"
         os.makedirs(recipe_result_dir, exist_ok=True)
         
-        # get result page
-        response = self.request(self.get_query(ingredients))
-        self.save(response.text, f"{recipe_result_dir + '/main'}.html")
+        return recipe_result_dir
         
+    def load_search_page(self, path, fetched_pages):
+        """
+            Return the search result page saved by an interrupted crawl of the query, or None if the query is
+            not resumed or the page is not on disk.
+        """
+        if fetched_pages is None or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+    
+    def is_fetched(self, key, path, fetched_pages):
+        # the page was fetched by an interrupted crawl of the query
+        return fetched_pages is not None and key in fetched_pages and os.path.exists(path)
+        
+    def extract_links(self, html):
+        """
+            Extract the metadata of the recipe links on a search result page.
+        """
         # extract all links
-        soup = BeautifulSoup(response.text, "html.parser") 
+        soup = BeautifulSoup(html, "html.parser") 
         links = soup.find_all("a")
         
-        # get recipe links and save html along with metadata
         metadata = {}
         num_recipes = 0
         for link in links:
@@ -107,33 +174,147 @@ class RecipeFetcher:
             metadata[key]["link"] = link["href"].strip("/url?q=").split("&")[0]
             metadata[key]["rank_search_engine"] = num_recipes + 1
             
-            # get recipe page and save if not already exists                
-            if not os.path.exists(f"{recipe_result_dir + '/' + key}.html"):
+            # increment number of recipes
+            num_recipes += 1
+            
+        return metadata
+        
+    def fetch_recipe_links(self, *ingredients, fetched_pages = None):
+        print(f"Fetching recipes for {', '.join(ingredients)} in {self.language}...")
+        
+        # translate ingredients
+        original_ingredients = ingredients
+        ingredients = [self.translate(ingredient) for ingredient in ingredients]
+        
+        # create dir for recipe results
+        recipe_result_dir = self.result_dir(original_ingredients)
+        
+        # get result page, unless it was saved by an interrupted crawl
+        search_path = f"{recipe_result_dir + '/main'}.html"
+        html = self.load_search_page(search_path, fetched_pages)
+        if html is None:
+            response = self.request(self.get_query(ingredients))
+            self.save(response.text, search_path)
+            html = response.text
+        
+        # get recipe links and save html along with metadata
+        metadata = self.extract_links(html)
+        for key in metadata:
+            # get recipe page and save if not already exists or revalidate it if it is stale
+            recipe_path = self.clean_fname(f"{recipe_result_dir + '/' + key}.html")
+            if not self.is_fetched(key, recipe_path, fetched_pages) and not self.http_cache.is_fresh(recipe_path):
                 try:
-                    recipe_response = self.request(metadata[key]["link"])
-                    self.save(recipe_response.text, f"{recipe_result_dir + '/' + key}.html")
+                    recipe_response = self.request(metadata[key]["link"], headers=self.http_cache.request_headers(recipe_path))
+                    self.http_cache.update(recipe_path, recipe_response, self.save)
                     metadata[key]["downloaded"] = True
-                except:
+                except Exception as e:
                     print(f"Could not fetch recipe: '{metadata[key]['title']}' from '{metadata[key]['link']}'")
-                    metadata[key]["downloaded"] = False
+                    metadata[key]["downloaded"] = os.path.exists(recipe_path)
+                    metadata[key]["error"] = repr(e)
             else:
                 metadata[key]["downloaded"] = True
                 
-            # increment number of recipes
             print(f"Added recipe: '{metadata[key]['title']}'")
-            num_recipes += 1
+            if self.on_page is not None:
+                self.on_page(original_ingredients, key, metadata[key])
 
         # save metadata
         json.dump(metadata, open(f"{recipe_result_dir + '/metadata'}.json", 'w', encoding='utf-8'), indent=4, sort_keys=True)
 
         return metadata
     
+    async def fetch_recipe_links_async(self, *ingredients, fetched_pages = None):
+        """
+            Same as fetch_recipe_links, but downloads the recipe pages concurrently.
+            Requests are rate limited per host instead of sleeping before every request.
+        """
+        from async_fetcher import AsyncFetcher
+        
+        if self.async_fetcher is None:
+            self.async_fetcher = AsyncFetcher(**self.async_options)
+        
+        print(f"Fetching recipes for {', '.join(ingredients)} in {self.language}...")
+        
+        # translate ingredients
+        original_ingredients = ingredients
+        ingredients = [self.translate(ingredient) for ingredient in ingredients]
+        
+        # create dir for recipe results
+        recipe_result_dir = self.result_dir(original_ingredients)
+        
+        # get result page, unless it was saved by an interrupted crawl
+        search_path = f"{recipe_result_dir + '/main'}.html"
+        html = self.load_search_page(search_path, fetched_pages)
+        if html is None:
+            response = await self.async_fetcher.get(self.get_query(ingredients))
+            self.save(response.text, search_path)
+            html = response.text
+        
+        # find the recipe pages which have not been downloaded yet or are stale
+        metadata = self.extract_links(html)
+        recipe_paths = {key: self.clean_fname(f"{recipe_result_dir + '/' + key}.html") for key in metadata}
+        missing = [key for key in metadata if not self.is_fetched(key, recipe_paths[key], fetched_pages)
+                   and not self.http_cache.is_fresh(recipe_paths[key])]
+        
+        async def fetch_page(key):
+            # download (or revalidate) the page if it is missing
+            if key in missing:
+                try:
+                    recipe_response = await self.async_fetcher.get(metadata[key]["link"], headers=self.http_cache.request_headers(recipe_paths[key]))
+                    self.http_cache.update(recipe_paths[key], recipe_response, self.save)
+                    metadata[key]["downloaded"] = True
+                except Exception as e:
+                    # record the failure of the page and continue with the others, like the sync path
+                    print(f"Could not fetch recipe: '{metadata[key]['title']}' from '{metadata[key]['link']}'")
+                    metadata[key]["downloaded"] = os.path.exists(recipe_paths[key])
+                    metadata[key]["error"] = repr(e)
+            else:
+                metadata[key]["downloaded"] = True
+                
+            print(f"Added recipe: '{metadata[key]['title']}'")
+            if self.on_page is not None:
+                self.on_page(original_ingredients, key, metadata[key])
+        
+        # fetch the pages concurrently
+        await asyncio.gather(*[fetch_page(key) for key in metadata])
+
+        # save metadata
+        json.dump(metadata, open(f"{recipe_result_dir + '/metadata'}.json", 'w', encoding='utf-8'), indent=4, sort_keys=True)
+
+        return metadata
+    
+    def fetch_all_async(self, queries):
+        """
+            Fetch the recipes of several queries (lists of ingredients) concurrently.
+            
+            Returns the metadata of each query, or the exception of a query which failed (e.g. because its
+            search result page could not be fetched), so one failing query does not abort the others.
+        """
+        async def fetch_all():
+            results = await asyncio.gather(*[self.fetch_recipe_links_async(*ingredients) for ingredients in queries], return_exceptions=True)
+            for ingredients, result in zip(queries, results):
+                if isinstance(result, Exception):
+                    print(f"Could not fetch recipes for {', '.join(ingredients)} in {self.language}: {result!r}")
+            return results
+        
+        try:
+            return asyncio.run(fetch_all())
+        finally:
+            if self.async_fetcher is not None and not self.shared_async_fetcher:
+                self.async_fetcher.close()
+                self.async_fetcher = None
+    
 if __name__ == "__main__":
+    import sys
     rf = RecipeFetcher(language = "chinese")
     
     # get test ingredients
-    for query in open("test_queries.txt", 'r').readlines():
-        ingredients = query.strip().split()
-        rf.fetch_recipe_links(*ingredients)
+    queries = [query.strip().split() for query in open("test_queries.txt", 'r').readlines()]
+    
+    if "--async" in sys.argv:
+        rf.fetch_all_async(queries)
+    else:
+        for ingredients in queries:
+            rf.fetch_recipe_links(*ingredients)
     
     # rf.fetch_recipe_links("chicken", "potato", "carrot")
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Module for extracting schema.org Recipe data (JSON-LD or microdata) from recipe pages.
+"""
+
+import re
+import json
+import html as html_lib
+from bs4 import BeautifulSoup
+
+# JSON-LD blocks are found with a regular expression, so most pages are never parsed as html
+JSON_LD_PATTERN = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+MICRODATA_PATTERN = re.compile(r'itemtype=["\']https?://schema\.org/Recipe["\']', re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# the fields of an extracted recipe
+RECIPE_FIELDS = ["name", "ingredients", "instructions", "prep_time", "cook_time", "total_time", "yield"]
+
+
+def clean(text):
+    """
+    Removes html tags, entities and redundant whitespace from the given text.
+    """
+    text = html_lib.unescape(TAG_PATTERN.sub(" ", str(text)))
+    return " ".join(text.split())
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def is_recipe(item):
+    return isinstance(item, dict) and "Recipe" in as_list(item.get("@type"))
+
+def find_recipe(data):
+    """
+    Finds the first Recipe object in a JSON-LD document.
+    """
+    for item in as_list(data):
+        if is_recipe(item):
+            return item
+        if isinstance(item, dict):
+            # look in @graph and in the main entity of web pages
+            for key in ["@graph", "mainEntity", "mainEntityOfPage"]:
+                recipe = find_recipe(item.get(key))
+                if recipe is not None:
+                    return recipe
+    return None
+
+def instruction_texts(instructions):
+    """
+    Flattens recipeInstructions, which can be a string, a list of strings, HowToSteps or HowToSections.
+    """
+    texts = []
+    for instruction in as_list(instructions):
+        if isinstance(instruction, dict):
+            if "itemListElement" in instruction: # HowToSection
+                texts += instruction_texts(instruction["itemListElement"])
+            else:
+                texts.append(clean(instruction.get("text", instruction.get("name", ""))))
+        else:
+            texts.append(clean(instruction))
+    return [text for text in texts if text != ""]
+
+def from_json_ld(recipe):
+    return {
+        "name": clean(recipe.get("name", "")),
+        "ingredients": [clean(ingredient) for ingredient in as_list(recipe.get("recipeIngredient", recipe.get("ingredients")))],
+        "instructions": instruction_texts(recipe.get("recipeInstructions")),
+        "prep_time": clean(recipe.get("prepTime", "")),
+        "cook_time": clean(recipe.get("cookTime", "")),
+        "total_time": clean(recipe.get("totalTime", "")),
+        "yield": " ".join(clean(value) for value in as_list(recipe.get("recipeYield"))),
+    }
+
+def from_microdata(html_content):
+    soup = BeautifulSoup(html_content, "html.parser")
+    recipe = soup.find(attrs={"itemtype": re.compile(r"schema\.org/Recipe$", re.IGNORECASE)})
+    if recipe is None:
+        return None
+
+    def props(name):
+        values = []
+        for tag in recipe.find_all(attrs={"itemprop": name}):
+            values.append(clean(tag.get("content") or tag.get("datetime") or tag.get_text(separator=" ")))
+        return [value for value in values if value != ""]
+
+    return {
+        "name": (props("name") or [""])[0],
+        "ingredients": props("recipeIngredient") or props("ingredients"),
+        "instructions": props("recipeInstructions"),
+        "prep_time": (props("prepTime") or [""])[0],
+        "cook_time": (props("cookTime") or [""])[0],
+        "total_time": (props("totalTime") or [""])[0],
+        "yield": (props("recipeYield") or [""])[0],
+    }
+
+def extract_recipe(html_content):
+    """
+    Extracts the schema.org Recipe of the given html page.
+
+    Returns a dictionary with the keys in RECIPE_FIELDS, where "ingredients" and "instructions"
+    are lists, or None if the page has no recipe with ingredients.
+    """
+    recipe = None
+
+    # try the JSON-LD blocks first
+    for block in JSON_LD_PATTERN.findall(html_content):
+        try:
+            data = json.loads(block.strip())
+        except json.JSONDecodeError:
+            continue
+        found = find_recipe(data)
+        if found is not None:
+            recipe = from_json_ld(found)
+            break
+
+    # then try microdata
+    if recipe is None and MICRODATA_PATTERN.search(html_content):
+        recipe = from_microdata(html_content)
+
+    if recipe is None or len(recipe["ingredients"]) == 0:
+        return None
+
+    return recipe
@@ -0,0 +1,307 @@
+"""
+Memory-budgeted manager of the searchers and translation models of the retriever.
+
+Every resource (e.g. the LuceneSearcher of a language or the translation model) is registered with a function
+which loads it and a function which releases it. Resources are loaded on first use, and the increase of the
+resident set size (RSS) of the process while loading a resource is recorded as its cost. The cost is kept when
+the resource is released, so room is made for it before it is loaded again, and a reload can only raise it.
+When a resource is loaded and the sum of the costs of the loaded resources exceeds the memory budget, the least
+recently used resources which are not in use are released until the budget is met again:
+
+    resources = ResourceManager(memory_budget=2048)
+    resources.register("searcher:danish", lambda: BM25("danish"), lambda searcher: searcher.close())
+
+    with resources.working_set():
+        with resources.use("searcher:danish") as searcher:
+            hits = searcher.search("kylling")
+
+Resources used within a working_set() (e.g. by one query) are not released while it is open. If they do not fit
+in the budget together, the budget is exceeded with a warning instead of loading and releasing them over and
+over again.
+
+The costs are measured with psutil. They are approximate: the first searcher also pays for starting the JVM,
+memory freed by Python or the JVM is not always returned to the operating system, and resources loaded at the
+same time share their measurements. Every load and eviction is reported as an event (see stats()) and to the
+sinks of instrumentation.py.
+"""
+
+import collections
+import gc
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss():
+    """
+    Returns the resident set size of the process in bytes, or 0 if psutil is not installed.
+    """
+    if psutil is None:
+        return 0
+    return psutil.Process().memory_info().rss
+
+
+class Resource:
+
+    def __init__(self, name, load, unload = None, cost = None):
+        self.name = name
+        self.load = load
+        self.unload = unload
+        self.value = None
+        self.measured = cost is None # the cost is measured when the resource is loaded
+        self.cost = cost or 0 # bytes
+        self.users = 0
+        self.last_used = 0.0 # time.monotonic() of the last use
+        self.loads = 0
+        self.evictions = 0
+        self.stale = False # released as soon as it is no longer in use
+        self.lock = threading.Lock() # held while the resource is loaded or released
+
+
+class ResourceManager:
+
+    def __init__(self, memory_budget = None, max_events = 1000, on_event = None, verbose = False):
+        """
+            Manage resources within memory_budget MB, or without a limit if memory_budget is None.
+
+            on_event is an optional function which is called with every load and eviction event.
+            The last max_events events are kept for stats().
+        """
+        if memory_budget is not None and psutil is None:
+            raise Exception("A memory budget requires psutil to measure the memory of the resources. Install it with: pip install psutil")
+
+        self.memory_budget = memory_budget
+        self.on_event = on_event
+        self.verbose = verbose
+
+        self.resources = {}
+        self.lru = collections.OrderedDict() # loaded resources, least recently used first
+        self.lock = threading.RLock()
+        self.events = collections.deque(maxlen=max_events)
+
+        # start times of the open working sets
+        self.working_sets = collections.Counter()
+        self.over_budget = 0
+
+    def register(self, name, load, unload = None, cost = None):
+        """
+            Register a resource which is loaded with load() and released with unload(value).
+            cost is the memory of the resource in bytes, if it is known. Otherwise it is measured when it is loaded.
+        """
+        self.resources[name] = Resource(name, load, unload, cost)
+
+    def budget_bytes(self):
+        return None if self.memory_budget is None else self.memory_budget * 2 ** 20
+
+    def loaded_bytes(self):
+        with self.lock:
+            return sum(self.resources[name].cost for name in self.lru)
+
+    def is_loaded(self, name):
+        return self.resources[name].value is not None
+
+    @contextmanager
+    def working_set(self):
+        """
+            Keep the resources used until the end of the block loaded, unless they are released by invalidate().
+        """
+        start = time.monotonic()
+        with self.lock:
+            self.working_sets[start] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.working_sets[start] -= 1
+                if self.working_sets[start] == 0:
+                    del self.working_sets[start]
+
+    def is_protected(self, resource):
+        # called with the lock held
+        if resource.users > 0:
+            return True
+        return len(self.working_sets) > 0 and resource.last_used >= min(self.working_sets)
+
+    @contextmanager
+    def use(self, name):
+        """
+            Load the resource if needed and keep it loaded while it is used.
+        """
+        resource = self.resources[name]
+
+        with resource.lock:
+            loading = resource.value is None
+            if loading:
+                # make room for the known cost of a resource which was released before
+                self.enforce_budget(needed=resource.cost)
+                self.load(resource)
+            with self.lock:
+                resource.users += 1
+                resource.last_used = time.monotonic()
+                self.lru.move_to_end(name)
+            value = resource.value
+
+        # make room for the measured cost of the resource, it can not be evicted while it is in use.
+        # Resources are only evicted to load others, so loaded resources which exceed the budget are not thrashed.
+        if loading:
+            self.enforce_budget()
+
+        try:
+            yield value
+        finally:
+            with self.lock:
+                resource.users -= 1
+                release = resource.stale and resource.users == 0
+            if release:
+                self.evict(name, force=True)
+
+    def get(self, name):
+        """
+            Return the resource, loading it if needed. The resource is not protected against eviction, use use() for that.
+        """
+        with self.use(name) as value:
+            return value
+
+    def load(self, resource):
+        # called with the lock of the resource held
+        with instrumentation.span("load_resource", resource=resource.name):
+            before = rss()
+            t0 = time.time()
+            value = resource.load()
+            seconds = time.time() - t0
+            cost = max(rss() - before, 0)
+
+        with self.lock:
+            resource.value = value
+            # a reload may be measured lower, e.g. because memory of the first load was not returned to the system
+            if resource.measured:
+                resource.cost = max(resource.cost, cost)
+            resource.loads += 1
+            self.lru[resource.name] = True
+
+        instrumentation.count("resource_loads", resource=resource.name)
+        self.event("load", resource, seconds=seconds)
+
+    def evict(self, name, force = False):
+        """
+            Release the resource unless it is in use, or used by an open working set and force is False.
+            Returns True if it was released.
+        """
+        resource = self.resources[name]
+        if not resource.lock.acquire(blocking=False):
+            return False
+
+        try:
+            with self.lock:
+                if resource.value is None or resource.users > 0 or (not force and self.is_protected(resource)):
+                    return False
+                value = resource.value
+                resource.value = None
+                resource.stale = False
+                self.lru.pop(name, None)
+
+            t0 = time.time()
+            if resource.unload is not None:
+                resource.unload(value)
+            del value
+            gc.collect()
+
+            resource.evictions += 1
+            instrumentation.count("resource_evictions", resource=name)
+            self.event("evict", resource, seconds=time.time() - t0)
+            return True
+        finally:
+            resource.lock.release()
+
+    def invalidate(self, name):
+        """
+            Release the resource, e.g. because the index of a searcher has been rebuilt, so it is loaded
+            again on its next use. A resource which is in use is released when its last user is done.
+        """
+        resource = self.resources[name]
+        with self.lock:
+            if resource.value is None:
+                return
+            resource.stale = True
+        self.evict(name, force=True)
+
+    def enforce_budget(self, needed = 0):
+        """
+            Evict the least recently used resources until the loaded resources and needed more bytes fit in the
+            memory budget. Resources in use or in an open working set are not evicted; if they do not fit, the
+            budget is exceeded and a warning is counted (see stats()).
+        """
+        budget = self.budget_bytes()
+        if budget is None:
+            return
+
+        with self.lock:
+            candidates = list(self.lru)
+
+        for name in candidates:
+            if self.loaded_bytes() + needed <= budget:
+                return
+            self.evict(name)
+
+        if self.loaded_bytes() + needed > budget:
+            with self.lock:
+                self.over_budget += 1
+            instrumentation.count("resource_over_budget")
+            if self.verbose:
+                print(f"The resources in use need {(self.loaded_bytes() + needed) / 2 ** 20:.0f} MB, more than the budget of "
+                      f"{self.memory_budget} MB")
+
+    def event(self, event, resource, seconds):
+        record = {
+            "event": event,
+            "resource": resource.name,
+            "time": time.time(),
+            "seconds": seconds,
+            "cost_mb": resource.cost / 2 ** 20,
+            "loaded_mb": self.loaded_bytes() / 2 ** 20,
+            "rss_mb": rss() / 2 ** 20,
+        }
+        self.events.append(record)
+
+        if self.verbose:
+            verb = "Loaded" if event == "load" else "Evicted"
+            print(f"{verb} {resource.name} ({record['cost_mb']:.0f} MB) in {seconds:.2f} seconds, "
+                  f"{record['loaded_mb']:.0f} MB loaded in total")
+        if self.on_event is not None:
+            self.on_event(record)
+
+    def load_all(self):
+        """
+            Load all registered resources in the order they were registered, within the budget.
+        """
+        for name in self.resources:
+            self.get(name)
+
+    def close(self):
+        """
+            Release all resources which are not in use.
+        """
+        for name in list(self.resources):
+            self.evict(name, force=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "budget_mb": self.memory_budget,
+                "loaded_mb": self.loaded_bytes() / 2 ** 20,
+                "rss_mb": rss() / 2 ** 20,
+                "loads": sum(resource.loads for resource in self.resources.values()),
+                "evictions": sum(resource.evictions for resource in self.resources.values()),
+                "over_budget": self.over_budget,
+                "resources": {name: {"loaded": resource.value is not None, "cost_mb": resource.cost / 2 ** 20,
+                                     "users": resource.users, "loads": resource.loads, "evictions": resource.evictions}
+                              for name, resource in self.resources.items()},
+                "events": list(self.events)[-10:],
+            }
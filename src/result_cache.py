@@ -0,0 +1,192 @@
+"""
+This module implements an in-process cache for the results of the CrossLanguageRetriever.
+
+Entries are kept in an LRU dictionary and expire after a time to live. Every entry belongs to a
+generation of the indexes (the segments_N file of a Lucene index, or the modification time of a NumPy
+index), so the cache empties itself when an index is rebuilt, and calls on_invalidate with the paths of the
+rebuilt indexes so their searchers can be reopened.
+
+Cached values are shared by all threads, so they should be immutable (e.g. tuples of hits).
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+    Returns the normalized query used in the cache keys, the lowercased terms in their order.
+    The terms are neither sorted nor deduplicated, as the translations and the BM25 scores depend
+    on their order and repetitions.
+    """
+    return " ".join(query.lower().split())
+
+def index_generation(path):
+    """
+    Returns an identifier of the current version of the index at path, or None if there is no index.
+    """
+    if os.path.isdir(path):
+        # the commit point of a Lucene index is the segments_N file with the highest generation (base 36)
+        segments = [name for name in os.listdir(path) if name.startswith("segments_")]
+        if len(segments) == 0:
+            return None
+        latest = max(segments, key=lambda name: int(name[len("segments_"):], 36))
+        return (latest, os.path.getmtime(os.path.join(path, latest)))
+    elif os.path.exists(path):
+        return (os.path.getsize(path), os.path.getmtime(path))
+    return None
+
+def approximate_size(value):
+    """
+    Returns the approximate number of bytes used by a cached value.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    elif hasattr(value, "docid"):
+        # search hits
+        size += sys.getsizeof(value.docid)
+    return size
+
+
+class ResultCache:
+
+    def __init__(self, index_paths, max_size = 1024, ttl = 3600, check_interval = 5, on_invalidate = None):
+        """
+            Initialize the cache.
+
+            Parameters
+            ---------
+            index_paths:
+                The paths of the indexes the results come from
+            max_size:
+                The number of results kept in the cache
+            ttl:
+                The number of seconds a result is kept, None to keep results until they are evicted
+            check_interval:
+                The minimum number of seconds between two checks of the index generations
+            on_invalidate:
+                An optional function which is called with the paths of the indexes which have been rebuilt
+        """
+        self.index_paths = index_paths
+        self.on_invalidate = on_invalidate
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.generation = self.index_generations()
+        self.last_check = time.monotonic()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.bytes = 0
+
+    def index_generations(self):
+        return tuple(index_generation(path) for path in self.index_paths)
+
+    def check_generation(self):
+        """
+            Empty the cache if an index has been rebuilt. The indexes are checked at most every check_interval seconds.
+            Returns the paths of the rebuilt indexes. Called with the lock held.
+        """
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return []
+        self.last_check = now
+
+        generation = self.index_generations()
+        if generation == self.generation:
+            return []
+
+        changed = [path for path, old, new in zip(self.index_paths, self.generation, generation) if old != new]
+        self.generation = generation
+        self.memory.clear()
+        self.bytes = 0
+        self.invalidations += 1
+        return changed
+
+    def invalidate(self, changed):
+        # called without the lock, so the function may take its time
+        if len(changed) > 0 and self.on_invalidate is not None:
+            self.on_invalidate(changed)
+
+    def get(self, key):
+        """
+            Return the cached result or None if it is not in the cache.
+        """
+        with self.lock:
+            changed = self.check_generation()
+
+            value = None
+            if key in self.memory:
+                value, created, size = self.memory[key]
+                if self.ttl is None or time.monotonic() - created < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                else:
+                    # the entry has expired
+                    del self.memory[key]
+                    self.bytes -= size
+                    self.expirations += 1
+                    value = None
+
+            if value is None:
+                self.misses += 1
+
+        self.invalidate(changed)
+        return value
+
+    def put(self, key, value):
+        """
+            Add a result to the cache and evict the least recently used results.
+        """
+        size = approximate_size(value)
+
+        with self.lock:
+            changed = self.check_generation()
+
+            if key in self.memory:
+                self.bytes -= self.memory[key][2]
+            self.memory[key] = (value, time.monotonic(), size)
+            self.memory.move_to_end(key)
+            self.bytes += size
+
+            while len(self.memory) > self.max_size:
+                _, (_, _, evicted_size) = self.memory.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+        self.invalidate(changed)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+            Return the counters, the hit ratio and the approximate memory use of the cache.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / total if total > 0 else 0.0,
+            "size": len(self.memory),
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,163 @@
+"""
+Module for persisted retrieval runs.
+
+A run holds the merged and per-language results of a set of queries for one translation approach. Runs are
+saved as ../runs/{approach}_k{k}_{key}.json, where the key is a hash of the version of the indexes, of the
+queries and of the translator (the sources of the dictionary or the hf model), so a run is reused until one
+of them changes. Missing runs of several approaches are
+created in parallel, one worker process per approach.
+
+    python runs.py dictionary hf translatepy
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import compiled_dictionary
+from BM25 import index_path
+from result_cache import index_generation
+from translator import HF_MODELS, DEFAULT_HF_MODEL
+
+LANGUAGES = ["english", "czech", "chinese", "danish"]
+RUNS_DIR = "../runs"
+
+# a hit of a stored run, with the attributes of the hits of the retriever which are used for evaluation
+RunHit = namedtuple("RunHit", ["docid", "score", "language"])
+
+
+def index_version(languages = LANGUAGES, engine = "lucene"):
+    """
+    Returns a hash of the generations of the indexes of the languages.
+    """
+    paths = [index_path(language, engine) for language in languages]
+    return hashlib.sha1(json.dumps([index_generation(path) for path in paths]).encode("utf-8")).hexdigest()[:12]
+
+def queries_hash(queries):
+    return hashlib.sha1("\n".join(queries).encode("utf-8")).hexdigest()[:12]
+
+def translator_signature(approach, hf_model = DEFAULT_HF_MODEL):
+    """
+    Returns a string which changes when the translations of the approach change.
+    hf_model is the model the Translator loads for the "hf" approach.
+    """
+    if approach == "dictionary":
+        # the translations.bin is compiled from these files
+        return json.dumps(compiled_dictionary.source_signature(["../translations.json", "../translations_compiled.json"]), sort_keys=True)
+    if approach == "hf":
+        if hf_model not in HF_MODELS:
+            raise Exception(f'The model {hf_model} is not supported.')
+        return HF_MODELS[hf_model]
+    return approach
+
+def run_path(approach, k, queries, languages = LANGUAGES, engine = "lucene", hf_model = DEFAULT_HF_MODEL):
+    key = f"{index_version(languages, engine)} {queries_hash(queries)} {engine} {translator_signature(approach, hf_model)}"
+    key = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(RUNS_DIR, f"{approach}_k{k}_{key}.json")
+
+
+def create_run(approach, queries, k = 10, languages = LANGUAGES, engine = "lucene", threads = 4, hf_model = DEFAULT_HF_MODEL):
+    """
+    Searches the queries with the given translation approach and returns the run as a JSON serializable dictionary.
+    This runs in a worker process, so everything is loaded here.
+    """
+    from cross_language_retriever import CrossLanguageRetriever
+
+    t0 = time.time()
+    retriever = CrossLanguageRetriever(languages, translation_approach=approach, engine=engine, result_cache=False,
+                                       hf_model=hf_model, verbose=False)
+    results_merged, results_by_language = retriever.batch_search(queries, k=k, threads=threads)
+    retriever.close()
+
+    results = {}
+    for query in queries:
+        results[query] = {
+            "merged": [[hit.docid, float(hit.score), hit.language] for hit in results_merged[query]],
+            "by_language": {language: [[hit.docid, float(hit.score)] for hit in hits]
+                            for language, hits in zip(languages, results_by_language[query])},
+        }
+
+    return {
+        "approach": approach,
+        "k": k,
+        "engine": engine,
+        "languages": languages,
+        "index_version": index_version(languages, engine),
+        "queries_sha1": queries_hash(queries),
+        "translator": translator_signature(approach, hf_model),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "seconds": time.time() - t0,
+        "queries": queries,
+        "results": results,
+    }
+
+def save_run(run, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(run, file, ensure_ascii=False)
+
+def load_run(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def run_results(run):
+    """
+    Returns the results of a run in the form of CrossLanguageRetriever.batch_search, with RunHits.
+    """
+    results_merged = {}
+    results_by_language = {}
+    for query, result in run["results"].items():
+        results_merged[query] = [RunHit(docid, score, language) for docid, score, language in result["merged"]]
+        results_by_language[query] = [[RunHit(docid, score, language) for docid, score in result["by_language"][language]]
+                                      for language in run["languages"]]
+    return results_merged, results_by_language
+
+
+def load_runs(approaches, queries, k = 10, languages = LANGUAGES, engine = "lucene", force = False, hf_model = DEFAULT_HF_MODEL,
+              verbose = True):
+    """
+    Returns the runs of the approaches, keyed by approach. Runs which are not saved yet (or all runs if force
+    is True) are created in parallel, one worker process per approach. The workers share the translation cache,
+    see translation_cache.py.
+    """
+    paths = {approach: run_path(approach, k, queries, languages, engine, hf_model) for approach in approaches}
+    missing = [approach for approach in approaches if force or not os.path.exists(paths[approach])]
+
+    if len(missing) > 0:
+        if verbose:
+            print(f"Creating the runs of {', '.join(missing)}...")
+
+        # the worker processes are spawned, so they start their own JVM
+        with ProcessPoolExecutor(max_workers=len(missing), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {approach: executor.submit(create_run, approach, queries, k, languages, engine, 4, hf_model) for approach in missing}
+            for approach, future in futures.items():
+                run = future.result()
+                save_run(run, paths[approach])
+                if verbose:
+                    print(f"Created the run of {approach} in {run['seconds']:.1f} seconds: {paths[approach]}")
+
+    runs = {}
+    for approach in approaches:
+        runs[approach] = load_run(paths[approach])
+        if verbose and approach not in missing:
+            print(f"Using the saved run of {approach}: {paths[approach]}")
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the retrieval runs of the test queries")
+    parser.add_argument("approaches", nargs="+", choices=["dictionary", "hf", "translatepy"])
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=str, default="../test_queries.txt")
+    parser.add_argument("--force", action="store_true", help="Create the runs even if they are saved already.")
+    parser.add_argument("--hf-model", type=str, default=DEFAULT_HF_MODEL, choices=list(HF_MODELS), help="The model of the hf approach.")
+    args = parser.parse_args()
+
+    queries = [line.strip() for line in open(args.queries, "r").readlines() if line.strip() != ""]
+    load_runs(args.approaches, queries, k=args.k, force=args.force, hf_model=args.hf_model)
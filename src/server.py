@@ -0,0 +1,200 @@
+"""
+This module implements a small HTTP server which keeps a CrossLanguageRetriever loaded between queries.
+
+Starting the retriever (the JVM, the Lucene searchers and possibly the translation models) takes much
+longer than answering a query, so the server loads everything once and answers queries with JSON:
+
+    GET /search?q=eggplant+onion&k=10&deadline=0.5
+    GET /health
+    GET /metrics    (Prometheus text format, if a PrometheusSink is configured, see instrumentation.py)
+
+main.py --serve starts the server and main.py uses it as a client when it is running. The client sends
+the options it wants (translation approach, engine, normalization etc.), and the server refuses the query
+with 409 Conflict if it was started with other options, so the client searches locally instead.
+
+Requests are answered concurrently; the retriever and its caches are thread-safe.
+"""
+
+import json
+import socket
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrumentation
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def results_to_json(languages, results_merged, results_by_language, info = None):
+    """
+    Converts the results of CrossLanguageRetriever.search to a JSON serializable dictionary.
+    """
+    def hit_to_json(hit, language):
+        return {"docid": hit.docid, "score": float(hit.score), "language": language}
+
+    return {
+        "results": [dict(hit_to_json(hit, hit.language), raw_score=hit.raw_score) for hit in results_merged],
+        "results_by_language": {language: [hit_to_json(hit, language) for hit in hits]
+                                for language, hits in zip(languages, results_by_language)},
+        "timings": (info or {}).get("timings", {}),
+        "timed_out": (info or {}).get("timed_out", []),
+    }
+
+
+def retriever_options(retriever):
+    """
+    Returns the options of the retriever which change the results, as strings like in a query string.
+    """
+    return {
+        "approach": retriever.translation_approach,
+        "engine": retriever.engine,
+        "normalization": retriever.normalization,
+        "early_termination": str(retriever.early_termination).lower(),
+        "cache": str(retriever.result_cache is not None).lower(),
+        "fallback": str(retriever.fallback_translation).lower(),
+    }
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, content):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(url.query)
+
+        if url.path == "/health":
+            result_cache = self.server.retriever.result_cache
+            self.send_json(200, {"status": "ok", "languages": self.server.retriever.languages,
+                                 "uptime": time.time() - self.server.started,
+                                 "cache": result_cache.stats() if result_cache is not None else None,
+                                 "resources": self.server.retriever.resources.stats()})
+            return
+
+        if url.path == "/metrics":
+            prometheus = instrumentation.get_sink(instrumentation.PrometheusSink)
+            if prometheus is None:
+                self.send_json(404, {"error": "Metrics are not enabled."})
+                return
+            body = prometheus.text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if url.path != "/search":
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        query = params.get("q", [""])[0].strip()
+        if query == "":
+            self.send_json(400, {"error": "The query parameter q is missing."})
+            return
+        try:
+            k = int(params.get("k", ["10"])[0])
+        except ValueError:
+            k = 0
+        if k <= 0:
+            self.send_json(400, {"error": "The parameter k must be a positive integer."})
+            return
+        try:
+            deadline = float(params["deadline"][0]) if "deadline" in params else self.server.deadline
+        except ValueError:
+            self.send_json(400, {"error": "The parameter deadline must be a number of seconds."})
+            return
+
+        # refuse queries which ask for other options than the ones of the retriever
+        options = retriever_options(self.server.retriever)
+        mismatch = {name: params[name][0] for name in options if name in params and params[name][0] != options[name]}
+        if len(mismatch) > 0:
+            self.send_json(409, {"error": f"The server uses other options: {options}", "options": options})
+            return
+
+        t0 = time.time()
+        try:
+            # the retriever is shared by all requests
+            results_merged, results_by_language, info = self.server.retriever.search(query, k=k, return_info=True, deadline=deadline)
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+
+        response = results_to_json(self.server.retriever.languages, results_merged, results_by_language, info)
+        response["query"] = query
+        response["seconds"] = time.time() - t0
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(retriever, host = DEFAULT_HOST, port = DEFAULT_PORT, deadline = None, verbose = True):
+    """
+    Serve queries with the given retriever until interrupted.
+
+    deadline is the default number of seconds a query may take, see CrossLanguageRetriever.search.
+    """
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    server.retriever = retriever
+    server.started = time.time()
+    server.deadline = deadline
+    server.verbose = verbose
+
+    print(f"Serving {', '.join(retriever.languages)} on http://{host}:{port}/search?q=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        retriever.close()
+
+
+def query_server(query, k = 10, host = DEFAULT_HOST, port = DEFAULT_PORT, deadline = None, timeout = 60, options = None):
+    """
+    Send the query to a running server. Returns the JSON response, or None if no server is running,
+    it does not answer within timeout seconds or it uses other options.
+
+    options is a dictionary with the options the results must be computed with, see retriever_options.
+    """
+    params = {"q": query, "k": k}
+    if deadline is not None:
+        params["deadline"] = deadline
+    for name, value in (options or {}).items():
+        params[name] = str(value).lower() if isinstance(value, bool) else value
+    url = f"http://{host}:{port}/search?" + urllib.parse.urlencode(params)
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            try:
+                return json.loads(response.read().decode("utf-8"))
+            except ValueError:
+                # not our server, e.g. another service on the port
+                print(f"{host}:{port} did not answer with JSON, searching locally")
+                return None
+    except urllib.error.HTTPError as e:
+        try:
+            error = json.loads(e.read().decode('utf-8'))
+        except ValueError:
+            error = None
+        if not isinstance(error, dict) or "error" not in error:
+            # not our server, e.g. another service on the port or a proxy
+            print(f"{host}:{port} answered with status {e.code} and no error of the server, searching locally")
+            return None
+        if e.code == 409:
+            print(f"The server at {host}:{port} uses other options ({error['options']}), searching locally")
+            return None
+        raise Exception(f"The server failed to answer the query: {error['error']}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError, socket.timeout):
+        return None
@@ -0,0 +1,211 @@
+"""
+This module translates many terms at the same time with an online translation service.
+
+Translating a query term by term costs one round trip per term and language, so the calls are sent
+concurrently with a bounded number of calls in flight. Every call has a timeout, failed calls are retried
+with exponential backoff and jitter, and a term which is already being translated into a language is not
+requested again - the callers share the call in flight.
+
+The timeout is passed to the translation function, which should put it on its HTTP request (LibreTranslate
+does), so a slow call ends by itself. Functions which can not be given a timeout (translatepy) may hang, so
+every call runs in its own daemon thread and holds one of the max_concurrency slots only until it finishes
+or its timeout expires. An expired call is abandoned: it gives up its slot, but it is not sent again - the
+retry waits for it to finish instead of piling up threads.
+
+LibreTranslate can be used instead of translatepy to translate with a self-hosted (or stand-in) server.
+"""
+
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+import requests
+
+# the result of a translation, with the attribute of translatepy's results which we use
+TranslationResult = namedtuple("TranslationResult", ["result"])
+
+ISO_CODES = {"english": "en", "czech": "cs", "chinese": "zh", "danish": "da"}
+
+
+class LibreTranslate:
+
+    def __init__(self, url = "http://localhost:5000", api_key = None, timeout = 10):
+        """
+            A client of a LibreTranslate server with the same translate method as translatepy's Translator.
+        """
+        self.url = url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def translate(self, text, destination_language, source_language = "english", timeout = None):
+        data = {"q": text, "source": ISO_CODES.get(source_language, source_language),
+                "target": ISO_CODES.get(destination_language, destination_language), "format": "text"}
+        if self.api_key is not None:
+            data["api_key"] = self.api_key
+
+        response = self.session.post(f"{self.url}/translate", json=data, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return TranslationResult(response.json()["translatedText"])
+
+
+class Call:
+
+    def __init__(self, slots, translate_fn, *args):
+        """
+            Run translate_fn(*args) in a daemon thread, holding one of the slots until it finishes or is abandoned.
+            The slot must already be acquired. The result is set on self.future.
+        """
+        self.slots = slots
+        self.future = Future()
+        self.holds_slot = True
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, args=(translate_fn, args), daemon=True).start()
+
+    def run(self, translate_fn, args):
+        try:
+            self.future.set_result(translate_fn(*args))
+        except BaseException as e:
+            self.future.set_exception(e)
+        finally:
+            self.abandon()
+
+    def abandon(self):
+        """
+            Give up the slot of the call, which may keep running in its thread.
+        """
+        with self.lock:
+            if self.holds_slot:
+                self.holds_slot = False
+                self.slots.release()
+
+
+class ConcurrentTermTranslator:
+
+    def __init__(self, translate_fn, max_concurrency = 8, timeout = 10, retries = 2, backoff = 0.5):
+        """
+            Initialize the translator.
+
+            Parameters
+            ---------
+            translate_fn:
+                The function translate_fn(term, language, timeout) which translates one term within timeout seconds
+            max_concurrency:
+                The maximum number of calls in flight, not counting the calls abandoned after their timeout
+            timeout:
+                The number of seconds to wait for a single call
+            retries:
+                The number of times a failed or timed out call is retried
+            backoff:
+                The base of the exponential backoff between retries in seconds
+        """
+        self.translate_fn = translate_fn
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # the calls run in their own threads and hold one of the slots, the retries are handled by a pool
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.workers = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        # translations in flight and their deadlines keyed by (term, language)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        # counters
+        self.num_calls = 0
+        self.num_retries = 0
+        self.num_timeouts = 0
+        self.num_coalesced = 0
+
+    def _translate(self, term, language, deadline = None):
+        """
+            Translate the term, retrying with exponential backoff and jitter.
+            If deadline (a time.monotonic() value) is given, no call or retry runs past it.
+        """
+        def remaining():
+            return self.timeout if deadline is None else min(self.timeout, deadline - time.monotonic())
+
+        call = None
+        for attempt in range(self.retries + 1):
+            timeout = remaining()
+            if timeout <= 0:
+                raise TimeoutError(f"Translating '{term}' into {language} ran out of time after {attempt} attempts")
+
+            # only send the term again once the previous call has finished
+            if call is None or call.future.done():
+                if not self.slots.acquire(timeout=timeout):
+                    raise TimeoutError(f"No slot was free to translate '{term}' into {language} within {timeout:.3f} seconds")
+                with self.lock:
+                    self.num_calls += 1
+                call = Call(self.slots, self.translate_fn, term, language, timeout)
+
+            try:
+                return call.future.result(timeout=timeout)
+            except TimeoutError:
+                # the call could not keep its timeout, it gives up its slot and the next attempt waits for it
+                call.abandon()
+                with self.lock:
+                    self.num_timeouts += 1
+                if attempt == self.retries:
+                    raise TimeoutError(f"Translating '{term}' into {language} timed out after {self.retries + 1} attempts")
+            except Exception:
+                if attempt == self.retries:
+                    raise
+
+            with self.lock:
+                self.num_retries += 1
+            time.sleep(max(min(self.backoff * 2 ** attempt + random.uniform(0, self.backoff), remaining()), 0))
+
+    def submit(self, term, language, deadline = None):
+        """
+            Start translating the term into the language and return a future with the translation.
+            deadline is a time.monotonic() value after which no call or retry is started.
+
+            If the term is already being translated with a deadline which is not earlier, the future of that
+            translation is returned, so the caller can not fail because of the shorter deadline of another caller.
+        """
+        key = (term, language)
+        with self.lock:
+            if key in self.in_flight:
+                future, flight_deadline = self.in_flight[key]
+                if flight_deadline is None or (deadline is not None and flight_deadline >= deadline):
+                    self.num_coalesced += 1
+                    return future
+            future = self.workers.submit(self._translate, term, language, deadline)
+            self.in_flight[key] = (future, deadline)
+
+        future.add_done_callback(lambda future: self._done(key, future))
+        return future
+
+    def _done(self, key, future):
+        with self.lock:
+            if key in self.in_flight and self.in_flight[key][0] is future:
+                del self.in_flight[key]
+
+    def translate_many(self, terms, languages, timeout = None):
+        """
+            Translate all terms into all languages concurrently.
+            Returns a dictionary with the translations keyed by (term, language).
+
+            If timeout is given, a TimeoutError is raised if the translations take longer than timeout seconds,
+            and the calls and retries of the terms are not continued past it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures = {(term, language): self.submit(term, language, deadline) for language in languages for term in terms}
+        if deadline is None:
+            return {key: future.result() for key, future in futures.items()}
+        return {key: future.result(timeout=max(deadline - time.monotonic(), 0)) for key, future in futures.items()}
+
+    def stats(self):
+        return {
+            "calls": self.num_calls,
+            "retries": self.num_retries,
+            "timeouts": self.num_timeouts,
+            "coalesced": self.num_coalesced,
+        }
+
+    def close(self):
+        self.workers.shutdown(wait=False)
@@ -0,0 +1,116 @@
+"""
+This module implements a persistent, size-bounded cache for translations.
+
+The cache has two layers: an in-process LRU dictionary and an SQLite file on disk,
+so translations survive restarts of the program. Entries are keyed by the text,
+the target language, the translation backend and the model.
+
+Several processes may use the same file (e.g. the workers of runs.load_runs). The file is opened
+in WAL mode with a busy timeout, so they wait for each other's writes instead of failing with
+"database is locked".
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class TranslationCache:
+
+    def __init__(self, path = "../translation_cache.sqlite", max_size = 10000, busy_timeout = 30):
+        """
+            Initialize the cache.
+
+            path is the SQLite file used for the on-disk layer (None disables it) and
+            max_size is the number of entries kept in the in-process LRU layer.
+            busy_timeout is the number of seconds to wait for another process which writes to the file.
+        """
+
+        self.path = path
+        self.max_size = max_size
+
+        # in-process LRU layer
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # on-disk layer
+        self.db = None
+        if self.path is not None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS translations (
+                                   text TEXT, language TEXT, backend TEXT, model TEXT, translation TEXT,
+                                   PRIMARY KEY (text, language, backend, model))""")
+            self.db.commit()
+
+    def get(self, text, language, backend, model = ""):
+        """
+            Return the cached translation or None if it is not in the cache.
+        """
+        key = (text, language, backend, model)
+
+        with self.lock:
+            # look in memory first
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            # then look on disk
+            if self.db is not None:
+                row = self.db.execute("SELECT translation FROM translations WHERE text=? AND language=? AND backend=? AND model=?", key).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, text, language, backend, model, translation):
+        """
+            Add a translation to both layers of the cache.
+        """
+        key = (text, language, backend, model)
+
+        with self.lock:
+            self._remember(key, translation)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)", key + (translation,))
+                self.db.commit()
+
+    def _remember(self, key, translation):
+        """
+            Add an entry to the in-process layer and evict the least recently used entries.
+        """
+        self.memory[key] = translation
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+            Return the hit, miss and eviction counters.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total > 0 else 0.0,
+            "size": len(self.memory),
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -4,30 +4,69 @@ This module is responsible for translating the input text
 
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from translation_cache import TranslationCache
+import compiled_dictionary
+from term_translation import ConcurrentTermTranslator, LibreTranslate
+import instrumentation
+
+# the available hf models
+HF_MODELS = {
+    "m2m100" : "facebook/m2m100_418M",
+    "nllb200" :"facebook/nllb-200-distilled-600M",
+}
+DEFAULT_HF_MODEL = "nllb200"
 
 
 class Translator():
 
-    def __init__(self, languages, approach="dictionary", hf_model = "nllb200", by_term = True, verbose = True):
+    def __init__(self, languages, approach="dictionary", hf_model = DEFAULT_HF_MODEL, by_term = True, cache = True, cache_path = "../translation_cache.sqlite",
+                 pytranslator = None, max_concurrency = 8, timeout = 10, retries = 2,
+                 compiled_path = "../translations_compiled.json", min_confidence = 0.5,
+                 dictionary_path = "../translations.bin", verbose = True):
         """
             Initialize the translator for the given languages.
             
             OBS: Using a non-dictionary approach requires the transformers library to be installed and will download the model which can take some time and requiere a lot of space.
+
+            If cache is True, translations made by the "hf" and "translatepy" approaches are stored in a
+            TranslationCache at cache_path, which is shared by all backends and persists between runs.
+
+            The "translatepy" approach translates the terms concurrently with at most max_concurrency calls in flight,
+            each with a timeout of timeout seconds and retried up to retries times (see term_translation.py).
+            pytranslator replaces translatepy's Translator, e.g. with a term_translation.LibreTranslate client.
+
+            translate(query, language, timeout=None) translates a query. If timeout is given, a translation which
+            can not be made within timeout seconds raises a TimeoutError (the hf model stops waiting for the model,
+            translatepy stops waiting for its calls and does not retry them after the timeout).
+
+            The "dictionary" approach also uses the compiled dictionary at compiled_path if it exists (see
+            vocabulary_compiler.py), with the entries with a confidence of at least min_confidence.
+            Entries of translations.json always take precedence. Both are compiled into the memory-mapped
+            dictionary at dictionary_path, which is rebuilt when they change (see compiled_dictionary.py).
         """
 
         self.languages = languages
         self.verbose = verbose
         self.by_term = by_term
+        self.approach = approach
+
+        # initialize the translation cache
+        self.cache = TranslationCache(cache_path) if cache and approach != "dictionary" else None
 
         if approach == "dictionary":
 
-            # load the translation dictionary
-            with open(f'../translations.json', 'r') as file:
-                self.translation_dict = json.load(file)
+            # compile the dictionary if translations.json or the compiled dictionary changed, then map it into memory
+            if compiled_dictionary.is_outdated(dictionary_path, "../translations.json", compiled_path, min_confidence):
+                if verbose:
+                    print(f"Compiling the translation dictionary {dictionary_path}...")
+                compiled_dictionary.compile_dictionary(dictionary_path, "../translations.json", compiled_path, min_confidence)
+            self.dictionary = compiled_dictionary.CompiledDictionary(dictionary_path)
 
             # check if all languages are supported
             for language in self.languages:
-                if language not in self.translation_dict.keys():
+                if language not in self.dictionary.languages:
                     raise Exception(f'The language {language} is not supported.')
                 else:
                     if verbose:
@@ -38,100 +77,238 @@ class Translator():
 
         elif approach == "hf": # using a translation model
 
-            from transformers import pipeline
+            from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
             
             # define available models
-            self.models = {
-                "m2m100" : "facebook/m2m100_418M",
-                "nllb200" :"facebook/nllb-200-distilled-600M",
-            }
+            self.models = HF_MODELS
             
             # get model
             if hf_model not in self.models.keys():
                 raise Exception(f'The model {hf_model} is not supported.')
             else:
                 self.hf_model = self.models[hf_model]
+                self.cache_model = self.hf_model
                 
             # get language codes
-            lang_codes = json.load(open(f"../hf_lang_codes/{hf_model}.json", "r"))
-            
-            # create translation models
-            self.hf_translators = {}
+            self.lang_codes = json.load(open(f"../hf_lang_codes/{hf_model}.json", "r"))
             for language in self.languages:
-                if self.verbose:
-                    print(f"Creating translation model for {language}...")
-                self.hf_translators[language] = pipeline('translation', self.hf_model, src_lang=lang_codes["english"], tgt_lang=lang_codes[language])
+                if language not in self.lang_codes.keys():
+                    raise Exception(f'The language {language} is not supported by {self.hf_model}.')
+            
+            # create one translation model shared by all languages - the target language is chosen per call
+            if self.verbose:
+                print(f"Creating translation model {self.hf_model}...")
+            self.hf_tokenizer = AutoTokenizer.from_pretrained(self.hf_model, src_lang=self.lang_codes["english"])
+            self.hf_translator = AutoModelForSeq2SeqLM.from_pretrained(self.hf_model)
+            self.hf_translator.eval()
+            self.hf_lock = threading.Lock() # the shared model and tokenizer are used by one thread at a time
 
             # define the translation function
             self.translate = self.translate_hf
             
         elif approach == "translatepy":
-            from translatepy import Translator as translatepy_Translator
-            self.pytranslator = translatepy_Translator()
+            if pytranslator is None:
+                from translatepy import Translator as translatepy_Translator
+                pytranslator = translatepy_Translator()
+            self.pytranslator = pytranslator
+            self.cache_model = "translatepy" if type(pytranslator).__module__.startswith("translatepy") else type(pytranslator).__name__
+            self.term_translator = ConcurrentTermTranslator(self._translatepy_term, max_concurrency=max_concurrency, timeout=timeout, retries=retries)
             self.translate = self.translate_translatepy
             
         else:
             raise Exception(f'The approach {approach} is not supported. Use either "dictionary", "translatepy" or "hf".')
         
-    def translate_translatepy(self, query, language):
+    def translate_cached(self, units, language, translate_fn):
+        """
+            Translate a list of terms (or whole queries) to the given language.
+            
+            Translations found in the cache are reused and translate_fn is only called
+            with the units that are not cached yet.
+        """
+        if self.cache is None:
+            return translate_fn(units, language)
+
+        # look up the units in the cache
+        translations = [self.cache.get(unit, language, self.approach, self.cache_model) for unit in units]
+        missing = [unit for unit, translation in zip(units, translations) if translation is None]
+        instrumentation.count("translation_cache_hits", len(units) - len(missing), approach=self.approach, language=language)
+        instrumentation.count("translation_cache_misses", len(missing), approach=self.approach, language=language)
+
+        # translate the missing units and add them to the cache
+        if len(missing) > 0:
+            new_translations = dict(zip(missing, translate_fn(missing, language)))
+            for unit, translation in new_translations.items():
+                self.cache.put(unit, language, self.approach, self.cache_model, translation)
+            translations = [new_translations[unit] if translation is None else translation for unit, translation in zip(units, translations)]
+
+        return translations
+
+    def translate_translatepy(self, query, language, timeout = None):
         if language == "english":
             return query
         
-        if self.by_term:
-            query = query.split()
+        units = query.split() if self.by_term else [query]
+        return " ".join(self.translate_cached(units, language, lambda units, language: self._translatepy(units, language, timeout)))
+
+    def _translatepy(self, units, language, timeout = None):
+        if language == "english":
+            return units
+
+        # translate all units at the same time
+        translations = self.term_translator.translate_many(units, [language], timeout=timeout)
+        return [translations[(unit, language)] for unit in units]
+
+    def _translatepy_term(self, unit, language, timeout = None):
+        # translatepy has no timeout: a call which hangs is abandoned by the ConcurrentTermTranslator after the
+        # timeout, which frees its concurrency slot, and its thread ends whenever the call returns
+        if isinstance(self.pytranslator, LibreTranslate):
+            return self.pytranslator.translate(unit, destination_language=language, source_language="english", timeout=timeout).result
+        return self.pytranslator.translate(unit, destination_language=language, source_language="english").result
+
+    def translate_hf(self, query, language, timeout = None):
+        units = query.split() if self.by_term else [query]
+        return " ".join(self.translate_cached(units, language, lambda units, language: self._hf(units, language, timeout=timeout)))
+
+    def _hf(self, units, language, scored = False, timeout = None):
+        """
+            Translate the units with the hf model.
+
+            If scored is True, (translation, confidence) pairs are returned, where the confidence is the
+            geometric mean of the probabilities of the generated tokens. Scored units are translated with greedy
+            decoding, as the scores of a beam search can not be matched to the tokens without the beam indices.
+            If timeout is given, a TimeoutError is raised if the model is not free within timeout seconds.
+        """
+        import torch
+
+        # the generation can not be interrupted, but the wait for the model can
+        if not self.hf_lock.acquire(timeout=-1 if timeout is None else max(timeout, 0)):
+            raise TimeoutError(f"The translation model was busy for more than {timeout:.3f} seconds")
+        try:
+            # tokenize the units
+            inputs = self.hf_tokenizer(units, return_tensors="pt", padding=True)
+
+            # translate the units, forcing the first generated token to be the target language
+            options = {"output_scores": True, "return_dict_in_generate": True, "num_beams": 1} if scored else {}
+            with torch.no_grad():
+                outputs = self.hf_translator.generate(**inputs, forced_bos_token_id=self.hf_lang_id(language), **options)
+
+            if not scored:
+                translations = self.hf_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+                return [translation.lower() for translation in translations]
+
+            translations = self.hf_tokenizer.batch_decode(outputs.sequences, skip_special_tokens=True)
+
+            # log probabilities of the generated tokens, leaving out the forced language token and the padding
+            log_probs = self.hf_translator.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+            mask = outputs.sequences[:, 1:] != self.hf_tokenizer.pad_token_id
+            mask[:, 0] = False
+            log_probs = torch.where(mask, log_probs, torch.zeros_like(log_probs))
+            confidences = torch.exp(log_probs.sum(dim=1) / mask.sum(dim=1).clamp(min=1))
+        finally:
+            self.hf_lock.release()
+
+        return [(translation.lower(), float(confidence)) for translation, confidence in zip(translations, confidences)]
+
+    def hf_lang_id(self, language):
+        """
+            Return the id of the token marking the given target language.
+        """
+        code = self.lang_codes[language]
+        if hasattr(self.hf_tokenizer, "get_lang_id"): # m2m100
+            return self.hf_tokenizer.get_lang_id(code)
+        return self.hf_tokenizer.convert_tokens_to_ids(code) # nllb200
+
+    def translate_batch(self, queries, languages = None, batch_size = 32, bucket = True):
+        """
+            Translate several queries to several languages at once.
             
-            translation = []
-            for q in query:
-                translation += [self.pytranslator.translate(q, destination_language=language, source_language="english").result]
+            Parameters
+            ---------
+            queries:
+                A list of queries in English
+            languages:
+                The target languages, defaults to the languages of the translator
+            batch_size:
+                The number of terms (or queries) translated in one forward pass of the hf model
+            bucket:
+                If True, terms of similar length are put in the same batch to reduce padding
                 
-            return " ".join(translation)
-        else:
-            return self.pytranslator.translate(query, destination_language=language, source_language="english").result
-        
-        
-        
+            Returns a dictionary with the translations keyed by (query, language).
+        """
+        if languages is None:
+            languages = self.languages
 
-    def translate_hf(self, query, language):
-        if self.by_term:
-            query = query.split()
-        
-        # translate the query
-        translations = self.hf_translators[language](query)
-        if self.by_term:
-            return " ".join([translation["translation_text"].lower() for translation in translations])
+        # the dictionary is fast enough to translate one query at a time
+        if self.approach == "dictionary":
+            return {(query, language): self.translate(query, language) for language in languages for query in queries}
+
+        # split the queries into unique units
+        units_by_query = {query: query.split() if self.by_term else [query] for query in queries}
+        units = list(dict.fromkeys(unit for query_units in units_by_query.values() for unit in query_units))
+
+        def translate_language(language):
+            if self.approach == "hf":
+                # translate all units of the language in batches
+                translate_fn = lambda units, language: self._hf_batched(units, language, batch_size, bucket)
+            elif language == "english":
+                return {unit: unit for unit in units}
+            else:
+                translate_fn = self._translatepy
+            return dict(zip(units, self.translate_cached(units, language, translate_fn)))
+
+        # the hf model translates one batch at a time, while translatepy translates all languages concurrently
+        if self.approach == "hf":
+            translated_units = {language: translate_language(language) for language in languages}
         else:
-            return translations[0]["translation_text"].lower()
+            with ThreadPoolExecutor(max_workers=max(len(languages), 1)) as executor:
+                translated_units = dict(zip(languages, executor.map(translate_language, languages)))
+
+        # join the units into translated queries
+        translations = {}
+        for language in languages:
+            for query, query_units in units_by_query.items():
+                translations[(query, language)] = " ".join([translated_units[language][unit] for unit in query_units])
+
+        return translations
+
+    def _hf_batched(self, units, language, batch_size = 32, bucket = True, scored = False):
+        # order the units by length so the batches need little padding
+        order = sorted(range(len(units)), key=lambda i: len(units[i])) if bucket else list(range(len(units)))
 
-    def translate_dict(self, query, language):
+        # translate the batches
+        translations = [None] * len(units)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, translation in zip(batch, self._hf([units[i] for i in batch], language, scored=scored)):
+                translations[i] = translation
+
+        return translations
+
+    def translate_dict(self, query, language, timeout = None):
         """
-            Translate the query to the given language.            
+            Translate the query to the given language. The dictionary is fast, so the timeout is not used.
+
+            Phrases are translated with a greedy longest match, words without a translation are kept as they are.
         """
-            
-        # return a identity for the english language - query is in english
-        # if language == "english":
-        #     return query
-        
-        # # return the translation from the dictionary
-        # else:
-            
-        # split the query into words
-        query_words = query.split()
+        return self.dictionary.translate(query, language)
 
-        # translate the words
-        translated_words = []
+    def close(self):
+        """
+            Release the dictionary, the translation model or the translation threads, and the cache.
+        """
+        if self.approach == "dictionary":
+            self.dictionary.close()
+        elif self.approach == "hf":
+            # drop the references to the model so its memory can be freed
+            del self.hf_translator
+            del self.hf_tokenizer
+        elif self.approach == "translatepy":
+            self.term_translator.close()
 
-        # dictionary translate
-        for word in query_words:
-            if word in self.translation_dict[language].keys():
-                translated_words.append(self.translation_dict[language][word])
-            else:
-                translated_words.append(word) # keep the original word if no translation is found
+        if self.cache is not None:
+            self.cache.close()
 
-        # join the translated words into a string
-        translated_query = ' '.join(translated_words)
 
-        return translated_query
-        
 def test_translators(verbose = True, by_term = True, acc_by_term = False, hf_translator = "nllb200"):
     # define languages
     languages = ["english", "czech", "chinese", "danish"]
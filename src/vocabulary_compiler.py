@@ -0,0 +1,133 @@
+"""
+Offline compiler of the translation dictionary.
+
+A vocabulary of English ingredients is translated in batches with the hf backend and written to a versioned
+compiled dictionary, which the dictionary approach of the Translator loads next to translations.json.
+Every entry records the translation, the confidence of the model and where it came from:
+
+    {
+        "version": 3,
+        "created": "2023-11-20T12:00:00",
+        "model": "facebook/nllb-200-distilled-600M",
+        "vocabulary_sha1": "...",
+        "languages": {
+            "danish": {"chicken": {"translation": "kylling", "confidence": 1.0, "source": "manual"}, ...},
+            ...
+        }
+    }
+
+Entries of translations.json are copied with source "manual" and are never replaced by the model.
+
+Example:
+    python vocabulary_compiler.py --vocabulary ../vocabulary.txt --languages czech chinese danish
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+
+from translator import Translator
+
+LANGUAGES = ["english", "czech", "chinese", "danish"]
+
+# punctuation the model sometimes adds to single terms
+STRIP_CHARACTERS = " .,;:!?。，"
+
+
+def load_vocabulary(paths, manual_path = "../translations.json", queries_path = "../test_queries.txt"):
+    """
+    Returns the sorted English vocabulary of the given files, which have one term per line.
+
+    The terms of translations.json and the test queries are always included.
+    """
+    vocabulary = set()
+
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            vocabulary.update(" ".join(line.lower().split()) for line in file)
+
+    if os.path.exists(manual_path):
+        with open(manual_path, 'r', encoding='utf-8') as file:
+            vocabulary.update(json.load(file).get("english", {}).keys())
+
+    if os.path.exists(queries_path):
+        with open(queries_path, 'r', encoding='utf-8') as file:
+            vocabulary.update(term for line in file for term in line.lower().split())
+
+    vocabulary.discard("")
+    return sorted(vocabulary)
+
+
+def compile_vocabulary(vocabulary, languages = LANGUAGES, hf_model = "nllb200", batch_size = 64,
+                       output_path = "../translations_compiled.json", manual_path = "../translations.json", verbose = True):
+    """
+    Translates the vocabulary into the languages and writes the compiled dictionary to output_path.
+    """
+    with open(manual_path, 'r', encoding='utf-8') as file:
+        manual = json.load(file)
+
+    # the version is increased every time the dictionary is compiled
+    version = 1
+    if os.path.exists(output_path):
+        with open(output_path, 'r', encoding='utf-8') as file:
+            version = json.load(file).get("version", 0) + 1
+
+    translator = Translator(languages, approach="hf", hf_model=hf_model, cache=False, verbose=verbose)
+
+    compiled = {}
+    for language in languages:
+        t0 = time.time()
+        entries = {}
+
+        # manual translations are kept as they are
+        for term, translation in manual.get(language, {}).items():
+            entries[term] = {"translation": translation, "confidence": 1.0, "source": "manual"}
+
+        missing = [term for term in vocabulary if term not in entries]
+        if language == "english":
+            for term in missing:
+                entries[term] = {"translation": term, "confidence": 1.0, "source": "identity"}
+        else:
+            # translate the missing terms in batches of similar length
+            translations = translator._hf_batched(missing, language, batch_size=batch_size, bucket=True, scored=True)
+            for term, (translation, confidence) in zip(missing, translations):
+                translation = translation.strip(STRIP_CHARACTERS)
+                if translation != "":
+                    entries[term] = {"translation": translation, "confidence": round(confidence, 4), "source": translator.hf_model}
+
+        compiled[language] = dict(sorted(entries.items()))
+
+        if verbose:
+            print(f"Compiled {len(entries)} {language} terms ({len(missing)} translated) in {time.time() - t0:.1f} seconds")
+
+    vocabulary_hash = hashlib.sha1("\n".join(vocabulary).encode("utf-8")).hexdigest()
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            "version": version,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "model": translator.hf_model,
+            "vocabulary_sha1": vocabulary_hash,
+            "num_terms": len(vocabulary),
+            "languages": compiled,
+        }, file, indent=4, ensure_ascii=False)
+
+    if verbose:
+        print(f"Wrote version {version} of the compiled dictionary to {output_path}")
+
+    return compiled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a translation dictionary with the hf translation model")
+    parser.add_argument("--vocabulary", nargs="*", default=[], help="Files with one English term per line.")
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES)
+    parser.add_argument("--model", type=str, default="nllb200", choices=["nllb200", "m2m100"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", type=str, default="../translations_compiled.json")
+    args = parser.parse_args()
+
+    vocabulary = load_vocabulary(args.vocabulary)
+    compile_vocabulary(vocabulary, languages=args.languages, hf_model=args.model, batch_size=args.batch_size, output_path=args.output)
@@ -0,0 +1,99 @@
+"""
+Tests of an interrupted and resumed bulk crawl against a local stand-in search engine.
+"""
+
+import collections
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import bulk_crawl
+from bulk_crawl import CrawlJournal
+
+RECIPES = ["soup1", "stew2", "salad3", "curry4"]
+
+
+class Crash(BaseException):
+    # like a killed process, it is not handled by the crawl
+    pass
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests[self.path.split("?")[0]] += 1
+        port = self.server.server_address[1]
+
+        if self.path.startswith("/search"):
+            html = "".join(f'<a href="http://127.0.0.1:{port}/recipe/{name}"><h3>{name}</h3></a>' for name in RECIPES)
+        else:
+            html = self.path
+        body = f"<html><body>{html}</body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.requests = collections.Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(server):
+    port = server.server_address[1]
+    # revalidate every page on disk, so only the journal can save requests
+    return bulk_crawl.bulk_crawl(["egg"], ["english"], use_async=True,
+                                 fetcher_options={"search_url": f"http://127.0.0.1:{port}/search?q={{query}}", "refresh_after": 0},
+                                 async_options={"max_concurrency": 1, "rate_per_host": 1000, "burst": 100, "retries": 0, "timeout": 5})
+
+
+def test_resume_interrupted_crawl(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("translations.json", "w", encoding="utf-8") as file:
+        json.dump({"english": {"recipe": "recipe", "egg": "egg"}}, file)
+
+    # the crawl dies after journaling its second page
+    write = CrawlJournal.write
+    pages = []
+
+    def write_and_crash(self, event, **fields):
+        write(self, event, **fields)
+        if event == "page":
+            pages.append(fields["key"])
+            if len(pages) == 2:
+                raise Crash()
+
+    monkeypatch.setattr(CrawlJournal, "write", write_and_crash)
+    with pytest.raises(Crash):
+        crawl(server)
+    assert server.requests["/search"] == 1
+    assert ("egg", "english") not in CrawlJournal().completed()
+    assert CrawlJournal().interrupted() == {("egg", "english"): set(pages)}
+
+    # the restarted crawl only downloads the pages which were not journaled (a page which was in flight
+    # when the crawl died is downloaded again)
+    monkeypatch.setattr(CrawlJournal, "write", write)
+    before = server.requests.copy()
+    crawl(server)
+    assert server.requests["/search"] == 1
+    assert all(server.requests[f"/recipe/{name}"] == before[f"/recipe/{name}"] for name in pages)
+    assert all(server.requests[f"/recipe/{name}"] == before[f"/recipe/{name}"] + 1 for name in RECIPES if name not in pages)
+    assert ("egg", "english") in CrawlJournal().completed()
+
+    # a completed query is not crawled again
+    before = server.requests.copy()
+    crawl(server)
+    assert server.requests == before
@@ -0,0 +1,87 @@
+"""
+Tests of the binary search and the longest match translation of compiled_dictionary.py.
+"""
+
+import json
+
+import pytest
+
+from compiled_dictionary import CompiledDictionary, compile_dictionary, is_outdated
+
+MANUAL = {
+    "danish": {
+        "apple": "æble",
+        "soy": "soja",
+        "soy sauce": "sojasovs",
+        "red wine vinegar": "rødvinseddike",
+        "zucchini": "squash",
+    },
+}
+
+COMPILED = {
+    "languages": {
+        "danish": {
+            "apple": {"translation": "wrong", "confidence": 0.9},
+            "garlic": {"translation": "hvidløg", "confidence": 0.8},
+            "onion": {"translation": "løg", "confidence": 0.2},
+        },
+        "czech": {},
+    },
+}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    manual_path = tmp_path / "translations.json"
+    manual_path.write_text(json.dumps(MANUAL), encoding="utf-8")
+    compiled_path = tmp_path / "translations_compiled.json"
+    compiled_path.write_text(json.dumps(COMPILED), encoding="utf-8")
+    return str(tmp_path / "translations.bin"), str(manual_path), str(compiled_path)
+
+@pytest.fixture
+def dictionary(paths):
+    output_path, manual_path, compiled_path = paths
+    compile_dictionary(output_path, manual_path, compiled_path, min_confidence=0.5)
+    dictionary = CompiledDictionary(output_path)
+    yield dictionary
+    dictionary.close()
+
+
+def test_lookup_at_the_boundaries(dictionary):
+    # the first and the last of the sorted terms
+    assert dictionary.lookup("apple", "danish") == "æble"
+    assert dictionary.lookup("zucchini", "danish") == "squash"
+    # terms sorting before the first and after the last
+    assert dictionary.lookup("aaa", "danish") is None
+    assert dictionary.lookup("zzz", "danish") is None
+    assert dictionary.lookup("", "danish") is None
+
+def test_manual_entries_and_min_confidence(dictionary):
+    assert dictionary.lookup("garlic", "danish") == "hvidløg"
+    assert dictionary.lookup("onion", "danish") is None
+
+def test_language_without_entries(dictionary):
+    assert sorted(dictionary.languages) == ["czech", "danish"]
+    assert dictionary.lookup("apple", "czech") is None
+    assert dictionary.translate("Apple pie", "czech") == "Apple pie"
+
+def test_longest_match(dictionary):
+    assert dictionary.translate("soy sauce", "danish") == "sojasovs"
+    assert dictionary.translate("red wine vinegar and soy", "danish") == "rødvinseddike and soja"
+
+def test_shorter_prefix(dictionary):
+    # "soy beans" is not in the dictionary, so "soy" is matched on its own
+    assert dictionary.translate("soy beans", "danish") == "soja beans"
+    # "red wine" is only the prefix of a phrase, so nothing is translated
+    assert dictionary.translate("red wine", "danish") == "red wine"
+
+def test_hyphens_and_case(dictionary):
+    assert dictionary.translate("Soy-Sauce", "danish") == "sojasovs"
+    assert dictionary.translate("Garlic Bread", "danish") == "hvidløg Bread"
+
+def test_is_outdated(paths):
+    output_path, manual_path, compiled_path = paths
+    assert is_outdated(output_path, manual_path, compiled_path)
+    compile_dictionary(output_path, manual_path, compiled_path, min_confidence=0.5)
+    assert not is_outdated(output_path, manual_path, compiled_path, min_confidence=0.5)
+    assert is_outdated(output_path, manual_path, compiled_path, min_confidence=0.7)
@@ -0,0 +1,107 @@
+"""
+Tests of the normalizations and of the (early terminating) merge of merging.py.
+"""
+
+import math
+from collections import namedtuple
+
+import pytest
+
+from merging import merge, merge_early, normalize, RRF_K
+
+Hit = namedtuple("Hit", ["docid", "score"])
+
+
+def hits(prefix, scores):
+    return [Hit(f"{prefix}{i}", score) for i, score in enumerate(scores)]
+
+
+def test_zscore_with_zero_variance():
+    assert normalize(hits("a", [3.0, 3.0, 3.0]), "zscore") == [0.0, 0.0, 0.0]
+    assert normalize(hits("a", [5.0]), "zscore") == [0.0]
+
+def test_zscore_and_minmax():
+    zscores = normalize(hits("a", [3.0, 1.0]), "zscore")
+    assert zscores == pytest.approx([1.0, -1.0])
+    assert normalize(hits("a", [4.0, 2.0, 0.0]), "minmax") == [1.0, 0.5, 0.0]
+    assert normalize(hits("a", [2.0, 2.0]), "minmax") == [1.0, 1.0]
+
+def test_empty_hits():
+    for normalization in ["raw", "minmax", "zscore", "rrf"]:
+        assert normalize([], normalization) == []
+
+def test_unknown_normalization():
+    with pytest.raises(ValueError):
+        normalize(hits("a", [1.0]), "softmax")
+
+
+def test_rrf_ties_follow_the_order_of_the_languages():
+    # the scores are ignored, only the ranks count
+    merged = merge([hits("a", [9.0, 8.0]), hits("b", [1.0, 0.5])], ["english", "danish"], k=4, normalization="rrf")
+
+    assert [hit.docid for hit in merged] == ["a0", "b0", "a1", "b1"]
+    assert [hit.score for hit in merged] == [1 / (RRF_K + 1), 1 / (RRF_K + 1), 1 / (RRF_K + 2), 1 / (RRF_K + 2)]
+    assert [hit.rank for hit in merged] == [1, 1, 2, 2]
+    assert merged[1].raw_score == 1.0
+
+def test_merge_keeps_the_top_k():
+    merged = merge([hits("a", [5.0, 1.0]), hits("b", [3.0, 2.0]), []], ["english", "danish", "czech"], k=3)
+    assert [hit.docid for hit in merged] == ["a0", "b0", "b1"]
+
+
+class Index:
+    """
+    Fake per-language search, which records the number of hits asked of each language.
+    """
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+
+    def fetch(self, language, n):
+        self.requests.append((language, n))
+        return self.results[language][:n]
+
+
+@pytest.mark.parametrize("normalization", ["raw", "rrf"])
+def test_merge_early_equals_merge(normalization):
+    results = {"english": hits("a", [10, 9, 8, 7, 6, 5, 4, 3]), "danish": hits("b", [2.5, 2, 1.5]), "czech": hits("c", [9.5, 0.1])}
+    languages = list(results)
+    k = 8
+    index = Index(results)
+
+    first = [index.fetch(language, 2) for language in languages]
+    merged, fetched = merge_early(first, languages, index.fetch, 2, k=k, normalization=normalization)
+
+    assert merged == merge([results[language] for language in languages], languages, k=k, normalization=normalization)
+    assert fetched["english"] == results["english"][:len(fetched["english"])]
+
+def test_merge_early_stops_fetching():
+    results = {"english": hits("a", [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]), "danish": hits("b", [0.5])}
+    index = Index(results)
+    languages = list(results)
+
+    first = [index.fetch(language, 1) for language in languages]
+    index.requests = []
+    merged, _ = merge_early(first, languages, index.fetch, 1, k=5)
+
+    # english doubles 1 -> 2 -> 4 -> 5 (capped at k), danish has no more hits than it returned
+    assert [hit.docid for hit in merged] == ["a0", "a1", "a2", "a3", "a4"]
+    assert index.requests == [("english", 2), ("english", 4), ("english", 5)]
+
+def test_merge_early_stops_when_a_language_runs_out():
+    results = {"english": hits("a", [10, 9, 8]), "danish": []}
+    index = Index(results)
+    languages = list(results)
+
+    first = [index.fetch(language, 2) for language in languages]
+    index.requests = []
+    merged, fetched = merge_early(first, languages, index.fetch, 2, k=10)
+
+    # english returns 3 hits when asked for 4, so it is not asked again, and danish is never asked
+    assert [hit.docid for hit in merged] == ["a0", "a1", "a2"]
+    assert index.requests == [("english", 4)]
+    assert fetched["danish"] == []
+
+def test_merge_early_requires_a_rank_based_normalization():
+    with pytest.raises(ValueError):
+        merge_early([[]], ["english"], lambda language, n: [], 1, normalization="zscore")
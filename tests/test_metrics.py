@@ -0,0 +1,42 @@
+"""
+Tests of the recall of metrics.py with the number of relevant documents from the judgments.
+"""
+
+import numpy as np
+
+import metrics
+from qrels import Qrels
+
+
+def create_qrels():
+    # three relevant documents for "egg", two of them danish, and one irrelevant document
+    rankings = {
+        "english": {"egg": {"Omelette": {"ranking_manual": 2}, "Cake": {"ranking_manual": 0}}},
+        "danish": {"egg": {"Aeggekage": {"ranking_manual": 1}, "Roeraeg": {"ranking_manual": 3}},
+                   "onion": {"Loegsuppe": {"ranking_manual": 0}}},
+    }
+    return Qrels(rankings)
+
+
+def test_num_relevant():
+    qrels = create_qrels()
+    assert qrels.num_relevant("egg") == 3
+    assert qrels.num_relevant("egg", language="danish") == 2
+    assert qrels.num_relevant("onion") == 0
+    assert qrels.num_relevant("unknown") == 0
+
+
+def test_recall_uses_the_judgments():
+    qrels = create_qrels()
+    queries = ["egg", "onion"]
+
+    # "egg" retrieves one of its three relevant documents, "onion" has no relevant documents
+    relevance = metrics.relevance_matrix([[qrels.grade("egg", docid) for docid in ["Omelette", "Cake", "Unjudged"]],
+                                          [qrels.grade("onion", docid) for docid in ["Loegsuppe"]]], depth=3)
+    recall = metrics.recall(relevance, num_relevant=[qrels.num_relevant(query) for query in queries])
+
+    np.testing.assert_allclose(recall[0], [1 / 3, 1 / 3, 1 / 3])
+    assert np.isnan(recall[1]).all()
+
+    # without the judgments, the recall of the first query would be 1
+    assert metrics.recall(relevance)[0, -1] == 1
@@ -0,0 +1,91 @@
+"""
+Tests of the async mode of the RecipeFetcher against a local stand-in search engine.
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from async_fetcher import AsyncFetcher
+from recipe_fetcher import RecipeFetcher
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        port = self.server.server_address[1]
+
+        if self.path.startswith("/search"):
+            if "fail" in self.path:
+                # drop the connection without a response
+                self.close_connection = True
+                return
+            links = "".join(f'<a href="http://127.0.0.1:{port}/recipe/{name}"><h3>{name}</h3></a>' for name in ["soup1", "stew2", "broken3"])
+            self.send_page(f"<html><body>{links}</body></html>")
+        elif self.path == "/recipe/broken3":
+            self.close_connection = True
+        else:
+            self.send_page(f"<html><body>{self.path}</body></html>")
+
+    def send_page(self, html):
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def fetcher(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("translations.json", "w", encoding="utf-8") as file:
+        json.dump({"english": {"recipe": "recipe", "egg": "egg", "fail": "fail", "rice": "rice"}}, file)
+
+    port = server.server_address[1]
+    return RecipeFetcher("english", search_url=f"http://127.0.0.1:{port}/search?q={{query}}", interactive=False,
+                         async_options={"rate_per_host": 1000, "burst": 100, "retries": 0, "backoff": 0.01, "timeout": 5})
+
+
+def test_failed_page_does_not_abort_query(fetcher):
+    results = fetcher.fetch_all_async([["egg"]])
+
+    metadata = results[0]
+    assert metadata["soup1"]["downloaded"] and metadata["stew2"]["downloaded"]
+    assert not metadata["broken3"]["downloaded"]
+    assert "error" in metadata["broken3"]
+    assert "error" not in metadata["soup1"]
+
+def test_failed_query_does_not_abort_others(fetcher):
+    results = fetcher.fetch_all_async([["fail"], ["rice"]])
+
+    assert isinstance(results[0], Exception)
+    assert results[1]["soup1"]["downloaded"]
+
+def test_shared_fetcher_in_several_runs(server):
+    # one request in flight and a burst of one, so the semaphore and the lock of the bucket are waited on
+    shared = AsyncFetcher(max_concurrency=1, rate_per_host=1000, burst=1, retries=0, backoff=0.01, timeout=5)
+    port = server.server_address[1]
+    urls = [f"http://127.0.0.1:{port}/recipe/soup{i}" for i in range(3)]
+    try:
+        # every asyncio.run has its own event loop, like two fetch_all_async calls of a RecipeFetcher
+        for _ in range(2):
+            responses = asyncio.run(shared.get_all(urls))
+            assert [response.status_code for response in responses] == [200, 200, 200]
+    finally:
+        shared.close()
@@ -0,0 +1,85 @@
+"""
+Tests of the eviction of the ResourceManager with fake resources of known cost.
+"""
+
+import pytest
+
+from resource_manager import ResourceManager, psutil
+
+MB = 2 ** 20
+
+pytestmark = pytest.mark.skipif(psutil is None, reason="a memory budget requires psutil")
+
+
+def create_manager(budget_mb, names, cost_mb = 40):
+    resources = ResourceManager(memory_budget=budget_mb)
+    unloaded = []
+    for name in names:
+        resources.register(name, lambda name=name: f"value of {name}", lambda value: unloaded.append(value), cost=cost_mb * MB)
+    return resources, unloaded
+
+
+def loaded(resources):
+    return sorted(name for name in resources.resources if resources.is_loaded(name))
+
+
+def test_evicts_the_least_recently_used():
+    resources, unloaded = create_manager(100, ["a", "b", "c"])
+
+    with resources.use("a"):
+        pass
+    with resources.use("b"):
+        pass
+    with resources.use("a"):
+        pass
+
+    # "b" is the least recently used, so it makes room for "c"
+    with resources.use("c") as value:
+        assert value == "value of c"
+    assert loaded(resources) == ["a", "c"]
+    assert unloaded == ["value of b"]
+    assert resources.stats()["over_budget"] == 0
+
+
+def test_does_not_evict_resources_in_use():
+    resources, unloaded = create_manager(100, ["a", "b", "c"])
+
+    with resources.use("a"):
+        with resources.use("b"):
+            pass
+        # "a" is the least recently used, but it is in use, so "b" is evicted instead
+        with resources.use("c"):
+            assert loaded(resources) == ["a", "c"]
+            assert not resources.evict("a")
+            assert not resources.evict("c")
+    assert unloaded == ["value of b"]
+
+
+def test_keeps_the_cost_of_evicted_resources():
+    resources, _ = create_manager(100, ["a", "b"])
+
+    with resources.use("a"):
+        pass
+    assert resources.evict("a")
+    assert resources.resources["a"].cost == 40 * MB
+    assert resources.loaded_bytes() == 0
+
+
+def test_working_set_over_budget_is_kept():
+    resources, unloaded = create_manager(100, ["a", "b", "c"])
+
+    # the three resources of one query do not fit, they are kept instead of evicting each other
+    with resources.working_set():
+        for _ in range(3):
+            for name in ["a", "b", "c"]:
+                with resources.use(name):
+                    pass
+        assert loaded(resources) == ["a", "b", "c"]
+    assert unloaded == []
+    assert resources.stats()["loads"] == 3
+    assert resources.stats()["over_budget"] > 0
+
+    # after the query, the least recently used resource is evicted again
+    resources.enforce_budget()
+    assert loaded(resources) == ["b", "c"]
+    assert unloaded == ["value of a"]
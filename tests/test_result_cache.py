@@ -0,0 +1,35 @@
+"""
+Tests of the keys of the result cache.
+"""
+
+from types import SimpleNamespace
+
+from cross_language_retriever import CrossLanguageRetriever
+from result_cache import ResultCache, normalize_query
+
+
+def cache_key(query, k = 10):
+    # the options of a retriever, without loading it
+    retriever = SimpleNamespace(fields=None, translation_approach="dictionary", languages=["english", "danish"],
+                                engine="numpy", normalization="raw", early_termination=False)
+    return CrossLanguageRetriever.cache_key(retriever, query, k)
+
+
+def test_normalize_query_keeps_order_and_repetitions():
+    assert normalize_query("  Soy   SAUCE chicken ") == "soy sauce chicken"
+    assert normalize_query("soy sauce chicken") != normalize_query("chicken sauce soy")
+    assert normalize_query("chicken") != normalize_query("chicken chicken")
+
+
+def test_permuted_queries_get_different_keys():
+    assert cache_key("soy sauce chicken") != cache_key("chicken sauce soy")
+    assert cache_key("chicken") != cache_key("chicken chicken")
+    assert cache_key("Soy Sauce  chicken") == cache_key("soy sauce chicken")
+    assert cache_key("soy sauce chicken", k=5) != cache_key("soy sauce chicken", k=10)
+
+
+def test_permuted_queries_do_not_share_results():
+    cache = ResultCache([], ttl=None)
+    cache.put(cache_key("soy sauce chicken"), ("first",))
+    assert cache.get(cache_key("chicken sauce soy")) is None
+    assert cache.get(cache_key("soy sauce chicken")) == ("first",)
@@ -0,0 +1,95 @@
+"""
+Tests of the ConcurrentTermTranslator with fake translation functions.
+"""
+
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from term_translation import ConcurrentTermTranslator
+
+
+def test_coalesced_caller_keeps_its_own_deadline():
+    release = threading.Event()
+    calls = []
+
+    def translate(term, language, timeout):
+        calls.append(timeout)
+        release.wait(1)
+        return term.upper()
+
+    translator = ConcurrentTermTranslator(translate, timeout=5, retries=0)
+    try:
+        # the first caller gives up after 0.1 seconds, the second waits without a timeout
+        errors = []
+
+        def translate_short():
+            try:
+                translator.translate_many(["egg"], ["danish"], timeout=0.1)
+            except TimeoutError as e:
+                errors.append(e)
+
+        short = threading.Thread(target=translate_short)
+        short.start()
+        time.sleep(0.02)
+        result = {}
+        patient = threading.Thread(target=lambda: result.update(translator.translate_many(["egg"], ["danish"])))
+        patient.start()
+        short.join()
+        release.set()
+        patient.join()
+
+        assert len(errors) == 1
+        assert result == {("egg", "danish"): "EGG"}
+        # the patient caller could not share the call with the shorter deadline
+        assert len(calls) == 2
+    finally:
+        translator.close()
+
+
+def test_callers_with_later_deadlines_share_the_call():
+    release = threading.Event()
+    calls = []
+
+    def translate(term, language, timeout):
+        calls.append(timeout)
+        release.wait(1)
+        return term.upper()
+
+    translator = ConcurrentTermTranslator(translate, timeout=5, retries=0)
+    try:
+        first = translator.submit("egg", "danish")
+        second = translator.submit("egg", "danish", deadline=time.monotonic() + 1)
+        assert first is second
+        release.set()
+        assert second.result(timeout=1) == "EGG"
+        assert translator.stats()["coalesced"] == 1
+        assert len(calls) == 1
+    finally:
+        translator.close()
+
+
+def test_hung_calls_free_their_slots():
+    hang = threading.Event()
+
+    def translate(term, language, timeout):
+        # like translatepy, the "stuck" terms ignore the timeout
+        if term.startswith("stuck"):
+            hang.wait(5)
+        return term.upper()
+
+    translator = ConcurrentTermTranslator(translate, max_concurrency=2, timeout=0.1, retries=0)
+    try:
+        stuck = [translator.submit(f"stuck{i}", "danish") for i in range(2)]
+        for future in stuck:
+            with pytest.raises(TimeoutError):
+                future.result(timeout=1)
+
+        # both slots were taken by hung calls, which gave them up after their timeout
+        assert translator.translate_many(["egg"], ["danish"], timeout=1) == {("egg", "danish"): "EGG"}
+        assert translator.stats()["timeouts"] == 2
+    finally:
+        hang.set()
+        translator.close()